@@ -1,9 +1,10 @@
-from tree_sitter import Language, Parser
 from typing import List, Dict, Any, Set, Optional
 
 class TestParser():
 	
 	def __init__(self, grammar_file, language):
+		# tree_sitter is imported here so that importing this module does not load it
+		from tree_sitter import Language, Parser
 		JAVA_LANGUAGE = Language(grammar_file, language)
 		self.parser = Parser()
 		self.parser.set_language(JAVA_LANGUAGE)
@@ -53,6 +54,50 @@ class TestParser():
 
 
 
+	def parse_file_lean(self, file):
+		"""
+		Signature-only variant of parse_file, used by the lean mode of find_map_test_cases.
+		Only method headers, the @Test flag and (for test cases) invocation names are extracted;
+		bodies, fields and class metadata are skipped, and text is sliced from the source bytes.
+		"""
+
+		#Build Tree
+		content = TestParser.read_source(file)
+		if content is None:
+			return list()
+		tree = self.parser.parse(content)
+		classes = (node for node in tree.root_node.children if node.type == 'class_declaration')
+
+		#Parsed Classes
+		parsed_classes = list()
+		for _class in classes:
+			class_identifier = TestParser.text_of([child for child in _class.children if child.type == 'identifier'][0], content).strip()
+			methods = list()
+			for child in (child for child in _class.children if child.type == 'class_body'):
+				for node in child.children:
+					if node.type == 'method_declaration' or node.type == 'constructor_declaration':
+						methods.append(TestParser.get_function_header(class_identifier, node, content))
+			parsed_classes.append({'identifier': class_identifier, 'methods': methods})
+
+		return parsed_classes
+
+
+	@staticmethod
+	def read_source(file):
+		"""
+		Reads a source file as utf-8 bytes with line endings normalized to '\n',
+		the same text parse_file sees through text-mode reading. Returns None if unreadable.
+		"""
+		try:
+			with open(file, 'rb') as content_file:
+				content = content_file.read()
+			content.decode('utf-8')
+		except (OSError, UnicodeDecodeError):
+			return None
+		return content.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+
 	@staticmethod
 	def get_class_metadata(class_node, blob: str):
 		"""
@@ -210,6 +255,50 @@ class TestParser():
 		return metadata
 
 
+	@staticmethod
+	def get_function_header(class_identifier, function_node, blob: bytes, invocations=None):
+		"""
+		Extract the method header fields used for test -> focal mapping
+		(identifier, signature, testcase, invocations); same values as get_function_metadata.
+		invocations: True/False to always/never collect invocation names; by default only for test cases
+		"""
+		metadata = {
+			'identifier': '',
+			'parameters': '',
+			'return' : '',
+			'class': class_identifier,
+			'signature': '',
+			'testcase': False,
+			'constructor': "constructor" in function_node.type,
+			'invocations': [],
+		}
+
+		parameters = []
+		for child in function_node.children:
+			if child.type == 'identifier':
+				metadata['identifier'] = TestParser.text_of(child, blob).strip('(')
+			elif child.type == 'formal_parameters':
+				parameters.append(TestParser.text_of(child, blob))
+			elif child.type == 'modifiers' and '@Test' in TestParser.text_of(child, blob):
+				metadata['testcase'] = True
+			if "type" in child.type:
+				metadata['return'] = TestParser.text_of(child, blob)
+		metadata['parameters'] = ' '.join(parameters)
+
+		#Method Invocations (only needed to map test cases, unless requested)
+		if metadata['testcase'] if invocations is None else invocations:
+			kind = '{}_invocation'.format(function_node.type.split('_')[0])
+			stack = [function_node]
+			while stack:
+				node = stack.pop()
+				if node.type == kind:
+					metadata['invocations'].append(TestParser.text_of(node.child_by_field_name('name'), blob))
+				stack.extend(reversed(node.children))
+
+		metadata['signature'] = '{} {}{}'.format(metadata['return'], metadata['identifier'], metadata['parameters'])
+		return metadata
+
+
 	def get_method_names(self, file):
 		"""
 		Extract the list of method names defined in a file
@@ -268,6 +357,14 @@ class TestParser():
 			return lines[line_start][char_start:char_end]
 
 
+	@staticmethod
+	def text_of(node, blob: bytes) -> str:
+		"""
+		Source text of a node, sliced by byte offsets from the encoded file
+		"""
+		return blob[node.start_byte:node.end_byte].decode('utf-8', errors='ignore')
+
+
 	@staticmethod
 	def traverse_type(node, results: List, kind: str) -> None:
 		"""
@@ -0,0 +1,335 @@
+"""
+流水线热点的基准测试。
+
+在临时目录中用 synthetic_repo.py 生成合成仓库（无需网络），对以下函数计时：
+process_diff_output、extract_method_ranges、get_modified_methods（lines / hash 两种模式）、extract_functions、
+TestParser.parse_file、find_map_test_cases（完整 / lean 两种模式）以及完整的 main_process。
+
+每个用例先跑一次冷启动（cold：新生成的仓库、首次调用），再重复若干次取中位数（warm）。
+结果写入 JSON 报告，可用 compare 子命令对比两次运行：
+    python benchmark.py run --output bench.json
+    python benchmark.py compare old.json new.json
+ranges 子命令对比 extract_method_ranges 与旧的正则实现 extract_method_ranges_regex 的输出和耗时：
+    python benchmark.py ranges ../repo/some-repo     # 不给路径时使用新生成的合成仓库
+imports 子命令在新的解释器中计时导入各模块（不含解释器启动），并检查导入时没有加载 tree_sitter、requests 等重依赖、
+没有在当前目录写文件；超过 --budget_ms 或有副作用时返回非 0：
+    python benchmark.py imports
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess
+
+import synthetic_repo as sr
+from git_util import git
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAMMAR_PATH = os.path.join(SCRIPT_DIR, 'build', 'my-languages.so')
+# 导入时不应加载的重依赖：在第一次解析 Java、发请求或启动桩服务器时才导入
+HEAVY_MODULES = ('tree_sitter', 'requests', 'tqdm', 'http.server', 'multiprocessing')
+NOT_LIBRARY = ('benchmark', 'tempCodeRunnerFile')
+IMPORT_PROBE = '''
+import sys, json, time
+sys.path.insert(0, {script_dir!r})
+start = time.perf_counter()
+for name in {names!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def _time_call(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def measure(name, func, repeat):
+    """运行一次冷启动和 repeat 次热运行，返回计时结果；依赖缺失等异常记录在 error 中"""
+    try:
+        cold = _time_call(func)
+        warm = [_time_call(func) for _ in range(repeat)]
+    except Exception as e:
+        print(f"{name}: skipped ({type(e).__name__}: {e})")
+        return {'name': name, 'error': f'{type(e).__name__}: {e}'}
+    result = {
+        'name': name,
+        'cold': cold,
+        'warm_median': statistics.median(warm) if warm else None,
+        'warm_min': min(warm) if warm else None,
+        'repeat': repeat,
+    }
+    print(f"{name}: cold {cold * 1000:.2f}ms, warm {result['warm_median'] * 1000 if warm else 0:.2f}ms")
+    return result
+
+
+def build_cases(repo_path, commits, output_dir):
+    """构造 (名称, 可调用对象) 列表；被测模块在调用时才导入，缺少依赖只跳过对应用例"""
+    commit = commits[-1]
+    changed = sr.git(repo_path, 'diff', '--name-only', f'{commit}^..{commit}').split()
+    java_file = next(f for f in changed if f.endswith('.java'))
+    diff_output = sr.git(repo_path, 'diff', f'{commit}^..{commit}')
+    content = sr.git(repo_path, 'show', f'{commit}:{java_file}')
+    test_files = [os.path.join(d, f) for d, _, fs in os.walk(os.path.join(repo_path, 'src', 'test')) for f in fs]
+
+    def process_diff_output():
+        import data_processing as dp
+        dp.process_diff_output('synthetic', diff_output)
+
+    def extract_method_ranges():
+        import extract as ex
+        ex.extract_method_ranges(content)
+
+    def get_modified_methods():
+        import extract as ex
+        ex.get_modified_methods(commit, java_file, repo_path)
+
+    def hash_modified_methods():
+        import extract as ex
+        ex.get_modified_methods(commit, java_file, repo_path, mode='hash')
+
+    def extract_functions():
+        import data_processing_getfunc as dpg
+        dpg.extract_functions(content)
+
+    def parse_file():
+        from TestParser import TestParser
+        TestParser(GRAMMAR_PATH, 'java').parse_file(test_files[0])
+
+    def parse_file_lean():
+        from TestParser import TestParser
+        TestParser(GRAMMAR_PATH, 'java').parse_file_lean(test_files[0])
+
+    def find_map():
+        import find_map_test_cases as fmt
+        repo = {'url': repo_path, 'repo_name': 'synthetic'}
+        fmt.find_map_test_cases(repo_path, GRAMMAR_PATH, 'java', output_dir, repo)
+
+    def find_map_lean():
+        import find_map_test_cases as fmt
+        repo = {'url': repo_path, 'repo_name': 'synthetic'}
+        fmt.find_map_test_cases(repo_path, GRAMMAR_PATH, 'java', output_dir, repo, lean=True)
+
+    def full_main_process():
+        import data_processing_getfunc as dpg
+        for c in commits:
+            for _ in dpg.main_process(c, repo_path, 0, None):
+                pass
+
+    return [
+        ('process_diff_output', process_diff_output),
+        ('extract_method_ranges', extract_method_ranges),
+        ('get_modified_methods', get_modified_methods),
+        ('hash_modified_methods', hash_modified_methods),
+        ('extract_functions', extract_functions),
+        ('TestParser.parse_file', parse_file),
+        ('TestParser.parse_file_lean', parse_file_lean),
+        ('find_map_test_cases', find_map),
+        ('find_map_test_cases_lean', find_map_lean),
+        ('main_process', full_main_process),
+    ]
+
+
+def run(args):
+    output_path = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix='vdetect-bench-')
+    repo_path = os.path.join(workdir, 'synthetic')
+    output_dir = os.path.join(workdir, 'output')
+    os.makedirs(output_dir)
+    config = {
+        'file_count': args.files,
+        'method_count': args.methods,
+        'body_lines': args.body_lines,
+        'test_ratio': args.test_ratio,
+        'commit_count': args.commits,
+        'seed': args.seed,
+    }
+    try:
+        start = time.perf_counter()
+        commits = sr.generate_repo(repo_path, **config)
+        print(f"Generated synthetic repo with {len(commits)} commits in {time.perf_counter() - start:.2f}s")
+        results = [measure(name, func, args.repeat) for name, func in build_cases(repo_path, commits, output_dir)
+                   if not args.only or name in args.only]
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'git': git(SCRIPT_DIR, '--version').stdout.strip(),
+        'config': config,
+        'results': results,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"Benchmark report has been written to {output_path}")
+
+
+def compare(args):
+    """对比两份报告的 warm 中位数和 cold 时间"""
+    with open(args.base, 'r', encoding='utf-8') as f:
+        base = {r['name']: r for r in json.load(f)['results']}
+    with open(args.new, 'r', encoding='utf-8') as f:
+        new = {r['name']: r for r in json.load(f)['results']}
+
+    print(f"{'case':<24}{'cold(base)':>12}{'cold(new)':>12}{'warm(base)':>12}{'warm(new)':>12}{'speedup':>10}")
+    for name in base:
+        if name not in new or 'error' in base[name] or 'error' in new[name]:
+            print(f"{name:<24}{'n/a':>12}")
+            continue
+        b, n = base[name], new[name]
+        speedup = b['warm_median'] / n['warm_median'] if n['warm_median'] else float('inf')
+        print(f"{name:<24}{b['cold'] * 1000:>10.2f}ms{n['cold'] * 1000:>10.2f}ms"
+              f"{b['warm_median'] * 1000:>10.2f}ms{n['warm_median'] * 1000:>10.2f}ms{speedup:>9.2f}x")
+
+
+def java_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+        for dirpath, _, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                if filename.endswith('.java'):
+                    yield os.path.join(dirpath, filename)
+
+
+def compare_ranges(args):
+    """逐个 .java 文件对比两种 extract_method_ranges 实现，打印不一致的文件及差异"""
+    import extract as ex
+    workdir = None
+    paths = args.paths
+    if not paths:
+        workdir = tempfile.mkdtemp(prefix='vdetect-ranges-')
+        sr.generate_repo(os.path.join(workdir, 'synthetic'), seed=args.seed)
+        paths = [workdir]
+    identical, differing = 0, []
+    elapsed = {'scanner': 0.0, 'regex': 0.0}
+    try:
+        for path in java_files(paths):
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read()
+            start = time.perf_counter()
+            new = ex.extract_method_ranges(content)
+            elapsed['scanner'] += time.perf_counter() - start
+            start = time.perf_counter()
+            old = ex.extract_method_ranges_regex(content)
+            elapsed['regex'] += time.perf_counter() - start
+            if new == old:
+                identical += 1
+            else:
+                differing.append((path, sorted(set(old) - set(new)), sorted(set(new) - set(old))))
+    finally:
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for path, only_old, only_new in differing[:args.show]:
+        print(path)
+        for r in only_old:
+            print(f"  - {r}")
+        for r in only_new:
+            print(f"  + {r}")
+    print(f"{identical} identical, {len(differing)} differing; "
+          f"scanner {elapsed['scanner']:.3f}s, regex {elapsed['regex']:.3f}s")
+
+
+def library_modules():
+    return sorted(f[:-3] for f in os.listdir(SCRIPT_DIR) if f.endswith('.py') and f[:-3] not in NOT_LIBRARY)
+
+
+def probe_import(names, cwd):
+    """在 cwd 中启动新的解释器导入 names，返回 (秒数, 被加载的重依赖)"""
+    code = IMPORT_PROBE.format(script_dir=SCRIPT_DIR, names=list(names), heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe['seconds'], probe['heavy']
+
+
+def import_times(args):
+    """逐个模块和全部模块一起的导入耗时（repeat 次取中位数），以及导入时的副作用"""
+    names = args.modules or library_modules()
+    failures = []
+    workdir = tempfile.mkdtemp(prefix='vdetect-imports-')
+    try:
+        for label, group in [(name, [name]) for name in names] + [('(all)', names)]:
+            try:
+                runs = [probe_import(group, workdir) for _ in range(args.repeat)]
+            except RuntimeError as e:
+                print(f"{label:<28}error: {e}")
+                failures.append(label)
+                continue
+            median = statistics.median(seconds for seconds, _ in runs) * 1000
+            heavy = sorted(set(m for _, loaded in runs for m in loaded))
+            problems = []
+            if median > args.budget_ms:
+                problems.append(f'over {args.budget_ms:g}ms')
+            if heavy:
+                problems.append(f"loads {', '.join(heavy)}")
+            if problems:
+                failures.append(label)
+            print(f"{label:<28}{median:>8.2f}ms  {'; '.join(problems) or 'ok'}")
+        if os.listdir(workdir):
+            print(f"files written at import: {os.listdir(workdir)}")
+            failures.append('(cwd)')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"{len(names)} modules, {len(failures)} failing")
+    return 1 if failures else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='流水线热点基准测试')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='生成合成仓库并计时')
+    run_parser.add_argument('--output', type=str, default='bench_output.json', help='JSON 报告路径')
+    run_parser.add_argument('--files', type=int, default=20, help='焦点类文件数')
+    run_parser.add_argument('--methods', type=int, default=10, help='每个类的方法数')
+    run_parser.add_argument('--body_lines', type=int, default=8, help='每个方法主体的行数')
+    run_parser.add_argument('--test_ratio', type=float, default=0.5, help='有测试类的焦点类比例')
+    run_parser.add_argument('--commits', type=int, default=10, help='修改提交数')
+    run_parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    run_parser.add_argument('--repeat', type=int, default=5, help='热运行次数')
+    run_parser.add_argument('--only', nargs='*', help='只运行指定用例')
+    run_parser.add_argument('--keep', action='store_true', help='保留临时目录')
+
+    compare_parser = sub.add_parser('compare', help='对比两份报告')
+    compare_parser.add_argument('base', type=str)
+    compare_parser.add_argument('new', type=str)
+
+    ranges_parser = sub.add_parser('ranges', help='对比 extract_method_ranges 的新旧实现')
+    ranges_parser.add_argument('paths', nargs='*', help='.java 文件或目录，默认使用合成仓库')
+    ranges_parser.add_argument('--show', type=int, default=20, help='最多打印多少个不一致的文件')
+    ranges_parser.add_argument('--seed', type=int, default=0, help='合成仓库的随机种子')
+
+    imports_parser = sub.add_parser('imports', help='计时导入各模块并检查导入时的副作用')
+    imports_parser.add_argument('modules', nargs='*', help='模块名，默认为 scripts 下除 benchmark 外的全部模块')
+    imports_parser.add_argument('--budget_ms', type=float, default=100, help='每组导入的耗时上限（毫秒）')
+    imports_parser.add_argument('--repeat', type=int, default=5, help='每组导入的次数，取中位数')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'ranges':
+        compare_ranges(args)
+    elif args.command == 'imports':
+        sys.exit(import_times(args))
+    else:
+        compare(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+每个 commit / 每个文件的时间与内存预算，以及病态 commit 的隔离列表（quarantine）。
+
+用法：
+    budget = Budget(commit_seconds=300, file_seconds=60, memory_mb=2048)
+    guard = budget.commit_guard(repo, commit_hash)
+    ...
+    guard.check('extract_functions')   # 超出预算时抛出 BudgetExceeded
+    with limit(guard, 'git diff'):     # 范围内的 git 调用以剩余预算为超时，超时同样抛出 BudgetExceeded
+        ...
+
+超出预算的 commit 由调用方丢弃已产生的部分结果，并用 Quarantine.add() 记录到 quarantine 文件。
+之后用更大的预算只重跑隔离列表中的 commit：
+    python budget.py retry --pipeline getfunc --scale 4
+    python budget.py retry --pipeline diff_stats --scale 4
+每条记录按它自己当时的预算放大，并沿用当时的运行选项（输入输出路径、输出格式、去重、负样本、过滤等）；
+重跑成功的行标记为 resolved，不再出现在 list / retry 中。getfunc 的重跑结果追加到原 jsonl 输出，shards 格式不支持追加。
+"""
+
+import os
+import json
+import time
+import argparse
+import subprocess
+from contextlib import contextmanager, nullcontext
+
+import git_util
+
+DEFAULT_QUARANTINE = git_util.script_path('dataset', 'quarantine.jsonl')
+
+
+def current_rss_mb():
+    """当前进程常驻内存（MB）；无法获取时返回 None（此时不检查内存预算）"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class BudgetExceeded(Exception):
+    """超出预算，携带阶段与规模统计，供写入 quarantine"""
+
+    def __init__(self, kind, stage, guard):
+        self.kind = kind
+        self.stage = stage
+        self.stats = guard.stats()
+        super().__init__(f"{kind} budget exceeded at {stage}: {self.stats}")
+
+
+class BudgetGuard():
+    """
+    单个 commit（或单个文件）的预算检查器。各阶段之间调用 check()，
+    并用 add() 累计规模统计（文件数、字节数等）。
+    """
+
+    def __init__(self, seconds=None, memory_mb=None, parent=None, **attrs):
+        self.seconds = seconds
+        self.memory_mb = memory_mb
+        self.parent = parent
+        self.attrs = attrs
+        self.start = time.monotonic()
+        self.start_rss = current_rss_mb() if memory_mb else None
+        self.counters = {}
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def remaining(self):
+        """剩余秒数（含上级预算），无限制时返回 None；limit() 范围内作为 git 调用的 timeout"""
+        remaining = None if self.seconds is None else max(self.seconds - self.elapsed(), 0)
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    def add(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        if self.parent is not None:
+            self.parent.add(**counters)
+
+    def stats(self):
+        stats = dict(self.attrs)
+        stats.update(self.counters)
+        stats['elapsed'] = round(self.elapsed(), 3)
+        if self.start_rss is not None:
+            stats['memory_mb'] = round(current_rss_mb() - self.start_rss, 1)
+        return stats
+
+    def check(self, stage):
+        """超出时间或内存预算时抛出 BudgetExceeded"""
+        if self.seconds is not None and self.elapsed() > self.seconds:
+            raise BudgetExceeded('time', stage, self)
+        if self.start_rss is not None:
+            rss = current_rss_mb()
+            if rss is not None and rss - self.start_rss > self.memory_mb:
+                raise BudgetExceeded('memory', stage, self)
+        if self.parent is not None:
+            self.parent.check(stage)
+
+    def file_guard(self, budget, **attrs):
+        return BudgetGuard(budget.file_seconds, budget.memory_mb, parent=self, **attrs)
+
+    @contextmanager
+    def limit(self, stage):
+        """范围内的 git 调用以剩余预算为超时；超时的子进程被终止，并转为 BudgetExceeded"""
+        try:
+            with git_util.time_limit(self.remaining):
+                yield self
+        except subprocess.TimeoutExpired:
+            raise BudgetExceeded('time', stage, self) from None
+
+
+def limit(guard, stage):
+    """guard 为 None（未设置预算）时不做限制"""
+    return guard.limit(stage) if guard is not None else nullcontext()
+
+
+class Budget():
+    """
+    预算配置。
+
+    :param commit_seconds: 每个 commit 的墙钟时间上限（秒），None 表示不限
+    :param file_seconds: 每个文件的墙钟时间上限（秒），None 表示不限
+    :param memory_mb: 每个 commit 处理期间常驻内存增长上限（MB），None 表示不限
+    """
+
+    def __init__(self, commit_seconds=None, file_seconds=None, memory_mb=None):
+        self.commit_seconds = commit_seconds
+        self.file_seconds = file_seconds
+        self.memory_mb = memory_mb
+
+    def commit_guard(self, repo, commit_hash):
+        return BudgetGuard(self.commit_seconds, self.memory_mb, repo=repo, commit=commit_hash)
+
+    def scaled(self, factor):
+        """按倍数放大的预算，用于重跑隔离的 commit"""
+        scale = lambda v: None if v is None else v * factor
+        return Budget(scale(self.commit_seconds), scale(self.file_seconds), scale(self.memory_mb))
+
+    def to_dict(self):
+        return {'commit_seconds': self.commit_seconds, 'file_seconds': self.file_seconds, 'memory_mb': self.memory_mb}
+
+    @staticmethod
+    def from_dict(data):
+        return Budget(data.get('commit_seconds'), data.get('file_seconds'), data.get('memory_mb'))
+
+
+class Quarantine():
+    """隔离列表，jsonl 格式，每行一个超出预算的 commit，或一条 resolved 标记"""
+
+    def __init__(self, path=DEFAULT_QUARANTINE):
+        self.path = path
+        self.added = []  # 本次运行中记入的 (pipeline, url, index)
+
+    def add(self, pipeline, url, error, budget, index=None, options=None):
+        """
+        :param pipeline: 出错的流水线，'getfunc' 或 'diff_stats'
+        :param url: commit 的 url
+        :param error: BudgetExceeded
+        :param budget: 当时使用的 Budget
+        :param index: 输入 csv 中的行号
+        :param options: 当时的运行选项（可 json 序列化的 dict），重跑时原样传回 main
+        """
+        entry = {
+            'pipeline': pipeline,
+            'index': index,
+            'url': url,
+            'kind': error.kind,
+            'stage': error.stage,
+            'stats': error.stats,
+            'budget': budget.to_dict(),
+            'options': options or {},
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.added.append((pipeline, url, index))
+        print(f"Quarantined {url}: {error}")
+
+    def resolve(self, entries):
+        """把重跑成功的行标记为 resolved（追加标记行，原记录保留）"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                mark = {
+                    'pipeline': entry['pipeline'],
+                    'index': entry.get('index'),
+                    'url': entry['url'],
+                    'resolved': True,
+                    'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                }
+                f.write(json.dumps(mark) + '\n')
+
+    def entries(self, pipeline=None):
+        """读取隔离列表；同一行（url 和行号）只保留最后一条，最后一条为 resolved 标记的行不返回"""
+        if not os.path.exists(self.path):
+            return []
+        latest = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if pipeline is None or entry['pipeline'] == pipeline:
+                        latest[(entry['pipeline'], entry['url'], entry.get('index'))] = entry
+        return [entry for entry in latest.values() if not entry.get('resolved')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='用更大的预算重跑被隔离的 commit')
+    parser.add_argument('command', choices=['retry', 'list'])
+    parser.add_argument('--pipeline', choices=['getfunc', 'diff_stats'], default='getfunc')
+    parser.add_argument('--quarantine', type=str, default=DEFAULT_QUARANTINE, help='隔离列表路径')
+    parser.add_argument('--scale', type=float, default=4, help='预算放大倍数')
+    parser.add_argument('--input', type=str, default=None,
+                        help='getfunc 的输入 csv（行号对应的文件），默认用隔离时记录的路径')
+    parser.add_argument('--output', type=str, default=None,
+                        help='getfunc 的输出文件，重跑结果追加到末尾，idx 接着已有记录编号；默认用隔离时记录的路径')
+    parser.add_argument('--base_path', type=str, default=None, help='存放所有仓库的地方，默认用隔离时记录的路径')
+    return parser.parse_args()
+
+
+def retry_getfunc(dpg, args, options, budget, quarantine, indices):
+    """用隔离时记录的选项重跑 getfunc，命令行给出的路径优先"""
+    import file_filter as ff
+    paths = {key: options.pop(key, None) for key in ('input_file_path', 'output_file_path', 'base_path')}
+    input_file_path = args.input or paths['input_file_path'] or git_util.script_path('dataset', 'veracode_fliter.csv')
+    output_file_path = args.output or paths['output_file_path'] or git_util.script_path('dataset', 'output_getfunc_test.jsonl')
+    base_path = args.base_path or paths['base_path'] or git_util.script_path('..', 'repo')
+    if options.get('file_filter') is not None:
+        options['file_filter'] = ff.FilterConfig.from_dict(options['file_filter'])
+    dpg.main(input_file_path, output_file_path, base_path, budget=budget, quarantine=quarantine, only_indices=indices,
+             append=True, **options)
+
+
+def main():
+    args = parse_args()
+    quarantine = Quarantine(args.quarantine)
+    entries = quarantine.entries(args.pipeline)
+    if args.command == 'list':
+        for entry in entries:
+            print(f"{entry['url']}\t{entry['kind']}@{entry['stage']}\t{entry['stats']}")
+        return
+    if not entries:
+        print("Nothing to retry")
+        return
+
+    # 每条记录以它自己当时的预算为基准放大，预算和运行选项都相同的行一起重跑；
+    # 仍超出预算的行以新的预算再次写入隔离列表，其余的行标记为 resolved
+    groups = {}
+    for entry in entries:
+        key = (json.dumps(entry['budget'], sort_keys=True), json.dumps(entry.get('options') or {}, sort_keys=True))
+        groups.setdefault(key, []).append(entry)
+    for group in groups.values():
+        budget = Budget.from_dict(group[0]['budget']).scaled(args.scale)
+        options = dict(group[0].get('options') or {})
+        indices = {entry['index'] for entry in group}
+        if args.pipeline == 'getfunc' and options.get('output_format', 'jsonl') != 'jsonl':
+            print(f"Skipping {len(indices)} rows: {options['output_format']} output cannot be appended, rerun them with jsonl")
+            continue
+        print(f"Retrying {len(indices)} quarantined rows with budget {budget.to_dict()}")
+        quarantine.added = []
+        if args.pipeline == 'getfunc':
+            import data_processing_getfunc as dpg
+            retry_getfunc(dpg, args, options, budget, quarantine, indices)
+        else:
+            import data_processing as dp
+            dp.main(budget=budget, quarantine=quarantine, only_indices=indices, **options)
+        failed = set(quarantine.added)
+        quarantine.resolve([entry for entry in group
+                            if (entry['pipeline'], entry['url'], entry['index']) not in failed])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
-import requests
 import time
 import csv
 import re
 import os 
-import subprocess #用来执行powershell命令并把输出重定向
 from concurrent.futures import ThreadPoolExecutor #多线程池
+from git_util import git
+from http_cache import HttpCache, default_session
 access_token = "" 
 
-def clone_repository(url, output_dir):
+def clone_repository(url, output_dir, http=None):
     try:
         # 从URL中提取仓库名
         repository_name = re.search(r'/([^/]+/[^/]+)/commit/', url).group(1)
@@ -19,7 +19,7 @@ def clone_repository(url, output_dir):
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/vnd.github.v3+json"
         }
-        response = requests.get(api_url, headers=headers)
+        response = (http or default_session()).get(api_url, headers=headers)
 
         if response.status_code == 200:
             # url有效
@@ -28,7 +28,7 @@ def clone_repository(url, output_dir):
                 #print(f"Repository {repo} already exists, skipping...")
                 return
             # 在指定目录下执行git clone命令
-            subprocess.run(["git", "clone", repository_url])
+            git(output_dir, "clone", repository_url)
             print(f"Successfully cloned {url}")
             print(repository_name)
             # 延迟一段时间，避免频繁请求
@@ -53,11 +53,11 @@ def main():
     with open(input_csv) as csvfile:
         reader = csv.reader(csvfile)
         urls = [row[3] for row in reader]
-    # 克隆仓库
-    os.chdir(base_path1)
+    # 克隆仓库（git -C base_path1 clone，不切换当前目录）；GitHub API 的检查结果缓存在 dataset/http_cache
+    http = HttpCache()
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         for url in urls:
-            executor.submit(clone_repository,url,base_path1)
+            executor.submit(clone_repository,url,base_path1,http)
         
     print(f"Data has been written to {output_file}")
 
@@ -0,0 +1,130 @@
+"""
+按仓库批量查询 commit 元数据，填写结果库的 note 列和元数据列。
+
+原先 data_processing.main 中注释掉的 get_commit_subject 每个 commit 调用一次 git。
+这里把同一仓库中所有要处理的 commit 一次性交给
+    git log --no-walk=unsorted --stdin --format=... --shortstat
+解析为 {commit: 元数据} 的表，之后每一行只做字典查找。
+不存在的 commit 会让 git log 整体失败，所以先用一次 `git cat-file --batch-check` 过滤掉。
+"""
+
+import re
+import threading
+
+from git_util import git
+
+# 字段之间用 \x1f 分隔，每个 commit 以 \x1e 开头；%s 不含换行
+LOG_FORMAT = '%x1e%H%x1f%P%x1f%an%x1f%ae%x1f%aI%x1f%cI%x1f%s'
+FILES_CHANGED = re.compile(r'(\d+) files? changed')
+
+
+def existing_commits(repo_path, hashes):
+    """
+    :return: {输入的哈希: 完整的 commit 哈希}，不存在、有歧义或不是 commit 的输入不包含在内
+    """
+    hashes = list(dict.fromkeys(hashes))
+    if not hashes:
+        return {}
+    result = git(repo_path, 'cat-file', '--batch-check=%(objectname) %(objecttype)', input='\n'.join(hashes) + '\n',
+                 name='git cat-file --batch-check', commits=len(hashes))
+    resolved = {}
+    for commit_hash, line in zip(hashes, result.stdout.splitlines()):
+        fields = line.split()
+        if len(fields) == 2 and fields[1] == 'commit':
+            resolved[commit_hash] = fields[0]
+    return resolved
+
+
+def parse_log(output):
+    """解析 LOG_FORMAT 加 --shortstat 的输出，返回 {完整哈希: 元数据}"""
+    table = {}
+    for record in output.split('\x1e'):
+        if not record.strip():
+            continue
+        header, _, rest = record.partition('\n')
+        fields = header.split('\x1f')
+        if len(fields) != 7:
+            continue
+        commit_hash, parents, author, email, author_date, commit_date, subject = fields
+        files = FILES_CHANGED.search(rest)
+        table[commit_hash] = {
+            'subject': subject,
+            'author': f'{author} <{email}>',
+            'author_date': author_date,
+            'commit_date': commit_date,
+            'parents': parents,
+            'files_changed': int(files.group(1)) if files else 0,
+        }
+    return table
+
+
+def lookup(repo_path, hashes):
+    """
+    一次 git log 查询多个 commit 的元数据。
+
+    :param hashes: commit 哈希（可以是缩写）
+    :return: {小写的输入哈希: 元数据}，同时包含完整哈希作为键
+    """
+    resolved = existing_commits(repo_path, [h.lower() for h in hashes])
+    if not resolved:
+        return {}
+    full_hashes = list(dict.fromkeys(resolved.values()))
+    result = git(repo_path, 'log', '--no-walk=unsorted', '--stdin', f'--format={LOG_FORMAT}', '--shortstat',
+                 input='\n'.join(full_hashes) + '\n', name='git log --stdin', commits=len(full_hashes))
+    if result.returncode != 0:
+        print(f"Error occurred: {result.stderr}")
+        return {}
+    table = parse_log(result.stdout)
+    found = dict(table)
+    found.update((commit_hash, table[full]) for commit_hash, full in resolved.items() if full in table)
+    return found
+
+
+class CommitMetadata():
+    """
+    每个仓库的 commit 元数据表。先用 expect() 登记每个仓库要处理的 commit，
+    第一次 get() 某个仓库时一次查询全部登记的 commit；之后出现的未登记 commit 单独补查。
+    """
+
+    def __init__(self):
+        self.pending = {}  # 仓库路径 -> [commit 哈希]
+        self.tables = {}  # 仓库路径 -> {小写的 commit 哈希: 元数据}
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    def expect(self, repo_path, hashes):
+        self.pending.setdefault(repo_path, []).extend(hashes)
+
+    def get(self, repo_path, commit_hash):
+        """:return: 元数据 dict，commit 不存在时返回 None"""
+        key = commit_hash.lower()
+        with self.lock:
+            table = self.tables.get(repo_path)
+            missing = None
+            if table is None:
+                missing = self.pending.pop(repo_path, []) + [commit_hash]
+            elif key not in table:
+                missing = [commit_hash]
+        if missing is not None:
+            found = lookup(repo_path, missing)
+            with self.lock:
+                self.queries += 1
+                table = self.tables.setdefault(repo_path, {})
+                table.update(found)
+                for h in missing:
+                    table.setdefault(h.lower(), None)  # 不存在的 commit 不再重复查询
+        return table.get(key)
+
+    def columns(self, repo_path, commit_hash):
+        """
+        结果库中该 commit 的 note 和元数据列；note 填 commit 的 subject。
+        commit 不存在时返回空字典（不覆盖已有的值）。
+        """
+        meta = self.get(repo_path, commit_hash)
+        if meta is None:
+            return {}
+        return dict(meta, note=meta['subject'])
+
+    def report(self):
+        commits = sum(len({id(meta) for meta in table.values() if meta}) for table in self.tables.values())
+        return f"commit metadata: {commits} commits in {len(self.tables)} repos, {self.queries} git log queries"
@@ -1,10 +1,17 @@
-import requests
 import time
 import csv
 import re
 import os 
-import subprocess #用来执行powershell命令并把输出重定向
+import subprocess
 from concurrent.futures import ThreadPoolExecutor #多线程池
+from results_store import ResultsStore
+import tracing
+from git_util import git
+from http_cache import HttpCache, default_session
+import work_units
+from commit_meta import CommitMetadata
+from diff_stream import DiffTreeStream
+from budget import BudgetExceeded, Quarantine, limit
 access_token = "your_access_token" 
 
 def has_test_case(line):
@@ -28,13 +35,11 @@ def get_branches_containing_commit(repo_path, commit_hash):
     if not os.path.exists(repo_path):
         print(f"Error: {repo_path} does not exist")
         return []
-    else:
-        os.chdir(repo_path)
     
     # 执行 git branch --contains 命令
     try:
-        result = subprocess.run(['git', 'branch', '-a', '--contains', commit_hash],
-                                capture_output=True, text=True, check=True)
+        result = git(repo_path, 'branch', '-a', '--contains', commit_hash, check=True,
+                     name='git branch --contains', commit=commit_hash)
         branches = result.stdout.strip().split("\n")
         branches = [branch.strip().replace("* ", "") for branch in branches]  # 去掉当前分支的星号
         return branches
@@ -219,8 +224,8 @@ def extract_modified_functions(diff_lines,index):
 
     return function_name
 
-def process_diff_output(repo,diff_output):
-    # 处理每个diff并计算相关变量
+def process_diff_output(repo,diff_output,guard=None):
+    # 处理每个diff并计算相关变量；guard 为 BudgetGuard，每处理 1000 行检查一次预算
     lines = diff_output.splitlines(keepends=False)
     is_new_diff =False#是否是新的diff
     file_count = 0 # 文件数（非test）
@@ -234,6 +239,8 @@ def process_diff_output(repo,diff_output):
     have_test = 0 # 用于标记仓库内是否有test文件
     for i,line in enumerate(lines):
         #print(i)
+        if guard and i % 1000 == 0:
+            guard.check('process_diff_output')
         line = re.sub(r' {2,}', '', line)  # 删除多余空格
 
         # 检查是否是diff文件头
@@ -312,7 +319,11 @@ def process_diff_output(repo,diff_output):
 
     return datas
 
-def clone_repository(url, output_dir):
+def clone_repository(url, output_dir, cache=None, http=None):
+    """
+    :param cache: repo_cache.RepoCache；传入时由缓存负责克隆（fork 共享上游对象、写 commit-graph、超出磁盘预算时淘汰）
+    :param http: http_cache.HttpCache；传入时 GitHub API 的检查结果被缓存（404 负缓存），不传则直接请求
+    """
     try:
         # 从URL中提取仓库名
         repository_name = re.search(r'/([^/]+/[^/]+)/commit/', url).group(1)
@@ -324,16 +335,23 @@ def clone_repository(url, output_dir):
             "Authorization": f"Bearer {access_token}",
             "Accept": "application/vnd.github.v3+json"
         }
-        response = requests.get(api_url, headers=headers)
+        response = (http or default_session()).get(api_url, headers=headers)
+        if response.status_code == 504 and getattr(response, 'from_cache', False):
+            # 离线模式且没有缓存：本地已有仓库时照常处理，否则跳过
+            print(f"No cached API response for {repository_name} (offline)")
+            return None if os.path.exists(os.path.join(output_dir, repo)) else False
 
         if response.status_code == 200:
             # url有效
+            if cache is not None:
+                parent = (response.json().get('parent') or {}).get('full_name')
+                return cache.ensure(repository_name, repository_url, parent) is not None
             # 检查目录下是否已经存在该仓库
             if os.path.exists(os.path.join(output_dir, repo)):
                 #print(f"Repository {repo} already exists, skipping...")
                 return
             # 在指定目录下执行git clone命令
-            subprocess.run(["git", "clone", repository_url])
+            git(output_dir, "clone", repository_url)
             print(f"Successfully cloned {url}")
             print(repository_name)
             # 延迟一段时间，避免频繁请求
@@ -346,12 +364,20 @@ def clone_repository(url, output_dir):
     except Exception as e:
         print(f"Error cloning {url}: {e}")
         
-def main():
+def main(budget=None, quarantine=None, only_indices=None, offline=False, stream_diffs=False):
+    """
+    :param budget: Budget 对象，超出预算的 commit 不写入结果库，记录到 quarantine
+    :param quarantine: Quarantine 对象，默认 dataset/quarantine.jsonl
+    :param only_indices: 只处理这些行号（重跑隔离列表时使用）；结果按行 upsert，不影响其他行
+    :param offline: 只使用 HTTP 缓存（dataset/http_cache），不请求 GitHub
+    :param stream_diffs: 为 True 时同一仓库的所有 commit 共用一个 git diff-tree --stdin 进程（diff_stream.DiffTreeStream），
+        仓库切换时重建，只包含该仓库之后还要处理的 commit
+    同一 (仓库, commit) 出现在多行时只计算一次，结果写入每一行（url 列保持各行原值）
+    """
     base_path='E:\\dachaung\\github_clone' #存放所有仓库的地方，一般是硬盘的目录
     output_file = "E:\\dachaung\\output.csv"#输出文件
     input_csv = "E:\\dachaung\\veracode_fliter.csv"#输入文件k
-    # 表头
-    header = ['index', 'cwe key word', 'matched key word', 'file', 'func', 'hunk', 'function_name', 'note', 'repo', 'branch', 'url','testcase']
+    results_db = "E:\\dachaung\\results.db"#结果库，表头见 results_store.HEADER
     urls = []
     # 获取csv文件里的urls
     max_workers=5
@@ -364,89 +390,146 @@ def main():
     #     for url in urls:
     #         executor.submit(clone_repository,url,base_path)
 
-    # CSV 文件写入
-    with open(output_file, mode='w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=header)
-        writer.writeheader()
+    # 结果写入结果库（按行 upsert），最后统一导出 CSV
+    store = ResultsStore(results_db)
+    http = HttpCache(offline=offline)  # GitHub API 检查和 .diff 下载的缓存
+    if budget and quarantine is None:
+        quarantine = Quarantine()
+    run_options = {'offline': offline, 'stream_diffs': stream_diffs}  # 随隔离记录保存，budget.py retry 时原样传回
+
+    ###########手动筛选################
+    cwe_key_word = {'CWE-79': ['XSS', 'Cross Site Scripting']}
+    matched_key_word = {'CWE-79': ['XSS']}
+
+    print(work_units.report(work_units.group_rows(urls)))
+    # 每个仓库的所有 commit 在第一次用到时用一次 git log 查询元数据
+    commit_meta = CommitMetadata()
+    repo_commits = {}  # 仓库路径 -> [(行号, commit 哈希)]
+    for index, url in enumerate(urls, start=1):
+        parsed = work_units.parse_commit_url(url)
+        if parsed is not None:
+            commit_meta.expect(os.path.join(base_path, parsed[1]), [parsed[2]])
+            repo_commits.setdefault(os.path.join(base_path, parsed[1]), []).append((index, parsed[2]))
+    diff_stream = None
+    computed = {}  # 成功处理的工作单元 -> (repo, commit_hash, 结果)
+    quarantined = {}  # 超出预算的工作单元 -> BudgetExceeded；之后的行同样记入隔离列表
+
+    for index, url in enumerate(urls, start=1):
+        if only_indices is not None and index not in only_indices:
+            continue
+        key = work_units.unit_key(url)
+        if key is not None and key in quarantined:
+            quarantine.add('diff_stats', url, quarantined[key], budget, index=index, options=run_options)
+            continue
+        if key is not None and key in computed:
+            # 同一 commit 已计算过，直接写入该行
+            repo, commit_hash, result = computed[key]
+            store.upsert(index, repo, commit_hash, **dict(result, url=url))
+            continue
+        # 获取diff内容diff_output
+        match = re.search(r'/([^/]+/[^/]+)/commit/', url)
+
+        if not match:
 
-        ###########手动筛选################
-        cwe_key_word = {'CWE-79': ['XSS', 'Cross Site Scripting']}
-        matched_key_word = {'CWE-79': ['XSS']}
-        
-        for index, url in enumerate(urls, start=1):
-            # 获取diff内容diff_output
-            match = re.search(r'/([^/]+/[^/]+)/commit/', url)
-    
-            if not match:
-                
-                result = {
-                'index': index,
-                'cwe key word': cwe_key_word,
-                'matched key word': matched_key_word,
-                'file': '0',
-                'func': '0',
-                'hunk': '0',
-                'function_name': '',
-                'note': "",  # 人工标注
-                'repo': '',
-                'branch': '',
-                'url': url,
-                'testcase': ''  
-                }
-                writer.writerow(result)
-                continue
-            
-            repository_name = match.group(1)
-            # note = get_commit_subject(commit_hash,repo) #获取commit的subject
-        
-                
-            commit_hash = extract_commit_hash(url)
-            os.chdir(base_path)
-            if clone_repository(url, base_path) == False:
-                continue#对应的url链接已经被删除不输出，共20条
-            repo = re.search(r'[^/]+$', repository_name).group() #获取repo
-            repo_path = os.path.join(base_path, repo) #获取仓库的本地克隆目录
-            branch = get_branches_containing_commit(repo_path, commit_hash) #获取分支名
-            
-            # os.chdir(os.path.join(base_path, repo)) #改变当前工作目录到仓库的本地克隆目录
-            diff_command = f'git diff {commit_hash}^..{commit_hash}'  # 注意添加了空格
-            diff_output = subprocess.run(['powershell', '-Command', diff_command], capture_output=True, text=True, encoding='utf-8',errors='ignore' ).stdout
-                #如果git diff命令的输出为空，从网络获取
-            
-            if diff_output is None or len(diff_output) < 1:
-                print("the repo"+repo+" local is bad")
-                diff_url = url + '.diff'
-                res = requests.get(diff_url).text
-                if res != None:
-                    print("it is solved")
-                    diff_output = res
-            
-            #print(diff_output) #调试一下
-            
-            with open(os.path.join(base_path, repo, 'diff.txt'), 'w', encoding='utf-8') as file:
-                file.write(diff_output)
-            
-            # 获取结果并写入CSV
-            datas = process_diff_output(repo, diff_output)
             result = {
-                'index': index,
-                'cwe key word': cwe_key_word,
-                'matched key word': matched_key_word,
-                'file': f"{datas['file']}({datas['java_file_count']})",
-                'func': datas['func'],
-                'hunk': datas['hunk'],
-                'function_name': datas['function_name'],
-                'note': "",  # 人工标注
-                'repo': repo,
-                'branch': branch,
-                'url': url,
-                # 'testcase': int(datas['is_test_case'])  
-                'testcasse':{}
+            'cwe key word': cwe_key_word,
+            'matched key word': matched_key_word,
+            'file': '0',
+            'func': '0',
+            'hunk': '0',
+            'function_name': '',
+            'note': "",  # 人工标注
+            'branch': '',
+            'url': url,
             }
-            writer.writerow(result)
+            store.upsert(index, '', '', **result)
+            continue
+
+        repository_name = match.group(1)
+
+
+        commit_hash = extract_commit_hash(url)
+        if clone_repository(url, base_path, http=http) == False:
+            continue#对应的url链接已经被删除不输出，共20条
+        repo = re.search(r'[^/]+$', repository_name).group() #获取repo
+        repo_path = os.path.join(base_path, repo) #获取仓库的本地克隆目录
+        guard = budget.commit_guard(repo, commit_hash) if budget else None
+        try:
+            # 查分支和 git diff 以剩余预算为超时，超时同样隔离
+            with limit(guard, 'git diff'):
+                branch = get_branches_containing_commit(repo_path, commit_hash) #获取分支名
+
+                if stream_diffs:
+                    if diff_stream is None or diff_stream.repo_path != repo_path:
+                        if diff_stream is not None:
+                            diff_stream.close()
+                        diff_stream = DiffTreeStream(repo_path, [c for i, c in repo_commits.get(repo_path, []) if i >= index])
+                    diff_output = diff_stream.diff(commit_hash)
+                    diff_stream.release(commit_hash)  # 同一 commit 的其他行使用 computed 中的结果
+                else:
+                    diff_output = git(repo_path, 'diff', f'{commit_hash}^..{commit_hash}', commit=commit_hash).stdout
+        except BudgetExceeded as e:
+            if key is not None:
+                quarantined[key] = e
+            quarantine.add('diff_stats', url, e, budget, index=index, options=run_options)
+            continue
+        #如果git diff命令的输出为空，从网络获取
+
+        if diff_output is None or len(diff_output) < 1:
+            print("the repo"+repo+" local is bad")
+            diff_url = url + '.diff'
+            with tracing.span('GET .diff', 'http', repo=repo, commit=commit_hash) as sp:
+                res = http.get(diff_url).text
+                sp['bytes'] = len(res or '')
+            if res != None:
+                print("it is solved")
+                diff_output = res
+
+        #print(diff_output) #调试一下
 
+        with tracing.span('write diff.txt', 'write', repo=repo, commit=commit_hash, bytes=len(diff_output)):
+            with open(os.path.join(base_path, repo, 'diff.txt'), 'w', encoding='utf-8') as file:
+                file.write(diff_output)
 
+        # 获取结果并写入结果库（testcase 列由 data_processing_testcase 负责）
+        if guard:
+            guard.add(bytes=len(diff_output))
+        try:
+            with tracing.span('process_diff_output', 'scan', repo=repo, commit=commit_hash, bytes=len(diff_output)):
+                datas = process_diff_output(repo, diff_output, guard)
+        except BudgetExceeded as e:
+            if key is not None:
+                quarantined[key] = e
+            quarantine.add('diff_stats', url, e, budget, index=index, options=run_options)
+            continue
+        result = {
+            'cwe key word': cwe_key_word,
+            'matched key word': matched_key_word,
+            'file': f"{datas['file']}({datas['java_file_count']})",
+            'func': datas['func'],
+            'hunk': datas['hunk'],
+            'function_name': datas['function_name'],
+            'note': "",  # 人工标注，默认为 commit 的 subject
+            'branch': branch,
+            'url': url,
+        }
+        result.update(commit_meta.columns(repo_path, commit_hash))  # note 和 commit 元数据列
+        with tracing.span('upsert', 'write', repo=repo, commit=commit_hash):
+            store.upsert(index, repo, commit_hash, **result)
+        if key is not None:
+            computed[key] = (repo, commit_hash, result)
+
+    if diff_stream is not None:
+        diff_stream.close()
+
+    # 从结果库重新生成 CSV
+    with tracing.span('export csv', 'write'):
+        store.export_csv(output_file)
+    store.close()
+    print(f"HTTP cache: {http.report()}")
+    print(commit_meta.report())
     print(f"Data has been written to {output_file}")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    budget = None # 如 Budget(commit_seconds=300)：超出预算的commit记录到 dataset/quarantine.jsonl，用 python budget.py retry --pipeline diff_stats 重跑；None 表示不限
+    main(budget=budget)
\ No newline at end of file
@@ -1,31 +1,24 @@
-import subprocess
-from tree_sitter import Language, Parser
 import re
 import os
-import warnings
 import json
 import csv
+import math
+import random
+import hashlib
+import threading
+from contextlib import contextmanager
 import data_processing as dp
 import extract as ex
+from func_dataset import FuncDatasetWriter
+import tracing
+from budget import BudgetExceeded, Quarantine, limit
+import file_filter as ff
+from git_util import git_output, script_path
+import work_units
+from stage_queue import StagedPipeline, PipelineMetrics, WriterThread
 from collections import defaultdict
-warnings.simplefilter('ignore', FutureWarning)
+from java_grammar import get_parser, java_language  # 语法文件在第一次解析时才加载
 
-JAVA_LANGUAGE = Language('build/my-languages.so', 'java')
-parser = Parser()
-parser.set_language(JAVA_LANGUAGE)
-
-# 已测试有效 
-def run_command(command):
-    """运行shell命令并返回输出"""
-    
-    # 使用列表形式传递命令，避免shell解释问题
-    args = command.split()
-    result = subprocess.run(args, capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        print(f"Error occurred: {result.stderr}")
-    
-    return result.stdout
 
 def repo_path_exists(base_repo_path, repo_path):
     # 计算 repo_path 在 base_repo_path 下的绝对路径
@@ -43,26 +36,37 @@ def get_file_paths(repo_path, commit_hash):
     :return: 修改的文件路径列表
     """
     
-    command = f'git diff --name-only {commit_hash}^..{commit_hash}'
-    # repo_path = "E:/dachuang2024/tmp/tmp/spring-framework"
-    os.chdir(repo_path)
-    file_paths = run_command(command)
+    file_paths = git_output(repo_path, 'diff', '--name-only', f'{commit_hash}^..{commit_hash}',
+                            name='git diff --name-only', commit=commit_hash)
 
     return file_paths.splitlines()
 
+
+def get_changed_paths(repo_path, commit_hash):
+    """
+    提交中所有改动过的文件路径（不做重命名检测：重命名的源路径和目标路径都在内），
+    用作未修改文件的排除列表。
+
+    :return: 路径集合
+    """
+    file_paths = git_output(repo_path, 'diff', '--name-only', '--no-renames', f'{commit_hash}^..{commit_hash}',
+                            name='git diff --name-only', commit=commit_hash)
+    return set(file_paths.splitlines())
+
 # 已测试有效
-def get_modified_functions(commit_hash,file_path,repo_path):
+def get_modified_functions(commit_hash,file_path,repo_path,change_detection='lines'):
     """
         提取diff_out中某个修改文件的所有修改函数名称。
 
         参数:
             commit_hash: 提交哈希值。
             file_path: 修改文件的路径。
+            change_detection: 'lines' 按 diff 行号映射；'hash' 比较方法主体哈希（extract.hash_modified_methods）
 
         返回:
             list: 该diff的修改函数名称列表(函数名+参数)。
         """
-    return ex.get_modified_methods(commit_hash,file_path,repo_path)
+    return ex.get_modified_methods(commit_hash,file_path,repo_path,change_detection)
 
 # 已测试有效
 def extract_functions(content):
@@ -74,7 +78,7 @@ def extract_functions(content):
     """
     
     functions = {}
-    tree = parser.parse(bytes(content, 'utf8'))  # 解析文件内容为语法树
+    tree = get_parser().parse(bytes(content, 'utf8'))  # 解析文件内容为语法树
     
     method_query = """
     (method_declaration
@@ -84,7 +88,7 @@ def extract_functions(content):
       body: (block) @method_body
     )
     """
-    query = JAVA_LANGUAGE.query(method_query)
+    query = java_language().query(method_query)
     captures = query.captures(tree.root_node)
 
     current_method = {"name": None, "body": None, "params": [], "return_type": None, "exceptions": []}
@@ -137,96 +141,563 @@ def extract_functions(content):
     
     return functions
 
-def main_process(commit_hash, repo_path, index, output_file_path):
+class FunctionDedup():
+    """
+    跨commit的函数主体去重：同一仓库、同一文件中主体完全相同的函数只保存一次，
+    之后出现的记录用 func_ref 指向第一次出现时的 idx。
+    """
+
+    def __init__(self):
+        self.seen = {}  # (repo, file_path, 主体哈希) -> 首次出现的 idx
+
+    @staticmethod
+    def body_hash(func_body):
+        return hashlib.sha1(func_body.encode('utf-8')).hexdigest()
+
+    def ref(self, repo, file_path, func_body, idx):
+        """返回相同主体首次出现的 idx；第一次出现时登记并返回 None"""
+        key = (repo, file_path, self.body_hash(func_body))
+        if key in self.seen:
+            return self.seen[key]
+        self.seen[key] = idx
+        return None
+
+    def forget_after(self, idx):
+        """撤销 idx 之后登记的主体（对应 commit 的输出被丢弃时调用）"""
+        self.seen = {key: first for key, first in self.seen.items() if first <= idx}
+
+
+class UnmodifiedFunctions():
+    """
+    仓库中未修改文件的函数表，作为 target=0 的负样本。
+    同一仓库的连续 commit 之间用 `git diff-tree` 比较两棵树，只重新解析内容变化的 blob，
+    其余文件复用按 blob 哈希缓存的 extract_functions 结果；缓存只保留当前树中的 blob。
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.rev = None  # 上一次的版本
+        self.tree = {}  # 文件路径 -> blob 哈希（仅 .java 文件）
+        self.tables = {}  # blob 哈希 -> {方法签名: 完整定义}
+        self.stats = {'parsed': 0, 'reused': 0}
+
+    def update(self, rev):
+        """把 tree 更新到 rev：第一次用 ls-tree 列出整棵树，之后只应用与上一版本的 diff-tree 差异"""
+        if self.rev is None:
+            output = git_output(self.repo_path, 'ls-tree', '-r', '-z', rev, name='git ls-tree', commit=rev)
+            for entry in output.split('\0'):
+                if not entry:
+                    continue
+                meta, path = entry.split('\t', 1)
+                _, kind, sha = meta.split()
+                if kind == 'blob' and path.endswith('.java'):
+                    self.tree[path] = sha
+        elif rev != self.rev:
+            output = git_output(self.repo_path, 'diff-tree', '-r', '-z', '--no-renames', self.rev, rev,
+                                name='git diff-tree', commit=rev)
+            fields = output.split('\0')
+            # 每个条目为 ":旧mode 新mode 旧sha 新sha 状态" 与路径两个字段
+            for k in range(0, len(fields) - 1, 2):
+                if not fields[k].startswith(':'):
+                    continue
+                _, _, _, sha, status = fields[k][1:].split()
+                path = fields[k + 1]
+                if not path.endswith('.java'):
+                    continue
+                if status == 'D':
+                    self.tree.pop(path, None)
+                else:
+                    self.tree[path] = sha
+        self.rev = rev
+
+    def functions(self, rev, skip_paths=(), reader=None, guard=None):
+        """
+        生成 rev 版本中除 skip_paths 以外每个 .java 文件的 (文件路径, {方法签名: 完整定义})，按路径排序。
+
+        :param reader: extract.CatFileBatch，不传时用 git show 读取 blob
+        :param guard: budget 的 commit guard，每个文件之后检查一次，读取 tree 和 blob 时以剩余预算为超时
+        """
+        with limit(guard, 'unmodified_files'):
+            self.update(rev)
+        for path in sorted(self.tree):
+            if path in skip_paths:
+                continue
+            sha = self.tree[path]
+            if sha in self.tables:
+                self.stats['reused'] += 1
+            else:
+                with limit(guard, 'unmodified_files'):
+                    content = reader.read(rev, path) if reader is not None else ex.get_file_content(rev, path, self.repo_path)
+                with tracing.span('extract_functions', 'parse', repo=self.repo_path, commit=rev, file=path, bytes=len(content)):
+                    self.tables[sha] = extract_functions(content)
+                self.stats['parsed'] += 1
+            if guard:
+                guard.check('unmodified_files')
+            yield path, self.tables[sha]
+        live = set(self.tree.values())
+        self.tables = {sha: table for sha, table in self.tables.items() if sha in live}
+
+    def report(self):
+        return f"unmodified files: {self.stats['parsed']} parsed, {self.stats['reused']} reused from earlier commits"
+
+
+SAMPLE_SCOPES = ('commit', 'repo')
+
+
+class NegativeSampler():
+    """
+    在写出之前对 target=0 的函数做蓄水池抽样，target=1 的函数全部保留。
+
+    - scope='commit'：每个 commit 保留 ceil(ratio * 该 commit 的修改函数数) 个未修改函数
+    - scope='repo'：名额在同一仓库的 commit 之间累计，没有用完的名额留给该仓库之后的 commit
+    每个 commit 的随机数由 (seed, 仓库, commit) 决定，结果与处理顺序和 worker 数无关。
+
+    :param ratio: 每个修改函数对应保留多少个未修改函数
+    :param scope: 'commit' 或 'repo'
+    :param seed: 随机种子
+    """
+
+    def __init__(self, ratio=1.0, scope='commit', seed=0):
+        if scope not in SAMPLE_SCOPES:
+            raise ValueError(f"unknown sample scope: {scope}")
+        self.ratio = ratio
+        self.scope = scope
+        self.seed = seed
+        self.quota = {}  # 仓库 -> 累计但还没有用完的名额（scope='repo'）
+        self.stats = {'positives': 0, 'negatives': 0, 'kept': 0}
+        self.lock = threading.Lock()
+
+    def commit(self, repo, commit_hash):
+        """开始一个 commit 的抽样"""
+        return CommitSample(self, repo, random.Random(f'{self.seed}:{repo}:{commit_hash}'))
+
+    def capacity(self, repo, positives):
+        """修改函数数确定后，该 commit 最多保留的未修改函数数"""
+        if self.scope == 'commit':
+            return math.ceil(self.ratio * positives)
+        with self.lock:
+            return int(self.quota.get(repo, 0) + self.ratio * positives)
+
+    def done(self, repo, positives, negatives, kept):
+        with self.lock:
+            self.stats['positives'] += positives
+            self.stats['negatives'] += negatives
+            self.stats['kept'] += kept
+            if self.scope == 'repo':
+                self.quota[repo] = self.quota.get(repo, 0) + self.ratio * positives - kept
+
+    def report(self):
+        stats = self.stats
+        return (f"negative sampling ({self.scope}, ratio {self.ratio:g}, seed {self.seed}): {stats['positives']} modified, "
+                f"{stats['kept']} of {stats['negatives']} unmodified functions kept")
+
+
+class CommitSample():
+    """
+    一个 commit 的抽样状态。修改文件在未修改文件之前到达：修改文件中的函数先暂存，
+    修改文件处理完（open）后按修改函数数确定容量，再对全部未修改函数做蓄水池抽样（Algorithm R），
+    内存中只有修改文件的函数和容量以内的样本。
+    """
+
+    def __init__(self, sampler, repo, rng):
+        self.sampler = sampler
+        self.repo = repo
+        self.rng = rng
+        self.sequence = 0  # 函数在输出流中的位置，保留的函数按该顺序输出
+        self.positives = []
+        self.pending = []  # open() 之前到达的未修改函数
+        self.reservoir = None
+        self.capacity = 0
+        self.negatives = 0
+
+    def add_file(self, file_path, functions, modified_function_names):
+        """:param modified_function_names: 当前的 {方法签名: 修改行号列表}，与 function_records 的判断相同"""
+        for func_name, func_body in functions.items():
+            self.sequence += 1
+            if func_name in modified_function_names:
+                self.positives.append((self.sequence, file_path, func_name, func_body,
+                                       modified_function_names[func_name]))
+            elif self.reservoir is None:
+                self.pending.append((self.sequence, file_path, func_name, func_body, None))
+            else:
+                self._offer((self.sequence, file_path, func_name, func_body, None))
+
+    def open(self):
+        """修改文件已全部加入，确定容量"""
+        if self.reservoir is not None:
+            return
+        self.capacity = self.sampler.capacity(self.repo, len(self.positives))
+        self.reservoir = []
+        for item in self.pending:
+            self._offer(item)
+        self.pending = []
+
+    def _offer(self, item):
+        self.negatives += 1
+        if len(self.reservoir) < self.capacity:
+            self.reservoir.append(item)
+            return
+        j = self.rng.randrange(self.negatives)
+        if j < self.capacity:
+            self.reservoir[j] = item
+
+    def files(self):
+        """
+        保留的函数按原来的顺序分文件输出：[(文件路径, {方法签名: 完整定义}, {方法签名: 修改行号列表})]，
+        可直接交给 function_records。
+        """
+        self.open()
+        self.sampler.done(self.repo, len(self.positives), self.negatives, len(self.reservoir))
+        grouped = []
+        for _, file_path, func_name, func_body, flaw_lines in sorted(self.positives + self.reservoir):
+            if not grouped or grouped[-1][0] != file_path:
+                grouped.append((file_path, {}, {}))
+            grouped[-1][1][func_name] = func_body
+            if flaw_lines is not None:
+                grouped[-1][2][func_name] = flaw_lines
+        return grouped
+
+
+def expand_records(function_infos):
+    """把去重输出还原为完整输出（func_ref 替换回函数主体）"""
+    bodies = {}
+    for function_info in function_infos:
+        if 'func_ref' in function_info:
+            function_info = dict(function_info)
+            function_info['func'] = bodies[function_info.pop('func_ref')]
+        else:
+            bodies[function_info['idx']] = function_info['func']
+        yield function_info
+
+
+def main_process(commit_hash, repo_path, index, output_file_path, with_meta=False, dedup=None, budget=None,
+                 file_filter=None, filter_stats=None, io_workers=2, parse_workers=1, queue_size=8, metrics=None,
+                 change_detection='lines', unmodified=None, sampler=None):
     """
     主函数：从每个commit里提取出修改函数和未修改函数。
 
     :param commit_hash: 提交哈希值
     :param repo_path: 在本地的代码库路径
     :param index: 编号，用于记录函数的编号
+    :param with_meta: 为 True 时记录中额外带上 repo/commit/file，供分片格式建索引
+    :param dedup: FunctionDedup 对象；传入时重复的函数主体输出为 func_ref，不传则输出完整主体
+    :param budget: Budget 对象；超出每个 commit / 每个文件的预算时抛出 BudgetExceeded
+    :param file_filter: file_filter.FilterConfig；传入时在读取 blob 前跳过超大、生成和第三方文件
+    :param filter_stats: file_filter.FilterStats，按仓库统计跳过数
+    :param io_workers: 读取 blob 和 diff 的线程数
+    :param parse_workers: tree-sitter 解析的线程数
+    :param queue_size: 阶段之间有界队列的容量，限制同时在内存中的文件数
+    :param metrics: stage_queue.PipelineMetrics，累计各阶段的队列深度和耗时
+    :param change_detection: 'lines' 把 diff 修改行映射到方法；'hash' 比较新旧版本的方法主体哈希，
+        只为哈希不同的方法读取 diff 计算修改行号，只改空白或注释的方法不算修改
+    :param unmodified: 该仓库的 UnmodifiedFunctions；传入时在修改文件之后，
+        再为父提交中所有未修改的 .java 文件输出 target=0 的记录（同样的字段）
+    :param sampler: NegativeSampler；传入时 target=0 的函数经蓄水池抽样后才生成记录，
+        整个 commit 处理完后按原来的顺序输出，idx 连续编号，去重只登记保留的函数
     """
-    #切换到脚本所在目录
-    script_path = os.path.abspath(__file__)
-    script_dir = os.path.dirname(script_path)
-    os.chdir(script_dir)
+    repo = os.path.basename(os.path.normpath(repo_path))
+    guard = budget.commit_guard(repo, commit_hash) if budget else None
 
-    file_paths = get_file_paths(repo_path, commit_hash)  # 获取所有修改文件路径(相对于其所在仓库)
+    with limit(guard, 'get_file_paths'):
+        file_paths = get_file_paths(repo_path, commit_hash)  # 获取所有修改文件路径(相对于其所在仓库)
+        if file_filter is not None:
+            file_paths = ff.prefilter(repo_path, commit_hash, file_paths, file_filter, filter_stats, repo)
+    if guard:
+        guard.add(paths=len(file_paths))
+        guard.check('get_file_paths')
     
-    # 此时的路径为repo_path
     modified_function_names = defaultdict(list)  # 存储修改的函数名和行号
-    
-    # 逐个处理文件
-    for file_path in file_paths:
-        
-        
-        if(file_path.endswith('java')):
-            print(f"Processing file: {file_path}")
+
+    def fetch(file_path):
+        """io 阶段：读取新旧版本内容和该文件的 diff"""
+        print(f"Processing file: {file_path}")
+        file_guard = guard.file_guard(budget, file=file_path) if guard else None
+        with limit(file_guard, 'get_file_content'):
             content = ex.get_file_content(commit_hash, file_path, repo_path)  # 获取文件内容
             parent_content = ex.get_file_content(f'{commit_hash}^', file_path, repo_path)  # 获取父提交版本的文件内容
-            modified_function_names.update(get_modified_functions(commit_hash, file_path, repo_path))  # 获取被修改的函数名称(字典，键为函数名，值为修改的行号列表)
-            parent_functions = extract_functions(parent_content)  # 提取父提交中的所有函数定义
-
-            # 处理每个文件中的函数
-            for func_name, func_body in parent_functions.items():
-                index += 1
-                # 判断函数是否被修改
-                if func_name in modified_function_names:
-                    is_modified = 1 
-                else:
-                    is_modified = 0
-
-                # 创建包含函数定义和修改标志的字典
-                function_info = {
-                    'idx': index,
-                    'func': func_body,
-                    'target': is_modified,
-                    'flaw_line_index': modified_function_names[func_name] if is_modified else None
-                }
-                # 将字典添加到待写入的函数信息列表
-                yield function_info  # 使用生成器返回每个函数的信息
-        else:
+        if file_guard:
+            file_guard.add(files=1, bytes=len(content) + len(parent_content))
+            file_guard.check('get_file_content')
+        with limit(file_guard, 'get_modified_functions'):
+            if change_detection == 'hash':
+                # 复用已读取的新旧版本，只有存在修改的方法时才读取 diff
+                modified = ex.hash_modified_methods(parent_content, content,
+                                                    lambda: ex.get_hunk_lines(commit_hash, file_path, repo_path),
+                                                    commit_hash, file_path, repo_path)
+            else:
+                modified = get_modified_functions(commit_hash, file_path, repo_path)  # 获取被修改的函数名称(字典，键为函数名，值为修改的行号列表)
+        if file_guard:
+            file_guard.check('get_modified_functions')
+        return file_path, file_guard, parent_content, modified
+
+    def parse(fetched):
+        """parse 阶段：提取父提交中的所有函数定义"""
+        file_path, file_guard, parent_content, modified = fetched
+        with tracing.span('extract_functions', 'parse', repo=repo, commit=commit_hash, file=file_path, bytes=len(parent_content)):
+            parent_functions = extract_functions(parent_content)
+        if file_guard:
+            file_guard.add(functions=len(parent_functions))
+            file_guard.check('extract_functions')
+        return parent_functions, modified
+
+    # 逐个处理 Java 文件：io 和解析在后台线程中流水执行，记录按文件顺序在当前线程生成
+    java_paths = [file_path for file_path in file_paths if file_path.endswith('java')]
+    pipeline = StagedPipeline([('io', fetch, io_workers), ('parse', parse, parse_workers)],
+                              queue_size=queue_size, metrics=metrics)
+    sample = sampler.commit(repo, commit_hash) if sampler is not None else None
+    for file_path, (parent_functions, modified) in pipeline.run(java_paths):
+        modified_function_names.update(modified)
+        if sample is not None:
+            sample.add_file(file_path, parent_functions, modified_function_names)
             continue
 
+        # 处理每个文件中的函数
+        for function_info in function_records(parent_functions, modified_function_names, index,
+                                              repo, commit_hash, file_path, with_meta, dedup):
+            index = function_info['idx']
+            yield function_info  # 使用生成器返回每个函数的信息
 
+    if unmodified is not None:
+        # 未修改文件的内容在父提交和当前提交中相同，取父提交与修改文件保持一致
+        if sample is not None:
+            sample.open()
+        # 排除列表用未经 file_filter 过滤的全部改动路径：被过滤掉的修改文件和重命名的源文件都不是负样本
+        with limit(guard, 'unmodified_files'):
+            changed_paths = get_changed_paths(repo_path, commit_hash)
+        for file_path, functions in unmodified.functions(f'{commit_hash}^', changed_paths, guard=guard):
+            if sample is not None:
+                sample.add_file(file_path, functions, {})
+                continue
+            for function_info in function_records(functions, {}, index, repo, commit_hash, file_path, with_meta, dedup):
+                index = function_info['idx']
+                yield function_info
 
-def main(input_file_path, output_file_path, base_path):
-    index = 0
-    function_info_list = []
+    if sample is not None:
+        for file_path, functions, flaw_lines in sample.files():
+            for function_info in function_records(functions, flaw_lines, index, repo, commit_hash, file_path,
+                                                  with_meta, dedup):
+                index = function_info['idx']
+                yield function_info
 
-    with open(input_file_path, 'r', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
-        urls = [row[3] for row in reader]
 
-    # 处理每个url
-    for i, url in enumerate(urls, start=1):
-        match = re.search(r'/([^/]+/[^/]+)/commit/', url)
-        if not match:
-            print(f"URL {url} does not match the expected pattern.")
-            continue
+def function_records(parent_functions, modified_function_names, index, repo, commit_hash, file_path,
+                     with_meta=False, dedup=None):
+    """
+    为一个文件的父版本函数生成输出记录。
+
+    :param parent_functions: extract_functions 的结果，{方法签名: 完整定义}
+    :param modified_function_names: {方法签名: 修改行号列表}
+    :param index: 上一条记录的编号
+    """
+    for func_name, func_body in parent_functions.items():
+        index += 1
+        # 判断函数是否被修改
+        if func_name in modified_function_names:
+            is_modified = 1 
+        else:
+            is_modified = 0
+
+        # 创建包含函数定义和修改标志的字典
+        function_info = {
+            'idx': index,
+            'func': func_body,
+            'target': is_modified,
+            'flaw_line_index': modified_function_names[func_name] if is_modified else None
+        }
+        if dedup is not None:
+            ref = dedup.ref(repo, file_path, func_body, index)
+            if ref is not None:
+                function_info['func'] = None
+                function_info['func_ref'] = ref
+        if with_meta:
+            function_info['repo'] = repo
+            function_info['commit'] = commit_hash
+            function_info['file'] = file_path
+        # 将字典添加到待写入的函数信息列表
+        yield function_info
 
-        repository_name = match.group(1)  # user/repo,如：hadoop/hadoop-common
-        repo = re.search(r'[^/]+$', repository_name).group()  # repo,如：hadoop-common
-        commit_hash = url.split('/')[-1]
 
-        repo_path = os.path.join(base_path, repo)  # 得到仓库的本地克隆目录
+
+def replay_records(commit_infos, index, dedup=False):
+    """
+    同一 commit 出现在多行时，把第一次计算得到的记录重新编号后再输出一次，不重新计算。
+    开启去重时，带主体的记录改为 func_ref 指向第一次输出的 idx，与重新计算的结果相同。
+
+    :param commit_infos: 该 commit 第一次输出的记录
+    :param index: 上一条记录的编号
+    """
+    for function_info in commit_infos:
+        index += 1
+        replayed = dict(function_info, idx=index)
+        if dedup and replayed.get('func') is not None:
+            replayed['func'] = None
+            replayed['func_ref'] = function_info['idx']
+        yield replayed
+
+
+@contextmanager
+def open_records(output_file_path, output_format='jsonl', append=False):
+    """
+    打开输出，返回写出一批记录（一个 commit 的记录列表）的函数，供 WriterThread 在写出线程中调用。
+
+    :param output_format: 'jsonl' 或 'shards'（output_file_path 为目录）
+    :param append: 为 True 时追加到已有的 jsonl 文件
+    """
+    if output_format == 'shards':
+        with FuncDatasetWriter(output_file_path) as writer:
+            def write_shards(function_infos):
+                with tracing.span('write records', 'write', file=output_file_path, records=len(function_infos)):
+                    for function_info in function_infos:
+                        function_info = dict(function_info)  # 记录可能仍被 computed 缓存，不修改原字典
+                        meta = [function_info.pop(key) for key in ('repo', 'commit', 'file')]
+                        writer.write(function_info, *meta)
+            yield write_shards
+        return
+
+    with open(output_file_path, 'a' if append else 'w', encoding='utf-8') as output_file:
+        def write_jsonl(function_infos):
+            with tracing.span('write records', 'write', file=output_file_path, records=len(function_infos)):
+                for function_info in function_infos:
+                    output_file.write(json.dumps(function_info) + '\n')
+        yield write_jsonl
+
+
+def last_output_idx(output_file_path):
+    """已有 jsonl 输出中最后一条记录的 idx；文件不存在或为空时返回 0"""
+    last = None
+    if os.path.exists(output_file_path):
+        with open(output_file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    last = line
+    return json.loads(last)['idx'] if last else 0
+
+
+def main(input_file_path, output_file_path, base_path, output_format='jsonl', dedup=False,
+         budget=None, quarantine=None, only_urls=None, only_indices=None, file_filter=None, io_workers=2, parse_workers=1, queue_size=8,
+         change_detection='lines', unmodified_files=False, negative_ratio=None, sample_scope='commit', sample_seed=0,
+         append=False):
+    """
+    :param output_format: 'jsonl' 输出单个 jsonl 文件；'shards' 输出分片二进制格式（output_file_path 为目录），见 func_dataset.py
+    :param dedup: 为 True 时同一仓库同一文件中重复出现的函数主体只输出一次，之后用 func_ref 引用；用 expand_records 还原
+    :param budget: Budget 对象，超出预算的 commit 不输出，记录到 quarantine
+    :param quarantine: Quarantine 对象，默认 dataset/quarantine.jsonl
+    :param only_urls: 只处理这些 url，此时不读取 input_file_path，行号为在 only_urls 中的位置
+    :param only_indices: 只处理 input_file_path 中这些行号（重跑隔离列表时使用）
+    :param append: 为 True 时追加到已有的 jsonl 输出末尾，idx 接着最后一条记录编号（重跑隔离列表时使用）
+    :param file_filter: file_filter.FilterConfig，跳过超大、生成和第三方文件，结束时打印每个仓库的跳过数
+    :param io_workers: 每个 commit 内读取 blob 和 diff 的线程数
+    :param parse_workers: 每个 commit 内解析的线程数
+    :param queue_size: 阶段之间（包括写出线程之前）有界队列的容量；结束时打印各阶段的队列深度和耗时
+    :param change_detection: 判断修改函数的方式，'lines' 或 'hash'，见 main_process
+    :param unmodified_files: 为 True 时同时输出仓库中未修改文件的函数（target=0），
+        同一仓库的连续 commit 之间只重新解析变化的文件（UnmodifiedFunctions）
+    :param negative_ratio: 不为 None 时每个修改函数只保留这么多个未修改函数（蓄水池抽样，见 NegativeSampler），
+        sample_scope 为 'commit' 或 'repo'，sample_seed 为随机种子
+    同一 (仓库, commit) 出现在多行时只计算一次，之后的行输出重新编号的同一批记录；
+    该 commit 超出预算时它的每一行都记入隔离列表
+    """
+    if append and output_format != 'jsonl':
+        raise ValueError("append is only supported for jsonl output")  # 分片格式的 idx 必须从头递增
+    # 影响输出内容的选项，随隔离记录保存，budget.py retry 时原样传回
+    run_options = {
+        'input_file_path': input_file_path, 'output_file_path': output_file_path, 'base_path': base_path,
+        'output_format': output_format, 'dedup': dedup, 'only_urls': list(only_urls) if only_urls is not None else None,
+        'file_filter': file_filter.to_dict() if file_filter is not None else None, 'change_detection': change_detection,
+        'unmodified_files': unmodified_files, 'negative_ratio': negative_ratio, 'sample_scope': sample_scope,
+        'sample_seed': sample_seed,
+    }
+    index = last_output_idx(output_file_path) if append else 0
+    with_meta = output_format == 'shards'
+    function_dedup = FunctionDedup() if dedup else None
+    if budget and quarantine is None:
+        quarantine = Quarantine()
+    filter_stats = ff.FilterStats() if file_filter is not None else None
+    stage_metrics = PipelineMetrics()
+    sampler = NegativeSampler(negative_ratio, sample_scope, sample_seed) if negative_ratio is not None else None
+
+    if only_urls is not None:
+        urls = list(only_urls)
+    else:
+        with open(input_file_path, 'r', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            urls = [row[3] for row in reader]
+    rows = [(i, url) for i, url in enumerate(urls, start=1) if only_indices is None or i in only_indices]
+
+    units = work_units.group_rows([url for _, url in rows])
+    print(work_units.report(units))
+    remaining = {}
+    for i, url in rows:
+        key = work_units.unit_key(url) or (None, i)
+        remaining[key] = remaining.get(key, 0) + 1
+    computed = {}  # 成功处理的工作单元 -> 第一次输出的记录。该单元的最后一行处理完后释放
+    quarantined = {}  # 超出预算的工作单元 -> BudgetExceeded；之后的行同样记入隔离列表
+    unmodified = None  # 当前仓库的 UnmodifiedFunctions，切换仓库时重建
+
+    # 记录按 commit 交给写出线程，边处理边写出；写出跟不上时在这里阻塞（背压），内存中最多积压 queue_size 个 commit
+    with open_records(output_file_path, output_format, append) as write_records, \
+            WriterThread(write_records, queue_size, stage_metrics) as writer:
+        # 处理每个url
+        for i, url in rows:
+            key = work_units.unit_key(url) or (None, i)
+            remaining[key] -= 1
+            if key in quarantined:
+                quarantine.add('getfunc', url, quarantined[key], budget, index=i, options=run_options)
+                continue
+            if key in computed:
+                commit_infos = computed[key] if remaining[key] else computed.pop(key)
+                if commit_infos:
+                    commit_infos = list(replay_records(commit_infos, index, dedup))
+                    writer.put(commit_infos)
+                    index = commit_infos[-1]['idx']
+                continue
+
+            match = re.search(r'/([^/]+/[^/]+)/commit/', url)
+            if not match:
+                print(f"URL {url} does not match the expected pattern.")
+                continue
+
+            repository_name = match.group(1)  # user/repo,如：hadoop/hadoop-common
+            repo = re.search(r'[^/]+$', repository_name).group()  # repo,如：hadoop-common
+            commit_hash = url.split('/')[-1]
+
+            repo_path = os.path.abspath(os.path.join(base_path, repo))  # 得到仓库的本地克隆目录
         
-        if(repo_path_exists("/data/vdetect/repo",repo)==False):
-            print(f"{repo}不在仓库里")
-            continue
+            if(repo_path_exists("/data/vdetect/repo",repo)==False):
+                print(f"{repo}不在仓库里")
+                continue
 
-        # 处理每个commit
-        for function_info in main_process(commit_hash, repo_path, index, output_file_path):
-            function_info_list.append(function_info)
+            if unmodified_files and (unmodified is None or unmodified.repo_path != repo_path):
+                if unmodified is not None:
+                    print(unmodified.report())
+                unmodified = UnmodifiedFunctions(repo_path)
 
-    #切换到脚本所在目录
-    script_path = os.path.abspath(__file__)
-    script_dir = os.path.dirname(script_path)
-    os.chdir(script_dir)
+            # 处理每个commit，整个commit成功后才写入结果；超出预算时丢弃该commit已产生的记录
+            commit_infos = []
+            try:
+                for function_info in main_process(commit_hash, repo_path, index, output_file_path, with_meta, function_dedup, budget,
+                                              file_filter, filter_stats, io_workers, parse_workers, queue_size,
+                                              stage_metrics, change_detection, unmodified, sampler):
+                    commit_infos.append(function_info)
+            except BudgetExceeded as e:
+                if function_dedup is not None:
+                    function_dedup.forget_after(index)
+                quarantined[key] = e
+                quarantine.add('getfunc', url, e, budget, index=i, options=run_options)
+                continue
+            if commit_infos:
+                writer.put(commit_infos)
+                index = commit_infos[-1]['idx']  # idx 在所有commit之间连续编号
+            if remaining[key]:
+                computed[key] = commit_infos  # 只缓存成功的结果
 
-    # 写入文件
-    with open(output_file_path, 'w', encoding='utf-8') as output_file:
-        for function_info in function_info_list:
-            output_file.write(json.dumps(function_info) + '\n')
+    if unmodified is not None:
+        print(unmodified.report())
+    if filter_stats is not None:
+        print(filter_stats.report())
+    if sampler is not None:
+        print(sampler.report())
+    print(stage_metrics.report())
 
 
 if __name__ == '__main__':
@@ -236,10 +707,19 @@ if __name__ == '__main__':
     # 对于仓库中的其他未修改文件(不在modified_file_path里的），遍历仓库获得这些文件的file_path，直接调用extract_functions函数，将结果写进jsonl文件里
     
     # ！！！！！！换一个思路：找到所有修改块（根据@@里的行号信息），然后到原文件中寻找修改块所在函数。  已解决
-    input_csv = r'dataset/veracode_fliter.csv' #输入文件                                         
-    output_file_path = r'dataset/output_getfunc_test.jsonl' #输出文件
-    base_path='../repo' #存放所有仓库的地方
-    main(input_csv, output_file_path,base_path)
+    input_csv = script_path('dataset', 'veracode_fliter.csv') #输入文件
+    output_file_path = script_path('dataset', 'output_getfunc_test.jsonl') #输出文件
+    base_path = script_path('..', 'repo') #存放所有仓库的地方
+    output_format = 'jsonl' # 'shards'：输出分片二进制格式到 dataset/output_getfunc_test.shards 目录
+    dedup = False # True：跨commit去重相同的函数主体（func_ref 引用首次出现的 idx）
+    unmodified_files = False # True：同时输出仓库中未修改文件的函数（target=0），连续commit只重新解析变化的文件
+    negative_ratio = None # 如 3：每个修改函数只保留 3 个未修改函数（按 commit 蓄水池抽样）；None 表示全部输出
+    budget = None # 如 Budget(commit_seconds=600, file_seconds=120, memory_mb=4096)：超出预算的commit记录到 dataset/quarantine.jsonl，用 python budget.py retry 重跑；None 表示不限
+    file_filter = None # 如 ff.FilterConfig(max_blob_bytes=512 * 1024, max_changed_lines=5000)：跳过超大、生成和第三方文件；None 表示不过滤
+    if output_format == 'shards':
+        output_file_path = script_path('dataset', 'output_getfunc_test.shards')
+    main(input_csv, output_file_path,base_path,output_format,dedup,budget,file_filter=file_filter,
+         unmodified_files=unmodified_files, negative_ratio=negative_ratio)
     print("结果已写入文件{output_file_path}.")                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                  
 
     
@@ -1,20 +1,12 @@
 import subprocess
 import json
-from pathlib import Path
-import tree_sitter
-from tree_sitter import Language, Parser
-import warnings
 import os
-import csv
 import re
-from concurrent.futures import ThreadPoolExecutor
-import requests
-import time
-from tempfile import TemporaryDirectory
 access_token = "your_token" 
-import shutil
-# 忽略 FutureWarning
-warnings.simplefilter('ignore', FutureWarning)
+from results_store import ResultsStore
+import tracing
+import work_units
+import java_grammar
 
 
 
@@ -26,15 +18,24 @@ def get_modified_java_files(diff_file_path):
     if os.path.exists(diff_file_path):
         # 打开并读取文件内容
         with open(diff_file_path, 'r') as file:
-            for line in file:
-                if line.startswith('diff --git'):
-                    # 获取文件的完整路径
-                    full_path = line.strip()
-                    # 检查是否以.java结尾且不为空
-                    if full_path.endswith('.java') and full_path:
-                        # 使用os.path.basename获取文件名
-                        filename = os.path.basename(full_path)
-                        modified_java_files.append(filename)
+            modified_java_files = modified_java_files_from_diff(file)
+
+    return modified_java_files
+
+
+
+def modified_java_files_from_diff(diff_lines):
+    """从diff内容（行的可迭代对象）中获取所有被修改的Java文件名，不包含文件夹路径。"""
+    modified_java_files = []
+    for line in diff_lines:
+        if line.startswith('diff --git'):
+            # 获取文件的完整路径
+            full_path = line.strip()
+            # 检查是否以.java结尾且不为空
+            if full_path.endswith('.java') and full_path:
+                # 使用os.path.basename获取文件名
+                filename = os.path.basename(full_path)
+                modified_java_files.append(filename)
 
     return modified_java_files
 
@@ -93,7 +94,8 @@ def run_find_map_test_cases(repo_path, repo_name, grammar_path, output_dir):
         f"--repo_path {repo_path} "
         f"--repo_name {repo_name} "
         f"--grammar {grammar_path} "
-        f"--output {output_dir}"
+        f"--output {output_dir} "
+        f"--lean"  # 只需要焦点方法签名
     ]
     
     # print(f"Running command: {command}")
@@ -139,9 +141,8 @@ def  extract_method_signatures(file_path):
     :return: 包含所有方法签名的列表
     """
     # 加载 Java 语法库
-    JAVA_LANGUAGE = Language('build/my-languages.so', 'java')
-    parser = Parser()
-    parser.set_language(JAVA_LANGUAGE)
+    JAVA_LANGUAGE = java_grammar.java_language()
+    parser = java_grammar.get_parser()
     # 读取要解析的 Java 文件
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
@@ -241,44 +242,89 @@ def extract_filename(test_filename):
 
 
 
+def testcase_flags(repo, repo_path, modified_java_files, modified_java_path, mapping):
+    """
+    判断每个修改的Java文件是否有对应的测试。
+
+    参数:
+        repo (str): 仓库名称。
+        repo_path (str): 仓库路径。
+        modified_java_files (list): 修改的Java文件名列表。
+        modified_java_path (list): 修改的Java文件路径列表（相对于仓库）。
+        mapping (list): find_map_test_cases 得到的焦点方法签名列表。
+
+    返回:
+        dict: 1：test文件存在，且在列表中；2：test文件存在，但不在列表中 0：test文件不存在
+    """
+    # 初始化结果字典
+    test_case_results = {file_name: 0 for file_name in modified_java_files}
+
+    # 先把所有 test 找出来并标记对应文件的 testcase
+    for java_file in modified_java_files:
+        filename = extract_filename(java_file)
+        if filename:
+            test_case_results[filename] = 1
+
+    # 再遍历 java 修改文件列表
+    for java_file in modified_java_files:
+        flag = 0
+        # 排除已经找到 test 的文件和 test 文件
+        if test_case_results[java_file] == 1 or extract_filename(java_file):
+            continue
+        else:
+            # 获得修改文件路径
+            java_file_path_list  = [path for path in modified_java_path if path.endswith(java_file)]
+            
+            if not java_file_path_list:
+                continue
+            else:
+                java_file_path = java_file_path_list[0]#理论上只有一个文件路径
+                java_file_path = repo_path + '/' + java_file_path
+               
+            with tracing.span('extract_method_signatures', 'parse', repo=repo, file=java_file_path):
+                method_signatures = extract_method_signatures(java_file_path)  # 获得方法列表
+            
+            for method_signature in method_signatures:
+                if method_exists(mapping, method_signature) == True:
+                    flag = 2  # 至少有一个焦点方法存在对应的测试用例
+                    break
+            # flag = 0 # 没有找到对应的测试用例
+            test_case_results[java_file] = flag
+
+    return test_case_results
+
+
+
 def main():
     base_path = 'E:/dachuang/github_clone'  # 存放所有仓库的目录
-    output_file = "E:/dachuang/output.csv"  # 输出文件
-    input_csv = "E:/dachuang/output.csv"  # 输入文件
+    output_file = "E:/dachuang/output.csv"  # 输出文件（由结果库导出）
+    results_db = "E:/dachuang/results.db"  # 结果库，data_processing.py 已写入各行
     output_dir = 'E:/dachuang/tmp/output/'  # 输出文件夹的路径
     grammar_path = 'E:/dachuang/build/my-languages.so'  # tree-sitter Java 语法文件的路径
 
-    urls = []
-    # 获取 CSV 文件里的 URLs
+    # 从结果库读取每行的 (index, repo, commit, url)，不再整体读入 CSV
     max_workers = 5
-    with open(input_csv) as csvfile:
-        reader = csv.reader(csvfile)
-        urls = [row[10] for row in reader]
-
+    store = ResultsStore(results_db)
+    rows = list(store.iter_rows(columns=['index', 'repo', 'url']))
 
-    # 加载 Java 语法库
-    JAVA_LANGUAGE = Language('build/my-languages.so', 'java')
-    parser = Parser()
-    parser.set_language(JAVA_LANGUAGE)
     
     # os.chdir(base_path)
-    header = ['index', 'cwe key word', 'matched key word', 'file', 'func', 'hunk', 'function_name', 'note', 'repo', 'branch', 'url', 'testcase']
-    
-    # 读取现有的 CSV 文件
-    existing_data = []
-    with open(output_file, mode='r', newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        existing_data = list(reader)
 
-    # 创建字典，以 URL 为键，testcase 结果为值
+    # 创建字典，以 (仓库, commit) 为键，testcase 结果为值
     testcase_results = {}
 
-    for url in urls:
+    for row in rows:
         # commit_hash = extract_commit_hash(url)
-        
+        url = row['url'] or ''
+
         match = re.search(r'/([^/]+/[^/]+)/commit/', url)
         if not match:
             continue
+        key = work_units.unit_key(url) or url
+        if key in testcase_results:
+            # 同一 (仓库, commit) 已计算过（可能出现在多个 CVE 行中），直接写入该行
+            store.upsert(row['index'], row['repo'], row['commit'], testcase=testcase_results[key])
+            continue
         repository_name = match.group(1)  # 获取 user/repo
         repo = re.search(r'[^/]+$', repository_name).group()  # 获取 repo
         print("处理仓库:", repo)
@@ -291,57 +337,20 @@ def main():
         modified_java_path = get_modified_java_path(base_path + '/' + repo)#已测试有效
         
         # 获得 mapping 列表
-        mapping = run_find_map_test_cases(repo_path, repo, grammar_path, output_dir)
+        with tracing.span('find_map_test_cases', 'map', repo=repo):
+            mapping = run_find_map_test_cases(repo_path, repo, grammar_path, output_dir)
         
-        # 初始化结果字典。1：test文件存在，且在列表中；2：test文件存在，但不在列表中 0：test文件不存在
-        test_case_results = {file_name: 0 for file_name in modified_java_files}
-
-        # 先把所有 test 找出来并标记对应文件的 testcase
-        for java_file in modified_java_files:
-            filename = extract_filename(java_file)
-            if filename:
-                test_case_results[filename] = 1
-
-        # 再遍历 java 修改文件列表
-        for java_file in modified_java_files:
-            flag = 0
-            # 排除已经找到 test 的文件和 test 文件
-            if test_case_results[java_file] == 1 or extract_filename(java_file):
-                continue
-            else:
-                # 获得修改文件路径
-                java_file_path_list  = [path for path in modified_java_path if path.endswith(java_file)]
-                
-                if not java_file_path_list:
-                    continue
-                else:
-                    java_file_path = java_file_path_list[0]#理论上只有一个文件路径
-                    java_file_path = base_path + '/' + repo + '/' + java_file_path
-                   
-                method_signatures = extract_method_signatures(java_file_path)  # 获得方法列表
-                
-                for method_signature in method_signatures:
-                    if method_exists(mapping, method_signature) == True:
-                        flag = 2  # 至少有一个焦点方法存在对应的测试用例
-                        break
-                # flag = 0 # 没有找到对应的测试用例
-                test_case_results[java_file] = flag
-
-        # 将当前 URL 的 testcase 结果保存到字典中
-        testcase_results[url] = test_case_results
+        test_case_results = testcase_flags(repo, repo_path, modified_java_files, modified_java_path, mapping)
+
+        # 将当前 commit 的 testcase 结果保存到字典中，并只更新该行的 testcase 列
+        testcase_results[key] = test_case_results
+        with tracing.span('upsert', 'write', repo=repo, commit=row['commit']):
+            store.upsert(row['index'], row['repo'], row['commit'], testcase=test_case_results)
         print(f"仓库{repo}的测试结果:{test_case_results}")
 
-    # 更新 CSV 文件中的 testcase 列
-    for row in existing_data:
-        url = row['url']
-        if url in testcase_results:
-            row['testcase'] = testcase_results[url]  # 更新 testcase 列
-
-    # 将更新后的数据写回 CSV 文件
-    with open(output_file, mode='w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=header)
-        writer.writeheader()
-        writer.writerows(existing_data)
+    # 从结果库重新生成 CSV
+    store.export_csv(output_file)
+    store.close()
 
     print(f"Testcase column has been updated in {output_file}")
 
@@ -0,0 +1,203 @@
+"""
+一个仓库只启动一个 git 进程的 commit diff 流。
+
+按 commit 调用 `git diff <commit>^..<commit>` 时，每个 commit 都要启动一次 git，并用 capture_output 整体读入输出。
+DiffTreeStream 把一个仓库所有要处理的 commit 交给同一个
+    git diff-tree --stdin -p -U3 --no-color -r -M --root --diff-merges=first-parent
+（后台线程写 stdin），每个 commit 之后再写一行结束标记 `:end <哈希>`（diff-tree 原样输出不是 commit 的行），
+从 stdout 逐行读取，遇到结束标记时切分出该 commit 的 diff；diff 为空的 commit 也有结束标记。
+每个 commit 的 diff 文本与 `git diff <commit>^..<commit>` 相同（-M 对应 git diff 默认的重命名检测，
+合并提交与第一个父提交比较），可直接交给 process_diff_output、split_diff_by_file / parse_hunk_lines。
+差异：根提交（没有父提交）git diff 输出为空，这里输出整个提交的内容。
+
+取走的 diff 保留到调用方 release() 为止，同一 commit 再次调用 diff() 返回同一文本；
+release 之后再请求该 commit 抛出 ValueError，而不是返回空字符串（调用方会误以为本地仓库损坏）。
+调用方按登记的顺序依次取 diff、用完即 release 时，内存中只有当前 commit 和最多 RECORD_QUEUE 个预读的 diff。
+stdout 由读取线程切分，diff() 在 git_util.time_limit() 范围内等待时以剩余预算为超时，
+超时时终止进程并抛出 subprocess.TimeoutExpired（budget.limit() 转为 BudgetExceeded），其余 commit 由重新启动的进程输出。
+"""
+
+import re
+import time
+import queue
+import threading
+import subprocess
+
+import tracing
+from git_util import git_popen, current_timeout
+from commit_meta import existing_commits
+
+COMMIT_LINE = re.compile(r'^(?:[0-9a-f]{40}|[0-9a-f]{64})$')
+# 每个 commit 之后的结束标记；-p 输出中的行都以 diff 前缀开头，不会以 ':' 开头
+END_LINE = re.compile(r'^:end ([0-9a-f]{40}|[0-9a-f]{64})$')
+RECORD_QUEUE = 4  # 读取线程最多预读的 commit 数
+_END = object()
+
+
+class DiffTreeStream():
+    """
+    :param repo_path: 仓库路径
+    :param commits: 要处理的 commit 哈希（可以是缩写），调用 diff() 的顺序与此一致时不需要缓存
+    """
+
+    def __init__(self, repo_path, commits):
+        self.repo_path = repo_path
+        self.commits = list(dict.fromkeys(c.lower() for c in commits))
+        self.process = None
+        self.records = None  # 读取线程切分出的 (完整哈希, diff 文本)，有界队列，结束时为 _END
+        self.stop = None
+        self.finished = False  # 当前进程的输出已经读完
+        self.full = None  # 输入的哈希 -> 完整哈希，第一次 diff() 时查询
+        self.queued = set()  # 交给当前进程的完整哈希
+        self.pending = {}  # 已读出但还没有被取走的 {完整哈希: diff 文本}
+        self.taken = {}  # 已被取走、还没有 release 的 {完整哈希: diff 文本}
+        self.holders = {}  # 完整哈希 -> 还没有 release 的输入哈希（同一 commit 可能以不同缩写登记）
+        self.released = set()  # 已经 release 的完整哈希
+        self.expired = set()  # 读取超时的完整哈希，重启的进程不再包含它们
+        self.stats = {'commits': 0, 'bytes': 0, 'processes': 0}
+
+    def _resolve(self):
+        if self.full is None:
+            self.full = existing_commits(self.repo_path, self.commits)
+            for commit_hash, full in self.full.items():
+                self.holders.setdefault(full, set()).add(commit_hash)
+
+    def _start(self):
+        """为还没有读出的 commit 启动 diff-tree 进程（第一次，或上一个进程超时被终止之后）"""
+        skip = set(self.pending) | set(self.taken) | self.released | self.expired
+        ordered = list(dict.fromkeys(self.full[c] for c in self.commits if c in self.full and self.full[c] not in skip))
+        self.queued = set(ordered)
+        process = git_popen(self.repo_path, 'diff-tree', '--stdin', '-p', '-U3', '--no-color', '-r', '-M', '--root',
+                            '--diff-merges=first-parent',
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def feed():
+            try:
+                for commit_hash in ordered:
+                    process.stdin.write(f'{commit_hash}\n:end {commit_hash}\n'.encode('ascii'))
+                    process.stdin.flush()
+                process.stdin.close()
+            except (BrokenPipeError, ValueError, OSError):
+                pass  # 提前 close() 或进程被终止
+
+        self.process = process
+        self.stop = threading.Event()
+        self.records = queue.Queue(RECORD_QUEUE)
+        self.finished = False
+        self.stats['processes'] += 1
+        threading.Thread(target=feed, name='diff-tree-stdin', daemon=True).start()
+        threading.Thread(target=self._read_records, args=(process, self.records, self.stop),
+                         name='diff-tree-stdout', daemon=True).start()
+
+    @staticmethod
+    def _read_records(process, records, stop):
+        """读取线程：逐行读取 stdout，每遇到一个结束标记把 (完整哈希, diff 文本) 放入 records"""
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    records.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        lines = []
+        try:
+            for raw in process.stdout:
+                line = raw.decode('utf-8', errors='ignore')
+                end = END_LINE.match(line.rstrip('\n'))
+                if end is None:
+                    lines.append(line)
+                    continue
+                if lines and COMMIT_LINE.match(lines[0].rstrip('\n')):
+                    lines = lines[1:]  # diff-tree 在 diff 之前输出的 commit 哈希行
+                if not put((end.group(1), ''.join(lines))):
+                    return
+                lines = []
+        except (OSError, ValueError):
+            pass  # 进程被终止
+        finally:
+            put(_END)
+            process.wait()
+
+    def diff(self, commit_hash):
+        """
+        commit 的 diff 文本；commit 不存在、diff 为空或未登记时返回空字符串（与 git diff 失败时相同）。
+        同一 commit 在 release() 之前可以重复获取；release 之后再获取抛出 ValueError。
+        在 git_util.time_limit() 范围内（如 budget.limit()）以剩余时间为读取超时：超时时终止 diff-tree 进程，
+        抛出 subprocess.TimeoutExpired，之后的 commit 由重新启动的进程输出。
+        """
+        self._resolve()
+        full = self.full.get(commit_hash.lower())
+        if full is None:
+            return ''
+        if full in self.released:
+            raise ValueError(f"diff of {commit_hash} was already released")
+        if full in self.expired:
+            raise subprocess.TimeoutExpired(['git', 'diff-tree', '--stdin', full], 0)
+        if full in self.taken:
+            return self.taken[full]
+        with tracing.span('git diff-tree --stdin', 'git', repo=self.repo_path, commit=commit_hash) as sp:
+            diff_output = self._take(full, current_timeout())
+            sp['bytes'] = len(diff_output)
+        self.stats['commits'] += 1
+        self.stats['bytes'] += len(diff_output)
+        self.taken[full] = diff_output
+        return diff_output
+
+    def _take(self, full, timeout=None):
+        if full in self.pending:
+            return self.pending.pop(full)
+        if self.process is None:
+            self._start()
+        if full not in self.queued:
+            return ''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.finished:
+            try:
+                record = self.records.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                self._expire(full)
+                raise subprocess.TimeoutExpired(['git', 'diff-tree', '--stdin', full], timeout) from None
+            if record is _END:
+                self.finished = True
+                break
+            commit_hash, diff_output = record
+            if commit_hash == full:
+                return diff_output
+            self.pending[commit_hash] = diff_output
+        return ''
+
+    def _expire(self, full):
+        """读取超时：终止当前进程，下一次 diff() 为其余还没有读出的 commit 重新启动"""
+        self.expired.add(full)
+        self._kill()
+        self.process = None
+
+    def _kill(self):
+        if self.stop is not None:
+            self.stop.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def release(self, commit_hash):
+        """调用方不再需要该 commit 的 diff；登记的所有缩写都 release 之后才释放文本"""
+        full = (self.full or {}).get(commit_hash.lower())
+        if full is None:
+            return
+        holders = self.holders.get(full, set())
+        holders.discard(commit_hash.lower())
+        if not holders:
+            self.taken.pop(full, None)
+            self.pending.pop(full, None)
+            self.released.add(full)
+
+    def close(self):
+        self._kill()
+        self.pending.clear()
+        self.taken.clear()
+
+    def report(self):
+        return f"diff-tree stream {self.repo_path}: {self.stats['commits']} commits, {self.stats['bytes']} bytes, {self.stats['processes']} process(es)"
@@ -2,6 +2,13 @@ import re
 import subprocess
 import os
 from typing import List, Tuple
+from bisect import bisect_right
+import hashlib
+import tracing
+from git_util import git, git_popen
+
+# get_modified_methods 判断修改方法的方式，见 hash_modified_methods
+CHANGE_DETECTION_MODES = ('lines', 'hash')
 
 def is_comment(stripped_line):
     # 检查是否为单行注释
@@ -45,12 +52,11 @@ def get_hunk_lines(commit_hash: str, file_path: str, repo_path: str) -> Tuple[Li
         - old_lines: 旧版本被删除的具体行号（每个 `-` 行）
         - new_lines: 新版本新增的具体行号（每个 `+` 行）
     """
-    # repo_path = "E:/dachuang2024/tmp/tmp/hadoop"
-    # print("Current working directory:", os.getcwd())
-    # if(repo_path != os.getcwd()):
-    #      os.chdir(repo_path)
-    cmd = ["git", "diff", commit_hash + "^!", "--", file_path]
-    diff_output = subprocess.run(cmd, capture_output=True, text=True).stdout
+    diff_output = git(repo_path, "diff", commit_hash + "^!", "--", file_path, commit=commit_hash, file=file_path).stdout
+    return parse_hunk_lines(diff_output)
+
+def parse_hunk_lines(diff_output: str) -> Tuple[List[int], List[int]]:
+    """从单个文件的 diff 文本中解析修改前后的行号（见 get_hunk_lines）"""
     lines = diff_output.split("\n")
     
     old_lines = []
@@ -87,13 +93,297 @@ def get_hunk_lines(commit_hash: str, file_path: str, repo_path: str) -> Tuple[Li
 
     return old_lines, new_lines
 
+def split_diff_by_file(diff_output: str) -> dict:
+    """
+    把整个 commit 的 diff 按文件拆分。
+
+    :return: {文件路径(b/ 侧，删除的文件取 a/ 侧): 该文件的 diff 文本}
+    """
+    file_diffs = {}
+    current_path = None
+    current_lines = []
+    for line in diff_output.split("\n"):
+        if line.startswith("diff --git "):
+            if current_path is not None:
+                file_diffs[current_path] = "\n".join(current_lines)
+            match = re.match(r'diff --git a/(.*) b/(.*)$', line)
+            current_path = match.group(2) if match else line
+            current_lines = [line]
+            continue
+        if current_path is None:
+            continue
+        if line == "+++ /dev/null" and current_lines:
+            # 删除的文件，使用 a/ 侧路径
+            old = [l for l in current_lines if l.startswith("--- a/")]
+            if old:
+                current_path = old[0][len("--- a/"):]
+        current_lines.append(line)
+    if current_path is not None:
+        file_diffs[current_path] = "\n".join(current_lines)
+    return file_diffs
+
+
+def diff_paths(diff_output: str) -> set:
+    """
+    diff 中出现的所有文件路径，包括两侧：重命名和复制的源路径、删除的文件都在内。
+
+    :return: 路径集合
+    """
+    paths = set()
+    for line in diff_output.split("\n"):
+        if line.startswith("diff --git "):
+            match = re.match(r'diff --git a/(.*) b/(.*)$', line)
+            if match:
+                paths.update(match.groups())
+        elif line.startswith(("--- a/", "+++ b/")):
+            paths.add(line[len("--- a/"):])
+        elif line.startswith(("rename from ", "rename to ", "copy from ", "copy to ")):
+            paths.add(line.split(" ", 2)[2])
+    return paths
+
 import re
 from typing import List, Tuple
 import re
 from typing import List, Tuple
 
+# 扫描器关心的字符：字符串/字符字面量、注释、花括号、语句结束
+_SCAN_SPECIAL = re.compile(r'["\'/{};]')
+_CONTROL_KEYWORDS = {'if', 'else', 'for', 'while', 'switch', 'catch', 'finally', 'try', 'do', 'synchronized',
+                     'return', 'throw', 'new', 'assert'}
+_TYPE_KEYWORDS = {'class', 'interface', 'enum', 'record'}
+
+
+def _skip_string(src: str, pos: int) -> int:
+    """pos 指向开头的引号，返回字面量结束之后的位置（支持 \"\"\" 文本块）"""
+    if src.startswith('"""', pos):
+        end = pos + 3
+        while True:
+            end = src.find('"""', end)
+            if end == -1:
+                return len(src)
+            backslashes = 0
+            while src[end - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                return end + 3
+            end += 1
+    quote = src[pos]
+    end = pos + 1
+    length = len(src)
+    while end < length:
+        char = src[end]
+        if char == '\\':
+            end += 2
+            continue
+        if char == quote or char == '\n':  # 未闭合的字面量在行尾结束
+            return end + 1
+        end += 1
+    return length
+
+
+def _header_tokens(header: str):
+    """把成员声明头切分为 (词, 起始位置)：标识符、字符串和单个符号，注解整体跳过"""
+    tokens = []
+    pos = 0
+    length = len(header)
+    while pos < length:
+        char = header[pos]
+        if char.isspace():
+            pos += 1
+        elif char.isalnum() or char in '_$':
+            end = pos + 1
+            while end < length and (header[end].isalnum() or header[end] in '_$'):
+                end += 1
+            tokens.append((header[pos:end], pos))
+            pos = end
+        elif char in '"\'':
+            end = _skip_string(header, pos)
+            tokens.append(('""', pos))
+            pos = end
+        elif char == '@' and not header.startswith('interface', pos + 1):
+            # 注解：@Name、@a.b.Name，可带括号参数
+            end = pos + 1
+            while end < length and (header[end].isalnum() or header[end] in '_$.'):
+                end += 1
+            rest = end
+            while rest < length and header[rest].isspace():
+                rest += 1
+            if rest < length and header[rest] == '(':
+                depth = 0
+                while rest < length:
+                    if header[rest] in '"\'':
+                        rest = _skip_string(header, rest)
+                        continue
+                    if header[rest] == '(':
+                        depth += 1
+                    elif header[rest] == ')':
+                        depth -= 1
+                        if depth == 0:
+                            rest += 1
+                            break
+                    rest += 1
+                end = rest
+            pos = end
+        else:
+            tokens.append((char, pos))
+            pos += 1
+    return tokens
+
+
+def _classify_header(header: str, type_name: str):
+    """
+    判断 `{` 之前的成员声明头。
+
+    :param type_name: 所在类型的名称，用于识别没有修饰符的构造函数
+    :return: ('type', 类型名) / ('method', 方法签名) / ('block', None)（初始化块、字段初始化中的匿名类等）
+    """
+    tokens = _header_tokens(header)
+    while tokens and tokens[0][0] == ',':
+        tokens = tokens[1:]  # 枚举常量之间的逗号
+    words = [text for text, _ in tokens]
+    for k, word in enumerate(words):
+        if word == '(':
+            break
+        if word in _TYPE_KEYWORDS and k + 1 < len(words) and words[k + 1][0].isidentifier():
+            return 'type', words[k + 1]
+
+    if '(' not in words:
+        return 'block', None
+    open_index = words.index('(')
+    prefix = words[:open_index]
+    if not prefix:
+        return 'block', None
+    name = prefix[-1]
+    if not (name[0].isalpha() or name[0] in '_$') or name in _CONTROL_KEYWORDS:
+        return 'block', None
+    if '=' in prefix or '-' in prefix or (len(prefix) > 1 and prefix[-2] in ('new', '.')):
+        return 'block', None
+    if len(prefix) == 1 and name != type_name:
+        return 'block', None  # 枚举常量的类体等
+
+    # 参数列表：到匹配的右括号为止
+    depth = 0
+    close_index = None
+    for k in range(open_index, len(words)):
+        if words[k] == '(':
+            depth += 1
+        elif words[k] == ')':
+            depth -= 1
+            if depth == 0:
+                close_index = k
+                break
+    if close_index is None:
+        return 'block', None
+    # 右括号之后只允许数组维度和 throws 子句
+    rest = words[close_index + 1:]
+    if rest and rest[0] not in ('throws', '['):
+        return 'block', None
+    if rest and rest[0] == 'throws' and any(word in ('(', ')', '=', '-', '{') for word in rest):
+        return 'block', None
+
+    params = header[tokens[open_index][1] + 1:tokens[close_index][1]]
+    params = " ".join(line.strip() for line in params.split("\n"))  # 与逐行拼接方法头时相同
+    return 'method', normalize_method_signature(f"{name}({params})")
+
+
 def extract_method_ranges(file_content: str) -> List[Tuple[str, int, int]]:
-    """从 Java 代码中提取方法的名称、起始行号和结束行号"""
+    """
+    从 Java 代码中提取方法的名称、起始行号和结束行号。
+
+    单遍字符级扫描：跳过注释、字符串/字符字面量和文本块，按花括号层次区分类型体、方法体和其他代码块，
+    只在类型体中识别成员声明头（注解、泛型返回值、多行参数、throws 子句），不对累积的文本反复做正则匹配，
+    耗时与文件长度成线性关系。
+    起始行为方法体 `{` 所在行，结束行为匹配的 `}` 所在行；方法签名为 方法名(参数列表)，经 normalize_method_signature 规范化。
+    嵌套在方法体内的方法（匿名类、局部类）不单独输出。
+    """
+    src = file_content
+    line_starts = [0]
+    newline = src.find('\n')
+    while newline != -1:
+        line_starts.append(newline + 1)
+        newline = src.find('\n', newline + 1)
+
+    def line_of(pos):
+        return bisect_right(line_starts, pos)
+
+    method_ranges = []
+    types = []  # 当前嵌套的类型名；为空时在文件顶层
+    header_start = 0  # 当前成员声明头的起始位置
+    comments = []  # 当前声明头中的注释区间，拼接声明头时去掉
+    skip_depth = 0  # >0 时位于方法体或其他代码块中，只做花括号配对
+    current_method = None  # (签名, 起始行)，在其他代码块中时为 None
+
+    pos = 0
+    length = len(src)
+    while True:
+        match = _SCAN_SPECIAL.search(src, pos)
+        if match is None:
+            break
+        pos = match.start()
+        char = src[pos]
+
+        if char == '"' or char == "'":
+            pos = _skip_string(src, pos)
+            continue
+        if char == '/':
+            following = src[pos + 1:pos + 2]
+            if following == '/':
+                end = src.find('\n', pos)
+                end = length if end == -1 else end
+            elif following == '*':
+                end = src.find('*/', pos + 2)
+                end = length if end == -1 else end + 2
+            else:
+                pos += 1
+                continue
+            if not skip_depth:
+                comments.append((pos, end))
+            pos = end
+            continue
+
+        if skip_depth:
+            if char == '{':
+                skip_depth += 1
+            elif char == '}':
+                skip_depth -= 1
+                if skip_depth == 0:
+                    if current_method is not None:
+                        method_ranges.append((current_method[0], current_method[1], line_of(pos)))
+                        current_method = None
+                    header_start, comments = pos + 1, []
+            pos += 1
+            continue
+
+        if char == '{':
+            pieces = []
+            last = header_start
+            for start, end in comments:
+                pieces.append(src[last:start])
+                pieces.append(' ')
+                last = end
+            pieces.append(src[last:pos])
+            kind, value = _classify_header(''.join(pieces), types[-1] if types else None)
+            if kind == 'type':
+                types.append(value)
+            else:
+                skip_depth = 1
+                if kind == 'method':
+                    current_method = (value, line_of(pos))
+        elif char == '}':
+            if types:
+                types.pop()
+        header_start, comments = pos + 1, []
+        pos += 1
+
+    return method_ranges
+
+
+def extract_method_ranges_regex(file_content: str) -> List[Tuple[str, int, int]]:
+    """
+    旧的逐行正则实现，仅用于与 extract_method_ranges 对比（python benchmark.py ranges）。
+    每遇到 `{` 就对累积的 buffer 重新做一次正则匹配，长文件上接近二次复杂度；
+    另外会漏掉泛型返回值、与注解写在同一行的方法头，并把字符串中的花括号计入配对。
+    """
     lines = file_content.split("\n")
     
     # Java 方法定义匹配（支持泛型方法、静态方法等）
@@ -203,48 +493,168 @@ def extract_method_ranges(file_content: str) -> List[Tuple[str, int, int]]:
 
 def get_file_content(commit_hash: str, file_path: str, repo_path: str) -> str:
     """获取指定 commit 版本的 Java 文件内容"""
-    # repo_path = "E:/dachuang2024/tmp/tmp/hadoop"
-    # print("Current working directory:", os.getcwd())
-    # if(repo_path != os.getcwd()):
-    #     os.chdir(repo_path)
-    cmd = ["git", "show", f"{commit_hash}:{file_path}"]
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    result = git(repo_path, "show", f"{commit_hash}:{file_path}", stage='blob', commit=commit_hash, file=file_path)
     return result.stdout if result.returncode == 0 else ""
 
-def get_modified_methods(commit_hash: str, file_path: str, repo_path: str):
+class CatFileBatch():
+    """常驻的 `git cat-file --batch` 进程，连续读取同一仓库的多个 blob 时避免每次启动 git"""
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.process = git_popen(repo_path, "cat-file", "--batch",
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def read(self, commit_hash: str, file_path: str) -> str:
+        """获取指定 commit 版本的文件内容，不存在时返回空字符串（同 get_file_content）"""
+        with tracing.span('cat-file --batch', 'blob', repo=self.repo_path, commit=commit_hash, file=file_path) as sp:
+            self.process.stdin.write(f"{commit_hash}:{file_path}\n".encode('utf-8'))
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().decode('utf-8', errors='ignore').split()
+            if len(header) != 3 or header[1] == 'missing':
+                return ""
+            size = int(header[2])
+            data = self.process.stdout.read(size)
+            self.process.stdout.read(1)  # 结尾的换行
+            sp['bytes'] = size
+        if header[1] != 'blob':
+            return ""
+        return data.decode('utf-8', errors='ignore')
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+def get_modified_methods(commit_hash: str, file_path: str, repo_path: str, mode: str = 'lines'):
     """获取受影响的方法，并记录每个方法内的修改行号（基于新旧版本对比）
 
+    :param mode: 'lines' 把 diff 的修改行映射到方法；'hash' 比较方法主体的哈希，见 hash_modified_methods
     Returns:
         method_changes: { 方法签名: [修改行号列表] }
     """
-    old_lines, new_lines = get_hunk_lines(commit_hash, file_path,repo_path)
-
+    if mode not in CHANGE_DETECTION_MODES:
+        raise ValueError(f"unknown change detection mode: {mode}")
     # 获取旧版本和新版本的代码
     old_code = get_file_content(f"{commit_hash}^", file_path,repo_path)  # 旧版本
     new_code = get_file_content(commit_hash, file_path,repo_path)  # 新版本
+    if mode == 'hash':
+        return hash_modified_methods(old_code, new_code, lambda: get_hunk_lines(commit_hash, file_path, repo_path),
+                                     commit_hash, file_path, repo_path)
+
+    old_lines, new_lines = get_hunk_lines(commit_hash, file_path,repo_path)
+
+    return map_modified_methods(old_code, new_code, old_lines, new_lines, commit_hash, file_path, repo_path)
+
+def map_modified_methods(old_code: str, new_code: str, old_lines: List[int], new_lines: List[int],
+                         commit_hash: str = '', file_path: str = '', repo_path: str = ''):
+    """在已获取的新旧版本代码上，把修改行映射到所属方法（get_modified_methods 的后半部分，供已有 blob 和 diff 的调用方复用）
 
+    Returns:
+        method_changes: { 方法签名: [修改行号列表] }
+    """
     # 提取方法范围
-    old_methods = extract_method_ranges(old_code)
-    new_methods = extract_method_ranges(new_code)
-
-    method_changes = {}
-
-    # 在旧版本中查找 `-` 删除行所属的方法
-    for hunk in old_lines:
-        for method_name, start, end in old_methods:
-            if start <= hunk <= end:
-                if method_name not in method_changes:
-                    method_changes[method_name] = []
-                method_changes[method_name].append(hunk - start + 1)  # 计算相对行号
-
-    # 在新版本中查找 `+` 新增行所属的方法
-    for hunk in new_lines:
-        for method_name, start, end in new_methods:
-            if start <= hunk <= end:
-                if method_name not in method_changes:
-                    method_changes[method_name] = []
-                method_changes[method_name].append(hunk - start + 1)  # 计算相对行号
+    with tracing.span('extract_method_ranges', 'parse', repo=repo_path, commit=commit_hash, file=file_path,
+                      bytes=len(old_code) + len(new_code)):
+        old_methods = extract_method_ranges(old_code)
+        new_methods = extract_method_ranges(new_code)
+
+    with tracing.span('map hunk lines', 'map', repo=repo_path, commit=commit_hash, file=file_path):
+        method_changes = {}
+
+        # 在旧版本中查找 `-` 删除行所属的方法
+        for hunk in old_lines:
+            for method_name, start, end in old_methods:
+                if start <= hunk <= end:
+                    if method_name not in method_changes:
+                        method_changes[method_name] = []
+                    method_changes[method_name].append(hunk - start + 1)  # 计算相对行号
+
+        # 在新版本中查找 `+` 新增行所属的方法
+        for hunk in new_lines:
+            for method_name, start, end in new_methods:
+                if start <= hunk <= end:
+                    if method_name not in method_changes:
+                        method_changes[method_name] = []
+                    method_changes[method_name].append(hunk - start + 1)  # 计算相对行号
+
+    return method_changes
+
+# 哈希模式下规范化方法主体：字符串字面量保持原样，注释丢弃，其余部分按词切分
+_BODY_TOKEN = re.compile(r'"|\'|//|/\*')
+_CODE_WORD = re.compile(r'[\w$]+|\S')
+
+
+def normalize_method_body(text: str) -> str:
+    """去掉注释、统一空白后的方法源码：只改了缩进、换行、空格或注释的两个版本结果相同"""
+    words = []
+    pos = 0
+    length = len(text)
+    while pos < length:
+        match = _BODY_TOKEN.search(text, pos)
+        end = match.start() if match else length
+        words.extend(_CODE_WORD.findall(text, pos, end))
+        if match is None:
+            break
+        token = match.group()
+        if token == '//':
+            newline = text.find('\n', end)
+            pos = length if newline == -1 else newline
+        elif token == '/*':
+            close = text.find('*/', end + 2)
+            pos = length if close == -1 else close + 2
+        else:
+            pos = _skip_string(text, end)
+            words.append(text[end:pos])
+    return ' '.join(words)
+
+
+def method_body_hashes(file_content: str, method_ranges: List[Tuple[str, int, int]] = None) -> dict:
+    """
+    :param method_ranges: extract_method_ranges 的结果，不传则重新提取
+    :return: {方法签名: 规范化方法源码（起始行到结束行）的 sha1}；同一签名出现多次（如内部类中）时合并为一个哈希
+    """
+    if method_ranges is None:
+        method_ranges = extract_method_ranges(file_content)
+    lines = file_content.split("\n")
+    digests = {}
+    for method_name, start, end in method_ranges:
+        if method_name not in digests:
+            digests[method_name] = hashlib.sha1()
+        digests[method_name].update(normalize_method_body("\n".join(lines[start - 1:end])).encode('utf-8'))
+        digests[method_name].update(b'\0')
+    return {method_name: digest.hexdigest() for method_name, digest in digests.items()}
+
+
+def hash_modified_methods(old_code: str, new_code: str, hunk_lines=None,
+                          commit_hash: str = '', file_path: str = '', repo_path: str = ''):
+    """
+    按方法主体哈希判断修改的方法：新旧版本中哈希不同、新增或删除的签名即为修改的方法。
+    不需要先解析 diff；只改了空白或注释的方法不算修改。
+    只有存在修改的方法时才调用 hunk_lines 获取 diff 行号，并且只为这些方法计算修改行号。
+
+    :param hunk_lines: 无参函数，返回 (old_lines, new_lines)，如 lambda: get_hunk_lines(...)；不传时修改行号为空列表
+    Returns:
+        method_changes: { 方法签名: [修改行号列表] }，修改行号的计算方式与 map_modified_methods 相同
+    """
+    with tracing.span('method hashes', 'parse', repo=repo_path, commit=commit_hash, file=file_path,
+                      bytes=len(old_code) + len(new_code)):
+        old_methods = extract_method_ranges(old_code)
+        new_methods = extract_method_ranges(new_code)
+        old_hashes = method_body_hashes(old_code, old_methods)
+        new_hashes = method_body_hashes(new_code, new_methods)
+    method_changes = {method_name: [] for method_name in list(old_hashes) + list(new_hashes)
+                      if old_hashes.get(method_name) != new_hashes.get(method_name)}
+    if not method_changes or hunk_lines is None:
+        return method_changes
 
+    old_lines, new_lines = hunk_lines()
+    with tracing.span('map hunk lines', 'map', repo=repo_path, commit=commit_hash, file=file_path):
+        for lines, methods in ((old_lines, old_methods), (new_lines, new_methods)):
+            methods = [method for method in methods if method[0] in method_changes]
+            for hunk in lines:
+                for method_name, start, end in methods:
+                    if start <= hunk <= end:
+                        method_changes[method_name].append(hunk - start + 1)  # 计算相对行号
     return method_changes
 
 # 示例调用
@@ -0,0 +1,199 @@
+"""
+在读取任何 blob 之前过滤超大、自动生成和第三方（vendored）的 Java 文件。
+
+判断依据（按开销从低到高）：
+1. 路径：generated-sources、vendor、third_party、*.pb.java 等
+2. git diff --numstat 的修改行数
+3. git cat-file --batch-check 得到的新旧版本 blob 大小
+4. 文件头：只读取前几 KB，查找 @Generated、DO NOT EDIT 等标记
+被跳过的文件按仓库和原因计数，main 结束时可打印报告。
+"""
+
+import re
+import subprocess
+from collections import defaultdict
+
+import tracing
+from git_util import git, git_popen
+
+DEFAULT_PATH_PATTERNS = [
+    r'(^|/)generated(-sources)?/',
+    r'(^|/)gen-src/',
+    # target/、external/ 也可能是普通的源码包名（如 org/foo/target/），只匹配仓库根目录或 Maven 的构建输出目录
+    r'^target/',
+    r'(^|/)target/(test-)?classes/',
+    r'(^|/)build/generated/',
+    r'(^|/)vendor(ed)?/',
+    r'(^|/)third[_-]?party/',
+    r'^external/',
+    r'\.pb\.java$',
+    r'(Grpc|OuterClass)\.java$',
+]
+
+DEFAULT_HEADER_MARKERS = [
+    '@Generated',
+    '@javax.annotation.Generated',
+    'DO NOT EDIT',
+    'Generated by the protocol buffer compiler',
+    'Generated By:JavaCC',
+    'generated by ANTLR',
+    'This file was automatically generated',
+    'Autogenerated by Thrift',
+]
+
+
+class FilterConfig():
+    """
+    预过滤阈值配置。
+
+    :param max_blob_bytes: 新旧版本任一 blob 超过该大小则跳过，None 表示不限
+    :param max_changed_lines: numstat 中增删行数之和超过该值则跳过，None 表示不限
+    :param path_patterns: 路径正则列表，匹配即跳过
+    :param header_markers: 文件头中出现任一标记即视为生成代码
+    :param header_bytes: 检查文件头时读取的字节数，0 表示不检查文件头
+    """
+
+    def __init__(self, max_blob_bytes=512 * 1024, max_changed_lines=5000, path_patterns=None,
+                 header_markers=None, header_bytes=2048):
+        self.max_blob_bytes = max_blob_bytes
+        self.max_changed_lines = max_changed_lines
+        self.path_patterns = [re.compile(p) for p in (DEFAULT_PATH_PATTERNS if path_patterns is None else path_patterns)]
+        self.header_markers = DEFAULT_HEADER_MARKERS if header_markers is None else header_markers
+        self.header_bytes = header_bytes
+
+    def to_dict(self):
+        return {'max_blob_bytes': self.max_blob_bytes, 'max_changed_lines': self.max_changed_lines,
+                'path_patterns': [p.pattern for p in self.path_patterns], 'header_markers': list(self.header_markers),
+                'header_bytes': self.header_bytes}
+
+    @staticmethod
+    def from_dict(data):
+        return FilterConfig(**data)
+
+
+class FilterStats():
+    """按仓库统计保留和跳过的文件数"""
+
+    def __init__(self):
+        self.kept = defaultdict(int)
+        self.skipped = defaultdict(lambda: defaultdict(int))
+
+    def keep(self, repo):
+        self.kept[repo] += 1
+
+    def skip(self, repo, reason, file_path):
+        self.skipped[repo][reason] += 1
+        print(f"Skipping {file_path} ({reason})")
+
+    def report(self):
+        lines = [f"{'repo':<32}{'kept':>8}{'path':>8}{'numstat':>9}{'size':>8}{'header':>8}"]
+        for repo in sorted(set(self.kept) | set(self.skipped)):
+            s = self.skipped[repo]
+            lines.append(f"{repo:<32}{self.kept[repo]:>8}{s['path']:>8}{s['numstat']:>9}{s['size']:>8}{s['header']:>8}")
+        return '\n'.join(lines)
+
+
+def get_numstat(repo_path, commit_hash):
+    """git diff --numstat，返回 {文件路径: 增删行数之和}；二进制文件记为 None"""
+    result = git(repo_path, 'diff', '--numstat', f'{commit_hash}^', commit_hash, name='git diff --numstat',
+                 commit=commit_hash)
+    changes = {}
+    for line in result.stdout.splitlines():
+        parts = line.split('\t')
+        if len(parts) != 3:
+            continue
+        added, deleted, path = parts
+        changes[path] = None if added == '-' else int(added) + int(deleted)
+    return changes
+
+
+def get_blob_sizes(repo_path, specs):
+    """
+    git cat-file --batch-check，一次查询多个对象的大小。
+
+    :param specs: 对象名列表，如 ['abc123^:src/A.java', 'abc123:src/A.java']
+    :return: {对象名: 大小}，不存在的对象记为 0
+    """
+    if not specs:
+        return {}
+    result = git(repo_path, 'cat-file', '--batch-check=%(objectsize)', input='\n'.join(specs) + '\n',
+                 name='git cat-file --batch-check', objects=len(specs))
+    sizes = {}
+    for spec, line in zip(specs, result.stdout.splitlines()):
+        sizes[spec] = int(line) if line.strip().isdigit() else 0
+    return sizes
+
+
+def read_header(repo_path, spec, header_bytes):
+    """只读取 blob 的前 header_bytes 字节"""
+    with tracing.span('read header', 'blob', repo=repo_path, file=spec, bytes=header_bytes):
+        process = git_popen(repo_path, 'cat-file', '-p', spec, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        header = process.stdout.read(header_bytes)
+        process.stdout.close()
+        process.kill()
+        process.wait()
+    return header.decode('utf-8', errors='ignore')
+
+
+def prefilter(repo_path, commit_hash, file_paths, config, stats=None, repo=None):
+    """
+    过滤一个 commit 中的修改文件列表，只保留需要读取和解析的 Java 文件。
+
+    :param repo_path: 本地仓库路径
+    :param commit_hash: 提交哈希值
+    :param file_paths: get_file_paths 返回的文件路径列表
+    :param config: FilterConfig
+    :param stats: FilterStats，用于按仓库统计跳过数
+    :param repo: 统计时使用的仓库名
+    :return: 保留的文件路径列表（非 Java 文件原样保留，由调用方处理）
+    """
+    stats = stats if stats is not None else FilterStats()
+    repo = repo or repo_path
+    java_paths = [p for p in file_paths if p.endswith('java')]
+    if not java_paths:
+        return list(file_paths)
+
+    skipped = set()
+
+    # 1. 路径
+    for path in java_paths:
+        if any(p.search(path) for p in config.path_patterns):
+            skipped.add(path)
+            stats.skip(repo, 'path', path)
+
+    # 2. 修改行数
+    remaining = [p for p in java_paths if p not in skipped]
+    if config.max_changed_lines is not None and remaining:
+        numstat = get_numstat(repo_path, commit_hash)
+        for path in remaining:
+            changed = numstat.get(path)
+            if changed is not None and changed > config.max_changed_lines:
+                skipped.add(path)
+                stats.skip(repo, 'numstat', path)
+
+    # 3. blob 大小（新旧两个版本）
+    remaining = [p for p in java_paths if p not in skipped]
+    if config.max_blob_bytes is not None and remaining:
+        specs = [f'{commit_hash}^:{p}' for p in remaining] + [f'{commit_hash}:{p}' for p in remaining]
+        sizes = get_blob_sizes(repo_path, specs)
+        for path in remaining:
+            size = max(sizes.get(f'{commit_hash}^:{path}', 0), sizes.get(f'{commit_hash}:{path}', 0))
+            if size > config.max_blob_bytes:
+                skipped.add(path)
+                stats.skip(repo, 'size', path)
+
+    # 4. 文件头标记（读取父版本，即 main_process 中会被解析的版本）
+    remaining = [p for p in java_paths if p not in skipped]
+    if config.header_bytes and config.header_markers:
+        for path in remaining:
+            header = read_header(repo_path, f'{commit_hash}^:{path}', config.header_bytes)
+            if not header:
+                header = read_header(repo_path, f'{commit_hash}:{path}', config.header_bytes)  # 新增文件
+            if any(marker in header for marker in config.header_markers):
+                skipped.add(path)
+                stats.skip(repo, 'header', path)
+
+    for path in java_paths:
+        if path not in skipped:
+            stats.keep(repo)
+    return [p for p in file_paths if p not in skipped]
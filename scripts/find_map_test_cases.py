@@ -1,23 +1,22 @@
 import os
 import re
-import csv
 import json
 import argparse
 import subprocess
-import difflib
-import shutil
-import multiprocessing
-import tqdm
 import copy
 import glob
 import fnmatch
 from TestParser import TestParser
+from symbol_index import SymbolIndex
+import tracing
 
 
 
-def analyze_project(repo_path, repo_name, grammar_file, output):
+def analyze_project(repo_path, repo_name, grammar_file, output, lean=False, cross_file=False):
     """
     Analyze a single project using an already cloned repository.
+    lean: only export focal signatures (see find_map_test_cases)
+    cross_file: also map test cases to focal methods in other classes (see find_map_test_cases)
     """
     print("Analyzing " + repo_name + "...")
     repo = {}
@@ -31,7 +30,7 @@ def analyze_project(repo_path, repo_name, grammar_file, output):
     # Run analysis
     language = 'java'
     print("Extracting and mapping tests...")
-    tot_mtc = find_map_test_cases(repo_path, grammar_file, language, repo_out, repo)
+    tot_mtc = find_map_test_cases(repo_path, grammar_file, language, repo_out, repo, lean, cross_file)
     (tot_tclass, tot_tc, tot_tclass_fclass, tot_mtc) = tot_mtc
 
     # Print Stats
@@ -61,26 +60,34 @@ def find_test_classes(root):
 
     return tests
 
-def find_map_test_cases(root, grammar_file, language, output, repo):
+def find_map_test_cases(root, grammar_file, language, output, repo, lean=False, cross_file=False, workers=4):
     """
     Finds test cases using @Test annotation
     Maps Test Classes -> Focal Class
     Maps Test Case -> Focal Method
+    lean: parse only method headers, @Test modifiers and invocation names (TestParser.parse_file_lean)
+    and stream the focal signatures straight into the exported list, without keeping
+    bodies, fields or the mapped test cases and without export_mtc's deepcopy.
+    The exported <repo_name>_signature.json is the same as in the full mode.
+    cross_file: build a repository-wide SymbolIndex (one parallel parse with `workers` threads) and
+    map every test class, not only the name-matched ones; test cases that do not map inside the
+    name-matched focal class are resolved against all classes the test file can see (implies lean).
     """
     # Logging
     log_path = os.path.join(output, "log.txt")
     log = open(log_path, "w")
 
-    # Move to folder
-    if os.path.exists(root):
-        os.chdir(root)
-    else:
+    # 不切换目录：grep 在 root 下运行，之后的相对路径都以 root 为基准
+    root = os.path.abspath(root)
+    if not os.path.exists(root):
         return 0, 0, 0, 0
 
     #获得Test Classes
     try:
         # print("执行grep -l -r @Test --include \*.java命令")
-        result = subprocess.check_output(r'grep -l -r @Test --include \*.java', shell=True)
+        with tracing.span('grep @Test', 'git', repo=root) as sp:
+            result = subprocess.check_output(['grep', '-l', '-r', '@Test', '--include', '*.java'], cwd=root)
+            sp['bytes'] = len(result)
         tests = result.decode('ascii').splitlines()
     except:
         print("命令执行失败")
@@ -134,26 +141,51 @@ def find_map_test_cases(root, grammar_file, language, output, repo):
     # Map Test Case -> Focal Method
     log.write("Mapping test cases" + '\n')
     mtc_list = list()
+    signatures = list()
     parser = TestParser(grammar_file, language)
-    for test, focal in mapped_tests.items():
+    symbols = None
+    if cross_file:
+        lean = True
+        symbols = SymbolIndex.build(root, java, grammar_file, language, workers)
+        log.write("Symbol Index: " + symbols.report() + '\n')
+    if lean:
+        parse_tests, parse_focals = parse_test_cases_lean, parse_potential_focal_methods_lean
+    else:
+        parse_tests, parse_focals = parse_test_cases, parse_potential_focal_methods
+    for test in (tests if cross_file else mapped_tests):
+        focal = mapped_tests.get(test)
         log.write("----------" + '\n')
         log.write("Test: " + test + '\n')
-        log.write("Focal: " + focal + '\n')
+        log.write("Focal: " + str(focal) + '\n')
 
-        test_cases = parse_test_cases(parser, test)
-        focal_methods = parse_potential_focal_methods(parser, focal)
-        tot_tc += len(test_cases)
+        if symbols is not None:
+            test_cases = symbols.test_cases(test)
+            tot_tc += len(test_cases)
+            with tracing.span('match_test_cases', 'map', repo=root, file=test):
+                mtc = symbols.match_test_cases(test, focal, test_cases, log)
+        else:
+            with tracing.span('parse test/focal', 'parse', repo=root, file=test):
+                test_cases = parse_tests(parser, test, root)
+                focal_methods = parse_focals(parser, focal, root)
+            tot_tc += len(test_cases)
 
-        mtc = match_test_cases(test, focal, test_cases, focal_methods, log)
+            with tracing.span('match_test_cases', 'map', repo=root, file=test):
+                mtc = match_test_cases(test, focal, test_cases, focal_methods, log)
         
         mtc_size = len(mtc)
         tot_mtc += mtc_size
-        if mtc_size > 0:
+        if lean:
+            signatures.extend(clean_signature(m['focal_method']['signature']) for m in mtc)
+        elif mtc_size > 0:
             mtc_list.append(mtc)
 
     # Export Mapped Test Cases
     if len(mtc_list) > 0:
-        export_mtc(repo, mtc_list, output)
+        with tracing.span('export_mtc', 'write', repo=root):
+            export_mtc(repo, mtc_list, output)
+    elif len(signatures) > 0:
+        with tracing.span('export_signatures', 'write', repo=root):
+            export_signatures(repo, signatures, output)
 
     # Print Stats
     log.write("==============" + '\n')
@@ -167,11 +199,12 @@ def find_map_test_cases(root, grammar_file, language, output, repo):
 
 
 
-def parse_test_cases(parser, test_file):
+def parse_test_cases(parser, test_file, root=''):
     """
     Parse source file and extracts test cases
+    test_file is relative to root; the recorded 'file' stays relative
     """
-    parsed_classes = parser.parse_file(test_file)
+    parsed_classes = parser.parse_file(os.path.join(root, test_file))
 
     test_cases = list()
 
@@ -191,11 +224,12 @@ def parse_test_cases(parser, test_file):
     return test_cases
 
 
-def parse_potential_focal_methods(parser, focal_file):
+def parse_potential_focal_methods(parser, focal_file, root=''):
     """
     Parse source file and extracts potential focal methods (non test cases)
+    focal_file is relative to root; the recorded 'file' stays relative
     """
-    parsed_classes = parser.parse_file(focal_file)
+    parsed_classes = parser.parse_file(os.path.join(root, focal_file))
 
     potential_focal_methods = list()
 
@@ -217,6 +251,23 @@ def parse_potential_focal_methods(parser, focal_file):
 
 
 
+def parse_test_cases_lean(parser, test_file, root=''):
+    """
+    Lean parse_test_cases: test case headers and invocation names only, no class info
+    """
+    return [method for parsed_class in parser.parse_file_lean(os.path.join(root, test_file))
+            for method in parsed_class['methods'] if method['testcase']]
+
+
+def parse_potential_focal_methods_lean(parser, focal_file, root=''):
+    """
+    Lean parse_potential_focal_methods: method headers only, no bodies or class info
+    """
+    return [method for parsed_class in parser.parse_file_lean(os.path.join(root, focal_file))
+            for method in parsed_class['methods'] if not method['testcase']]
+
+
+
 def match_test_cases(test_class, focal_class, test_cases, focal_methods, log):
     """
     Map Test Case -> Focal Method
@@ -302,13 +353,26 @@ def export_mtc(repo, mtc_list, output):
                 fmethod.pop('class')
                 fmethod.pop('invocations')
             
-            method = mtc['focal_method']['signature']
-            # 去掉\n和空格
-            method = re.sub(r',\n\s*', ', ', method)
-            method = re.sub(r'\n\s*', '', method)
+            method = clean_signature(mtc['focal_method']['signature'])
             all_mtcs.append(method)  # 将mtc对象添加到列表中
             mtc_id += 1
 
+    export_signatures(repo, all_mtcs, output)
+
+
+def clean_signature(method):
+    """
+    去掉焦点方法签名中的换行和缩进（\r\n 与 \n 相同处理）
+    """
+    method = re.sub(r',\r?\n\s*', ', ', method)
+    method = re.sub(r'\r?\n\s*', '', method)
+    return method
+
+
+def export_signatures(repo, all_mtcs, output):
+    """
+    把焦点方法签名列表写入 <repo_name>_signature.json
+    """
     mtc_file = str(repo["repo_name"]) + "_signature.json"  # 使用repo名称作为文件名
     json_path = os.path.join(output, mtc_file)  # 构建完整的文件路径
 
@@ -355,6 +419,16 @@ def parse_args():
         default="E:/dachaung/tmp/output/", # 默认输出路径
         help="Path to the output folder",
     )
+    parser.add_argument(
+        "--cross_file",
+        action="store_true",
+        help="Map test cases to focal methods anywhere in the repo via a symbol index (implies --lean)",
+    )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="Only extract method headers and export focal signatures (faster, less memory)",
+    )
 
     return vars(parser.parse_args())
 
@@ -363,10 +437,10 @@ def main():
     args = parse_args()
     repo_git = args['repo_path']
     repo_name = args['repo_name']
-    grammar_file = args['grammar']
-    output = args['output']
+    grammar_file = os.path.abspath(args['grammar'])
+    output = os.path.abspath(args['output'])
     local_repo_path = os.path.join(repo_git)  # 确保传入的是本地路径
-    analyze_project(local_repo_path, repo_name, grammar_file, output)
+    analyze_project(local_repo_path, repo_name, grammar_file, output, args['lean'], args['cross_file'])
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+函数记录的分片二进制格式（output_getfunc_test.jsonl 的替代输出）。
+
+目录结构：
+    shard-00000.bin ...  记录分片，每条记录为 4 字节长度前缀 + JSON(utf-8)
+    index.bin            定长偏移索引，每条记录一行，按 idx 升序
+    strings.json         索引中 repo/commit/file 列引用的字符串表及元数据
+
+读取时只需 mmap index.bin，即可按 idx 定位或按 target 过滤，不必解码函数主体。
+"""
+
+import os
+import json
+import mmap
+import struct
+import bisect
+
+INDEX_MAGIC = b'VDFI0001'
+# idx, shard, offset, length, target, repo_id, commit_id, file_id
+INDEX_ROW = struct.Struct('<QIQIiIII')
+LENGTH_PREFIX = struct.Struct('<I')
+DEFAULT_SHARD_BYTES = 64 * 1024 * 1024
+
+
+def shard_name(shard):
+    return f'shard-{shard:05d}.bin'
+
+
+class FuncDatasetWriter():
+    """
+    按写入顺序把函数记录追加到定长分片中，同时生成索引。
+
+    :param output_dir: 输出目录
+    :param shard_bytes: 单个分片的最大字节数，超过后切换到下一个分片
+    """
+
+    def __init__(self, output_dir, shard_bytes=DEFAULT_SHARD_BYTES):
+        self.output_dir = output_dir
+        self.shard_bytes = shard_bytes
+        os.makedirs(output_dir, exist_ok=True)
+        self.shard = 0
+        self.offset = 0
+        self.count = 0
+        self.last_idx = None
+        self.strings = []
+        self.string_ids = {}
+        self.shard_file = open(os.path.join(output_dir, shard_name(0)), 'wb')
+        self.index_file = open(os.path.join(output_dir, 'index.bin'), 'wb')
+        self.index_file.write(INDEX_MAGIC)
+
+    def _string_id(self, value):
+        value = value or ''
+        if value not in self.string_ids:
+            self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.string_ids[value]
+
+    def write(self, function_info, repo='', commit_hash='', file_path=''):
+        """
+        写入一条记录（字段同 jsonl 输出：idx/func/target/flaw_line_index）。
+        idx 必须递增，读取端依赖这一点做二分查找。
+        """
+        idx = function_info['idx']
+        if self.last_idx is not None and idx <= self.last_idx:
+            raise ValueError(f'idx must be increasing: {idx} after {self.last_idx}')
+        payload = json.dumps(function_info).encode('utf-8')
+        size = LENGTH_PREFIX.size + len(payload)
+        if self.offset > 0 and self.offset + size > self.shard_bytes:
+            self.shard_file.close()
+            self.shard += 1
+            self.offset = 0
+            self.shard_file = open(os.path.join(self.output_dir, shard_name(self.shard)), 'wb')
+
+        self.shard_file.write(LENGTH_PREFIX.pack(len(payload)))
+        self.shard_file.write(payload)
+        self.index_file.write(INDEX_ROW.pack(
+            idx, self.shard, self.offset + LENGTH_PREFIX.size, len(payload), int(function_info['target']),
+            self._string_id(repo), self._string_id(commit_hash), self._string_id(file_path),
+        ))
+        self.offset += size
+        self.count += 1
+        self.last_idx = idx
+
+    def close(self):
+        self.shard_file.close()
+        self.index_file.close()
+        meta = {
+            'count': self.count,
+            'shards': self.shard + 1,
+            'shard_bytes': self.shard_bytes,
+            'strings': self.strings,
+        }
+        with open(os.path.join(self.output_dir, 'strings.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FuncDataset():
+    """
+    以 mmap 方式读取分片数据集。
+
+    - find(idx): 按 idx 二分查找，返回记录位置
+    - positions(target): 按标签过滤，只扫描索引
+    - meta(pos): 返回 idx/repo/commit/file/target，不读取函数主体
+    - record(pos): 解码完整记录
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'strings.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.strings = meta['strings']
+        self.count = meta['count']
+        self._index_file = open(os.path.join(path, 'index.bin'), 'rb')
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._index[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError(f'{path} is not a function dataset')
+        self._shards = {}
+        self._idx_keys = _IdxColumn(self)
+
+    def __len__(self):
+        return self.count
+
+    def row(self, pos):
+        """索引中第 pos 行的原始字段"""
+        if not 0 <= pos < self.count:
+            raise IndexError(pos)
+        return INDEX_ROW.unpack_from(self._index, len(INDEX_MAGIC) + pos * INDEX_ROW.size)
+
+    def find(self, idx):
+        """按 idx 查找记录位置，不存在返回 None"""
+        pos = bisect.bisect_left(self._idx_keys, idx)
+        if pos < self.count and self._idx_keys[pos] == idx:
+            return pos
+        return None
+
+    def positions(self, target=None):
+        """遍历记录位置，target 不为 None 时只返回该标签的记录"""
+        # 逐行 unpack_from，不持有 mmap 的 memoryview：调用方提前结束遍历后仍可以 close()
+        offset = len(INDEX_MAGIC)
+        for pos in range(self.count):
+            if target is None or INDEX_ROW.unpack_from(self._index, offset + pos * INDEX_ROW.size)[4] == target:
+                yield pos
+
+    def meta(self, pos):
+        idx, _, _, _, target, repo_id, commit_id, file_id = self.row(pos)
+        return {
+            'idx': idx,
+            'repo': self.strings[repo_id],
+            'commit': self.strings[commit_id],
+            'file': self.strings[file_id],
+            'target': target,
+        }
+
+    def _shard(self, shard):
+        if shard not in self._shards:
+            f = open(os.path.join(self.path, shard_name(shard)), 'rb')
+            self._shards[shard] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return self._shards[shard][1]
+
+    def record(self, pos):
+        _, shard, offset, length, _, _, _, _ = self.row(pos)
+        return json.loads(self._shard(shard)[offset:offset + length])
+
+    def get(self, idx):
+        """按 idx 读取完整记录"""
+        pos = self.find(idx)
+        if pos is None:
+            raise KeyError(idx)
+        return self.record(pos)
+
+    def __iter__(self):
+        for pos in range(self.count):
+            yield self.record(pos)
+
+    def close(self):
+        for f, m in self._shards.values():
+            m.close()
+            f.close()
+        self._shards = {}
+        self._index.close()
+        self._index_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _IdxColumn():
+    """把索引的 idx 列包装成只读序列，供 bisect 使用"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return self.dataset.count
+
+    def __getitem__(self, pos):
+        return INDEX_ROW.unpack_from(self.dataset._index, len(INDEX_MAGIC) + pos * INDEX_ROW.size)[0]
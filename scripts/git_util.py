@@ -0,0 +1,93 @@
+"""
+项目中所有 git 调用的统一入口。
+
+- 一律使用 `git -C <仓库绝对路径>` 加参数列表，不经过 shell，不依赖、也不修改当前工作目录（不再 os.chdir），
+  因此可以在同一进程的多个线程中同时处理多个仓库
+- 输出按 utf-8 解码，无法解码的字节忽略（与原先 powershell 调用的 errors='ignore' 一致）
+- 每次调用记录一个 tracing span，附带输出字节数
+- 在 time_limit() 范围内，未显式传入 timeout 的调用以剩余预算作为超时
+"""
+
+import os
+import threading
+import subprocess
+from contextlib import contextmanager
+
+import tracing
+
+# 项目根目录（scripts 所在目录），用于把语法文件、dataset 等相对路径转成绝对路径
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def script_path(*parts):
+    """相对于 scripts 目录的绝对路径，如 script_path('build', 'my-languages.so')"""
+    return os.path.join(SCRIPT_DIR, *parts)
+
+
+# 当前线程的剩余时间函数，由 time_limit() 设置
+_limits = threading.local()
+
+
+@contextmanager
+def time_limit(remaining):
+    """
+    在范围内为本线程的 git() 调用设置默认超时。
+
+    :param remaining: 返回剩余秒数（None 表示不限）的函数，如 BudgetGuard.remaining
+    """
+    previous = getattr(_limits, 'remaining', None)
+    _limits.remaining = remaining
+    try:
+        yield
+    finally:
+        _limits.remaining = previous
+
+
+def current_timeout():
+    """本线程 time_limit() 范围内的剩余秒数，未设置时返回 None；供长期运行的 git 进程的读取方使用"""
+    remaining = getattr(_limits, 'remaining', None)
+    return remaining() if remaining is not None else None
+
+
+def git_argv(repo_path, *args):
+    return ['git', '-C', os.path.abspath(repo_path)] + [str(a) for a in args]
+
+
+def git(repo_path, *args, input=None, check=False, timeout=None, env=None, text=True, name=None, stage='git',
+        **attrs):
+    """
+    在 repo_path 中运行 git 命令。
+
+    :param repo_path: 仓库路径（clone 时为存放仓库的目录）
+    :param args: git 子命令及参数，如 ('diff', 'abc^..abc')
+    :param input: 写入 stdin 的内容
+    :param check: 为 True 时返回码非 0 抛出 subprocess.CalledProcessError（stderr 已捕获）
+    :param timeout: 超时秒数，超时抛出 subprocess.TimeoutExpired；为 None 时使用 time_limit() 设置的剩余时间
+    :param env: 额外的环境变量，在当前环境基础上覆盖
+    :param text: 为 False 时 stdout 为 bytes
+    :param name: tracing span 的名称，默认 'git <子命令>'
+    :param stage: tracing span 的阶段分类，读取 blob 时为 'blob'
+    :param attrs: 记录到 tracing span 的其他属性，如 commit=..., file=...
+    :return: subprocess.CompletedProcess
+    """
+    kwargs = {'encoding': 'utf-8', 'errors': 'ignore'} if text else {}
+    if timeout is None:
+        timeout = current_timeout()
+    with tracing.span(name or f'git {args[0]}', stage, repo=repo_path, **attrs) as sp:
+        result = subprocess.run(git_argv(repo_path, *args), input=input, capture_output=True, timeout=timeout,
+                                check=check, env=dict(os.environ, **env) if env else None, **kwargs)
+        sp['bytes'] = len(result.stdout)
+    return result
+
+
+def git_output(repo_path, *args, **kwargs):
+    """git() 的 stdout；命令失败时打印 stderr 并返回空输出"""
+    result = git(repo_path, *args, **kwargs)
+    if result.returncode != 0:
+        print(f"Error occurred: {result.stderr}")
+    return result.stdout
+
+
+def git_popen(repo_path, *args, **kwargs):
+    """长期运行的 git 进程（如 cat-file --batch），参数同 subprocess.Popen"""
+    return subprocess.Popen(git_argv(repo_path, *args), **kwargs)
@@ -0,0 +1,261 @@
+"""
+GitHub API 检查和 .diff 下载的持久化 HTTP 缓存。
+
+clone_repository 每次运行都会对每个 url 请求一次 GitHub API，本地 diff 为空时还会下载 url + '.diff'，
+重跑时这几百个请求又慢又受限流影响。HttpCache.get() 与 requests.get(url, headers=...) 用法相同：
+- 200 的响应保存到 cache_dir，max_age（默认 1 天）内直接使用、不发请求；过期后带 If-None-Match / If-Modified-Since
+  重新验证，304 时继续使用缓存。仓库元数据（是否存在、fork 的上游）很少变化，每次运行都重新验证要 max_age=0
+- commit 的 .diff 内容不会变化（immutable_patterns），命中后不再请求
+- 404 / 410（仓库已删除）做负缓存，negative_ttl 秒内不再请求
+- offline=True 时只读缓存，未命中返回 504（同 HTTP 的 only-if-cached）
+- 其他状态码（403 限流、5xx 等）不缓存
+StubServer 是本地的桩服务器，按路由返回固定内容并支持 ETag，用于离线验证缓存行为：
+    python http_cache.py selftest
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset', 'http_cache')
+DEFAULT_MAX_AGE = 24 * 3600
+DEFAULT_IMMUTABLE = [r'/commit/[0-9a-fA-F]{7,40}\.(diff|patch)$']
+NEGATIVE_STATUS = (404, 410)
+
+
+def default_session():
+    """requests 模块；在第一次真正发请求时才导入"""
+    import requests
+    return requests
+
+
+class CachedResponse():
+    """requests.Response 的子集：status_code、text、content、headers、json()"""
+
+    def __init__(self, url, status_code, text, headers=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.from_cache = from_cache
+
+    @property
+    def content(self):
+        return self.text.encode('utf-8')
+
+    @property
+    def ok(self):
+        return self.status_code is not None and self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpCache():
+    """
+    :param cache_dir: 缓存目录，每个 url 一个 json 文件
+    :param offline: 只使用缓存，不发出任何请求
+    :param max_age: 200 的响应在多少秒内直接使用、不重新验证；0 表示每次都重新验证（仍节省流量，但每个 url 一次请求）
+    :param negative_ttl: 404 / 410 的负缓存有效期（秒）
+    :param immutable_patterns: 匹配的 url 缓存后永不重新验证
+    :param session: 发请求的对象（requests 或 requests.Session），默认在第一次请求时导入 requests
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, offline=False, max_age=DEFAULT_MAX_AGE, negative_ttl=7 * 24 * 3600,
+                 immutable_patterns=None, session=None, timeout=30):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.offline = offline
+        self.max_age = max_age
+        self.negative_ttl = negative_ttl
+        self.immutable = [re.compile(p) for p in (DEFAULT_IMMUTABLE if immutable_patterns is None else immutable_patterns)]
+        self.session = session
+        self.timeout = timeout
+        self.stats = {'hit': 0, 'revalidated': 0, 'negative': 0, 'miss': 0, 'offline_miss': 0}
+        self.lock = threading.Lock()
+
+    def _path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _load(self, url):
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, url, status_code, text, headers):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'url': url,
+            'status': status_code,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_type': headers.get('Content-Type'),
+            'body': text,
+            'fetched_at': time.time(),
+        }
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        return entry
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _response(self, entry, from_cache=True):
+        headers = {k: v for k, v in (('ETag', entry.get('etag')), ('Last-Modified', entry.get('last_modified')),
+                                     ('Content-Type', entry.get('content_type'))) if v}
+        return CachedResponse(entry['url'], entry['status'], entry['body'] or '', headers, from_cache)
+
+    def _fresh(self, url, entry):
+        age = time.time() - entry['fetched_at']
+        if entry['status'] in NEGATIVE_STATUS:
+            return age < self.negative_ttl
+        return any(p.search(url) for p in self.immutable) or age < self.max_age
+
+    def get(self, url, headers=None):
+        """与 requests.get(url, headers=headers) 相同，返回 CachedResponse"""
+        entry = self._load(url)
+        if entry is not None and (self.offline or self._fresh(url, entry)):
+            self._count('negative' if entry['status'] in NEGATIVE_STATUS else 'hit')
+            return self._response(entry)
+        if self.offline:
+            self._count('offline_miss')
+            return CachedResponse(url, 504, '', from_cache=True)
+
+        request_headers = dict(headers or {})
+        if entry is not None and entry['status'] == 200:
+            if entry.get('etag'):
+                request_headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                request_headers['If-Modified-Since'] = entry['last_modified']
+        if self.session is None:
+            self.session = default_session()
+        response = self.session.get(url, headers=request_headers, timeout=self.timeout)
+
+        if response.status_code == 304 and entry is not None:
+            self._count('revalidated')
+            entry = self._store(url, entry['status'], entry['body'], {'ETag': entry.get('etag'),
+                                                                      'Last-Modified': entry.get('last_modified'),
+                                                                      'Content-Type': entry.get('content_type')})
+            return self._response(entry)
+        self._count('miss')
+        if response.status_code == 200 or response.status_code in NEGATIVE_STATUS:
+            entry = self._store(url, response.status_code, response.text if response.status_code == 200 else '',
+                                response.headers)
+            return self._response(entry, from_cache=False)
+        return CachedResponse(url, response.status_code, response.text, dict(response.headers))
+
+    def report(self):
+        return ', '.join(f'{key} {value}' for key, value in self.stats.items())
+
+
+class StubServer():
+    """
+    本地桩服务器：routes 为 {路径: (状态码, 内容)}，200 的响应带 ETag，If-None-Match 匹配时返回 304。
+    requests 记录每个路径被请求的次数。
+
+        with StubServer({'/repos/a/b': (200, '{}')}) as server:
+            HttpCache(tmp, session=requests).get(server.url('/repos/a/b'))
+    """
+
+    def __init__(self, routes):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.routes = routes
+        self.requests = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                status, body = stub.routes.get(self.path, (404, 'Not Found'))
+                data = body.encode('utf-8')
+                etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                if status == 200:
+                    self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_address[1]}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def selftest():
+    """对本地桩服务器验证：max_age 内命中、ETag 重新验证、404 负缓存、不可变 .diff 和离线模式"""
+    import tempfile
+    commit_diff = '/owner/repo/commit/0123456789abcdef0123456789abcdef01234567.diff'
+    routes = {'/repos/owner/repo': (200, '{"full_name": "owner/repo"}'), commit_diff: (200, 'diff --git a/A.java b/A.java')}
+    with tempfile.TemporaryDirectory() as cache_dir, StubServer(routes) as server:
+        cache = HttpCache(cache_dir)
+        api, gone, diff = server.url('/repos/owner/repo'), server.url('/repos/owner/gone'), server.url(commit_diff)
+        assert cache.get(api).json()['full_name'] == 'owner/repo'
+        assert cache.get(api).from_cache and server.requests['/repos/owner/repo'] == 1  # max_age 内不发请求
+        revalidating = HttpCache(cache_dir, max_age=0)
+        assert revalidating.get(api).from_cache and server.requests['/repos/owner/repo'] == 2  # 304
+        assert cache.get(gone).status_code == 404 and cache.get(gone).status_code == 404
+        assert server.requests['/repos/owner/gone'] == 1
+        assert cache.get(diff).text == routes[commit_diff][1] and cache.get(diff).from_cache
+        assert server.requests[commit_diff] == 1
+        offline = HttpCache(cache_dir, offline=True)
+        assert offline.get(api).status_code == 200 and offline.get(server.url('/x')).status_code == 504
+        assert sum(server.requests.values()) == 4
+        print(f"selftest passed: {cache.report()}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='HTTP 缓存')
+    parser.add_argument('command', choices=['selftest', 'stats'])
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'selftest':
+        selftest()
+        return
+    counts = {}
+    for dirpath, _, filenames in os.walk(args.cache_dir):
+        for filename in filenames:
+            if filename.endswith('.json'):
+                with open(os.path.join(dirpath, filename), 'r', encoding='utf-8') as f:
+                    status = json.load(f)['status']
+                counts[status] = counts.get(status, 0) + 1
+    print(f"{sum(counts.values())} cached responses in {args.cache_dir}: {counts}")
+
+
+if __name__ == '__main__':
+    main()
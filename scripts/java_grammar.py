@@ -0,0 +1,42 @@
+"""
+tree-sitter Java 语法和解析器的延迟加载。
+
+语法文件 build/my-languages.so 和 Parser 在第一次使用时才加载，导入各模块时不读取语法文件，也不导入 tree_sitter；
+没有安装 tree_sitter 或没有语法文件时，只有真正解析 Java 的调用才会失败。
+"""
+
+import threading
+import warnings
+
+from git_util import script_path
+
+DEFAULT_GRAMMAR = script_path('build', 'my-languages.so')
+
+_languages = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def java_language(grammar_path=DEFAULT_GRAMMAR):
+    """加载并缓存语法文件中的 Java 语言，同一语法文件只加载一次"""
+    with _lock:
+        if grammar_path not in _languages:
+            from tree_sitter import Language
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', FutureWarning)
+                _languages[grammar_path] = Language(grammar_path, 'java')
+        return _languages[grammar_path]
+
+
+def new_parser(grammar_path=DEFAULT_GRAMMAR):
+    from tree_sitter import Parser
+    parser = Parser()
+    parser.set_language(java_language(grammar_path))
+    return parser
+
+
+def get_parser():
+    """每个线程一个 Parser：tree-sitter 的 Parser 不能在线程之间共享"""
+    if getattr(_local, 'parser', None) is None:
+        _local.parser = new_parser()
+    return _local.parser
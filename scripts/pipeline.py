@@ -0,0 +1,514 @@
+"""
+统一的流水线运行器。
+
+把原来分开运行的几个脚本建模为一个阶段 DAG，作用在同一个 commit 工作项流上：
+    clone       克隆仓库（clone_repo / data_processing.clone_repository）
+    diff_stats  统计 file/func/hunk 等（data_processing.py），写入结果库
+    testcase    判断修改文件是否有对应测试（data_processing_testcase.py），写入结果库的 testcase 列
+    getfunc     提取修改和未修改方法主体（data_processing_getfunc.py），写入 jsonl
+每个 commit 的 git 工作（diff、blob 读取、方法映射）只做一次，以内存中的产物在阶段之间共享。
+可以只运行其中任意几个阶段，依赖的阶段会自动加入（--no-deps 关闭）。
+
+    python pipeline.py --stages diff_stats testcase getfunc --workers 4
+
+多个 worker 时按仓库亲和性调度（见 scheduler.py），每个 worker 保持当前仓库的 cat-file 进程。
+多机运行时用 --shard i/N 只处理一个分片，再用 shard.py merge 合并（见 shard.py）。
+没有仓库和 git 的 worker 用 --bundle 从 snapshot_bundle.py 导出的快照包读取 diff 和 blob（只支持 diff_stats 和 getfunc）。
+"""
+
+import os
+import re
+import csv
+import json
+import argparse
+
+import extract as ex
+import tracing
+from results_store import ResultsStore
+from scheduler import RepoAffinityScheduler
+import shard
+from repo_cache import RepoCache
+from http_cache import HttpCache, DEFAULT_MAX_AGE
+from commit_meta import CommitMetadata
+from diff_stream import DiffTreeStream
+from snapshot_bundle import SnapshotBundle
+import work_units
+from git_util import git, script_path
+
+
+class CommitWork():
+    """
+    一个 commit 工作项，以及该 commit 在各阶段之间共享的产物（diff、blob、方法映射等）。
+    产物在第一次使用时计算，工作项处理完后随对象一起释放。
+    同一 (仓库, commit) 出现在输入的多行时合并为一个工作项，rows 记录所有行，结果写回每一行。
+    """
+
+    def __init__(self, index, url, repository_name, commit_hash, base_path):
+        self.index = index  # 第一次出现的行号
+        self.url = url
+        self.rows = [(index, url)]  # 对应的所有 (行号, url)
+        self.repository_name = repository_name  # user/repo
+        self.repo = re.search(r'[^/]+$', repository_name).group()
+        self.commit_hash = commit_hash
+        self.repo_path = os.path.join(base_path, self.repo)
+        self.skipped = None  # 跳过原因，设置后后续阶段不再处理
+        self.artifacts = {}
+        self.function_infos = []  # getfunc 阶段的输出，idx 在全部处理完后按输入顺序编号
+        self.blob_reader = None  # worker 提供的 extract.CatFileBatch
+        self.http = None  # 运行期间共享的 http_cache.HttpCache
+        self.change_detection = 'lines'  # 判断修改方法的方式，见 extract.CHANGE_DETECTION_MODES
+        self.diff_stream = None  # worker 提供的 diff_stream.DiffTreeStream（--stream_diffs）
+        self.bundle = None  # 快照包中该仓库的 snapshot_bundle.BundleRepo（--bundle），设置后不再调用 git
+
+    def __repr__(self):
+        return f'{self.repo}@{self.commit_hash[:10]} (rows {",".join(str(index) for index, _ in self.rows)})'
+
+    def artifact(self, key, producer):
+        if key not in self.artifacts:
+            self.artifacts[key] = producer()
+        return self.artifacts[key]
+
+    def git(self, *args):
+        return git(self.repo_path, *args, commit=self.commit_hash)
+
+    def diff(self):
+        """整个 commit 的 diff 文本；本地为空时从网络获取 url.diff"""
+        def produce():
+            if self.bundle is not None:
+                diff_output = self.bundle.diff(self.commit_hash)
+            elif self.diff_stream is not None:
+                diff_output = self.diff_stream.diff(self.commit_hash)
+            else:
+                diff_output = self.git('diff', f'{self.commit_hash}^..{self.commit_hash}').stdout
+            if not diff_output:
+                print("the repo" + self.repo + " local is bad")
+                diff_output = self.http.get(self.url + '.diff').text or ''
+            return diff_output
+        return self.artifact('diff', produce)
+
+    def file_diffs(self):
+        """{文件路径: 该文件的 diff 文本}"""
+        return self.artifact('file_diffs', lambda: ex.split_diff_by_file(self.diff()))
+
+    def file_paths(self):
+        """修改的文件路径列表，等价于 get_file_paths"""
+        return list(self.file_diffs())
+
+    def blob(self, rev, file_path):
+        """指定版本的文件内容，等价于 extract.get_file_content"""
+        def produce():
+            if self.blob_reader is not None:
+                return self.blob_reader.read(rev, file_path)
+            result = self.git('show', f'{rev}:{file_path}')
+            return result.stdout if result.returncode == 0 else ""
+        return self.artifact(('blob', rev, file_path), produce)
+
+    def method_changes(self, file_path):
+        """{方法签名: 修改行号列表}，等价于 extract.get_modified_methods，但复用已有的 diff 和 blob"""
+        def produce():
+            if self.change_detection == 'hash':
+                return ex.hash_modified_methods(self.blob(f'{self.commit_hash}^', file_path),
+                                                self.blob(self.commit_hash, file_path),
+                                                lambda: ex.parse_hunk_lines(self.file_diffs().get(file_path, '')),
+                                                self.commit_hash, file_path, self.repo_path)
+            old_lines, new_lines = ex.parse_hunk_lines(self.file_diffs().get(file_path, ''))
+            return ex.map_modified_methods(self.blob(f'{self.commit_hash}^', file_path),
+                                           self.blob(self.commit_hash, file_path),
+                                           old_lines, new_lines, self.commit_hash, file_path, self.repo_path)
+        return self.artifact(('method_changes', file_path), produce)
+
+    def branches(self):
+        import data_processing as dp
+
+        if self.bundle is not None:
+            return self.artifact('branches', lambda: self.bundle.branches(self.commit_hash))
+        return self.artifact('branches', lambda: dp.get_branches_containing_commit(self.repo_path, self.commit_hash))
+
+
+class PipelineContext():
+    """运行期间共享的配置、输出和仓库级产物（如 testcase 阶段的焦点方法列表）"""
+
+    def __init__(self, args):
+        self.base_path = os.path.abspath(args.base_path)
+        self.grammar = os.path.abspath(args.grammar)
+        self.mapping_output = os.path.abspath(args.mapping_output)
+        self.db = os.path.abspath(args.db)
+        self.func_output = os.path.abspath(args.func_output)
+        self.repo_artifacts = {}
+        self.commit_meta = CommitMetadata()  # 每个仓库一次 git log 查询所有 commit 的元数据
+        self.http = HttpCache(os.path.abspath(args.http_cache), offline=args.offline,
+                              max_age=0 if args.revalidate else DEFAULT_MAX_AGE)
+        self.change_detection = args.change_detection
+        self.cross_file = args.cross_file
+        self.unmodified_files = args.unmodified_files
+        self.stream_diffs = args.stream_diffs
+        self.sampler = None  # --negative_ratio 时为 data_processing_getfunc.NegativeSampler
+        if args.negative_ratio is not None:
+            import data_processing_getfunc as dpg
+            self.sampler = dpg.NegativeSampler(args.negative_ratio, args.sample_scope, args.sample_seed)
+        self.repo_commits = {}  # 仓库路径 -> 按处理顺序的 commit 哈希，供 --stream_diffs 一次交给 git diff-tree
+        self.bundle = SnapshotBundle(os.path.abspath(args.bundle)) if args.bundle else None
+        self.repo_cache = None
+        if args.repo_cache:
+            budget_bytes = int(args.cache_gb * 2 ** 30) if args.cache_gb else None
+            self.repo_cache = RepoCache(self.base_path, budget_bytes)
+            self.repo_cache.scan()
+
+    def repo_artifact(self, repo, key, producer):
+        if (repo, key) not in self.repo_artifacts:
+            self.repo_artifacts[(repo, key)] = producer()
+        return self.repo_artifacts[(repo, key)]
+
+
+class WorkerState():
+    """
+    worker 的常驻状态：独立的结果库连接（sqlite 连接不能跨线程），以及当前仓库的 cat-file 进程。
+    同一仓库的 commit 都由同一个 worker 处理，切换仓库时才重建 cat-file 进程，
+    并通知仓库缓存上一个仓库已用完（之后可被淘汰）。
+    """
+
+    def __init__(self, ctx):
+        self.store = ResultsStore(ctx.db)
+        self.repo_cache = ctx.repo_cache
+        self.repo_path = None
+        self.blob_reader = None
+        self.unmodified = None  # 当前仓库的 data_processing_getfunc.UnmodifiedFunctions
+        self.diff_stream = None  # 当前仓库的 diff_stream.DiffTreeStream
+
+    def reader_for(self, repo_path):
+        if repo_path != self.repo_path:
+            if self.blob_reader is not None:
+                self.blob_reader.close()
+            if self.diff_stream is not None:
+                self.diff_stream.close()
+                self.diff_stream = None
+            self._release()
+            self.repo_path = repo_path
+            self.blob_reader = None
+            self.unmodified = None
+            if self.repo_cache is not None and os.path.exists(repo_path):
+                self.repo_cache.touch(os.path.basename(repo_path))
+        if self.blob_reader is None and os.path.exists(repo_path):
+            self.blob_reader = ex.CatFileBatch(repo_path)  # clone 阶段之后仓库才可能存在
+        return self.blob_reader
+
+    def diff_stream_for(self, repo_path, commits):
+        """当前仓库的 diff-tree 进程，commits 为该仓库所有要处理的 commit；仓库不存在时返回 None"""
+        self.reader_for(repo_path)
+        if self.diff_stream is None and os.path.exists(repo_path):
+            self.diff_stream = DiffTreeStream(repo_path, commits)
+        return self.diff_stream
+
+    def _release(self):
+        if self.repo_cache is not None and self.repo_path is not None:
+            self.repo_cache.release(os.path.basename(self.repo_path))
+
+    def close(self):
+        if self.blob_reader is not None:
+            self.blob_reader.close()
+        if self.diff_stream is not None:
+            self.diff_stream.close()
+        self._release()
+        self.store.close()
+
+
+def stage_clone(work, ctx, state):
+    if work.bundle is not None:
+        if work.bundle.commit(work.commit_hash) is None:
+            work.skipped = 'not in bundle'
+        return
+    import data_processing as dp
+    cloned = dp.clone_repository(work.url, ctx.base_path, cache=ctx.repo_cache, http=ctx.http)
+    if cloned == False:
+        work.skipped = 'url deleted'
+        return
+    if not os.path.exists(work.repo_path):
+        work.skipped = 'repo missing'
+
+
+def stage_diff_stats(work, ctx, state):
+    import data_processing as dp
+    diff_output = work.diff()
+    with tracing.span('process_diff_output', 'scan', repo=work.repo, commit=work.commit_hash, bytes=len(diff_output)):
+        datas = dp.process_diff_output(work.repo, diff_output)
+    result = {
+        'cwe key word': {'CWE-79': ['XSS', 'Cross Site Scripting']},
+        'matched key word': {'CWE-79': ['XSS']},
+        'file': f"{datas['file']}({datas['java_file_count']})",
+        'func': datas['func'],
+        'hunk': datas['hunk'],
+        'function_name': datas['function_name'],
+        'note': "",
+        'branch': work.branches(),
+        'url': work.url,
+    }
+    if work.bundle is not None:
+        result.update(work.bundle.columns(work.commit_hash))
+    else:
+        result.update(ctx.commit_meta.columns(work.repo_path, work.commit_hash))  # note 和 commit 元数据列
+    for index, url in work.rows:
+        state.store.upsert(index, work.repo, work.commit_hash, **dict(result, url=url))
+
+
+def stage_testcase(work, ctx, state):
+    import data_processing_testcase as dpt
+    import find_map_test_cases as fmt
+
+    def mapping():
+        # 仓库级产物：每个仓库只运行一次 find_map_test_cases
+        repo_out = os.path.join(ctx.mapping_output, work.repo)
+        os.makedirs(repo_out, exist_ok=True)
+        fmt.find_map_test_cases(work.repo_path, ctx.grammar, 'java', repo_out,
+                                {'url': work.repo_path, 'repo_name': work.repo}, lean=True, cross_file=ctx.cross_file)
+        json_file_path = os.path.join(repo_out, work.repo + '_signature.json')
+        if os.path.exists(json_file_path):
+            with open(json_file_path, 'r') as f:
+                return json.load(f)
+        return []
+
+    diff_output = work.diff()
+    modified_java_files = dpt.modified_java_files_from_diff(diff_output.splitlines())
+    modified_java_path = dpt.extract_java_file_paths(diff_output)
+    with tracing.span('find_map_test_cases', 'map', repo=work.repo):
+        repo_mapping = ctx.repo_artifact(work.repo, 'mapping', mapping)
+    flags = dpt.testcase_flags(work.repo, work.repo_path, modified_java_files, modified_java_path, repo_mapping)
+    for index, _ in work.rows:
+        state.store.upsert(index, work.repo, work.commit_hash, testcase=flags)
+
+
+def stage_getfunc(work, ctx, state):
+    import data_processing_getfunc as dpg
+    # 记录先放在局部列表里，整个 commit 成功后才交给 work；中途出错时（scheduler 记录错误后继续）不输出部分记录，
+    # 与 data_processing_getfunc.main 丢弃出错 commit 的行为一致
+    function_infos = []
+    index = 0
+    modified_function_names = {}
+    sample = ctx.sampler.commit(work.repo, work.commit_hash) if ctx.sampler is not None else None
+    for file_path in work.file_paths():
+        if not file_path.endswith('java'):
+            continue
+        parent_content = work.blob(f'{work.commit_hash}^', file_path)
+        modified_function_names.update(work.method_changes(file_path))
+        with tracing.span('extract_functions', 'parse', repo=work.repo, commit=work.commit_hash, file=file_path,
+                          bytes=len(parent_content)):
+            parent_functions = dpg.extract_functions(parent_content)
+        if sample is not None:
+            sample.add_file(file_path, parent_functions, modified_function_names)
+            continue
+        for function_info in dpg.function_records(parent_functions, modified_function_names, index,
+                                                  work.repo, work.commit_hash, file_path):
+            function_infos.append(function_info)
+            index = function_info['idx']
+    if ctx.unmodified_files:
+        # 同一仓库的 commit 都在同一个 worker 上，连续 commit 之间复用未变化文件的函数表
+        if state.unmodified is None:
+            state.unmodified = dpg.UnmodifiedFunctions(work.repo_path)
+        if sample is not None:
+            sample.open()
+        # 排除 diff 两侧的全部路径：重命名的源文件在父提交中存在，但不是未修改文件
+        changed_paths = ex.diff_paths(work.diff())
+        for file_path, functions in state.unmodified.functions(f'{work.commit_hash}^', changed_paths,
+                                                               reader=work.blob_reader):
+            if sample is not None:
+                sample.add_file(file_path, functions, {})
+                continue
+            for function_info in dpg.function_records(functions, {}, index, work.repo, work.commit_hash, file_path):
+                function_infos.append(function_info)
+                index = function_info['idx']
+    if sample is not None:
+        # 抽样后保留的函数按原来的顺序生成记录
+        for file_path, functions, flaw_lines in sample.files():
+            for function_info in dpg.function_records(functions, flaw_lines, index, work.repo, work.commit_hash,
+                                                      file_path):
+                function_infos.append(function_info)
+                index = function_info['idx']
+    work.function_infos = function_infos
+
+
+# 阶段名 -> (依赖的阶段, 实现)
+STAGES = {
+    'clone': ([], stage_clone),
+    'diff_stats': (['clone'], stage_diff_stats),
+    'testcase': (['clone'], stage_testcase),
+    'getfunc': (['clone'], stage_getfunc),
+}
+
+
+def resolve_stages(names, with_deps=True):
+    """按拓扑顺序返回要运行的阶段"""
+    ordered = []
+
+    def visit(name, path=()):
+        if name not in STAGES:
+            raise KeyError(f'unknown stage: {name}')
+        if name in path:
+            raise ValueError(f'stage cycle: {" -> ".join(path + (name,))}')
+        if name in ordered:
+            return
+        if with_deps:
+            for dep in STAGES[name][0]:
+                visit(dep, path + (name,))
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def load_work_items(input_csv, base_path):
+    """
+    从输入 csv（第 4 列为 url）读取 commit 工作项，行号与 data_processing 的 index 一致。
+    同一 (仓库, commit) 的多行合并为一个工作项。
+    """
+    items = {}
+    with open(input_csv, 'r', encoding='utf-8') as csvfile:
+        for index, row in enumerate(csv.reader(csvfile), start=1):
+            url = row[3]
+            match = re.search(r'/([^/]+/[^/]+)/commit/([^/#]+)', url)
+            if not match:
+                print(f"URL {url} does not match the expected pattern.")
+                continue
+            key = work_units.unit_key(url) or (None, index)
+            if key in items:
+                items[key].rows.append((index, url))
+            else:
+                items[key] = CommitWork(index, url, match.group(1), match.group(2), base_path)
+    rows = sum(len(work.rows) for work in items.values())
+    print(f"{rows} rows -> {len(items)} unique commits")
+    return list(items.values())
+
+
+def process_work(stages, work, ctx, state):
+    """让一个 commit 依次经过所有阶段，处理完后释放其产物，并通知仓库缓存该 commit 已处理完"""
+    try:
+        for name in stages:
+            if work.skipped:
+                print(f"Skipping {work.url}: {work.skipped}")
+                break
+            if ctx.bundle is not None:
+                work.bundle = ctx.bundle.repo(work.repository_name)
+                work.blob_reader = work.bundle
+            else:
+                work.blob_reader = state.reader_for(work.repo_path)
+            if ctx.stream_diffs and ctx.bundle is None:
+                work.diff_stream = state.diff_stream_for(work.repo_path, ctx.repo_commits.get(work.repo_path, []))
+            work.http = ctx.http
+            work.change_detection = ctx.change_detection
+            with tracing.span(name, 'stage', repo=work.repo, commit=work.commit_hash):
+                STAGES[name][1](work, ctx, state)
+    finally:
+        if work.diff_stream is not None:
+            work.diff_stream.release(work.commit_hash)
+        work.blob_reader = None
+        work.diff_stream = None
+        work.bundle = None
+        work.artifacts.clear()
+        if ctx.repo_cache is not None:
+            ctx.repo_cache.done(os.path.basename(work.repo_path))
+
+
+def run(stages, work_items, ctx, workers=1):
+    scheduler = RepoAffinityScheduler(workers, make_state=lambda worker: WorkerState(ctx), close_state=WorkerState.close)
+    scheduler.run(work_items, lambda state, work: process_work(stages, work, ctx, state))
+    print(scheduler.report())
+    print(f"HTTP cache: {ctx.http.report()}")
+    print(ctx.commit_meta.report())
+    if ctx.sampler is not None:
+        print(ctx.sampler.report())
+    if ctx.bundle is not None:
+        print(ctx.bundle.report())
+
+
+def iter_function_infos(work_items, with_row=False):
+    """
+    按输入行的顺序输出 getfunc 记录，idx 连续编号；with_row 为 True 时带上输入行号，供分片合并排序。
+    合并的工作项为它的每一行各输出一份记录（与逐行计算的结果相同）。
+    """
+    index = 0
+    rows = sorted((row_index, work) for work in work_items for row_index, _ in work.rows)
+    for row_index, work in rows:
+        for function_info in work.function_infos:
+            index += 1
+            function_info = dict(function_info, idx=index)
+            if with_row:
+                function_info['row'] = row_index
+            yield function_info
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='统一流水线运行器')
+    parser.add_argument('--stages', nargs='+', default=['diff_stats', 'testcase', 'getfunc'],
+                        choices=list(STAGES), help='要运行的阶段')
+    parser.add_argument('--no-deps', dest='with_deps', action='store_false', help='不自动加入依赖的阶段')
+    parser.add_argument('--input', type=str, default=script_path('dataset', 'veracode_fliter.csv'), help='输入 csv')
+    parser.add_argument('--base_path', type=str, default=script_path('..', 'repo'), help='存放所有仓库的地方')
+    parser.add_argument('--db', type=str, default=script_path('dataset', 'results.db'), help='结果库')
+    parser.add_argument('--csv_output', type=str, default=script_path('dataset', 'output.csv'), help='由结果库导出的 csv')
+    parser.add_argument('--func_output', type=str, default=script_path('dataset', 'output_getfunc_test.jsonl'), help='getfunc 输出')
+    parser.add_argument('--grammar', type=str, default=script_path('build', 'my-languages.so'), help='tree-sitter Java 语法文件')
+    parser.add_argument('--mapping_output', type=str, default=script_path('tmp', 'output'), help='find_map_test_cases 输出目录')
+    parser.add_argument('--workers', type=int, default=1, help='worker 数，按仓库亲和性调度')
+    parser.add_argument('--cross_file', action='store_true',
+                        help='testcase 阶段用仓库级符号索引把测试用例映射到任意类中的焦点方法（symbol_index.py）')
+    parser.add_argument('--repo_cache', action='store_true',
+                        help='由 repo_cache.RepoCache 管理 base_path：fork 共享对象、写 commit-graph、按 LRU 淘汰')
+    parser.add_argument('--cache_gb', type=float, default=None, help='--repo_cache 的磁盘预算（GB），不传表示不限')
+    parser.add_argument('--http_cache', type=str, default=script_path('dataset', 'http_cache'), help='GitHub API 和 .diff 响应的缓存目录')
+    parser.add_argument('--offline', action='store_true', help='只使用 HTTP 缓存，不请求 GitHub')
+    parser.add_argument('--revalidate', action='store_true',
+                        help='每次运行都重新验证缓存的 GitHub API 响应（默认 1 天内直接使用）')
+    parser.add_argument('--change_detection', choices=ex.CHANGE_DETECTION_MODES, default='lines',
+                        help="getfunc 判断修改方法的方式：lines 映射 diff 行号；hash 比较方法主体哈希，忽略只改空白和注释的方法")
+    parser.add_argument('--unmodified_files', action='store_true',
+                        help='getfunc 同时输出未修改文件中的函数（target=0），同一仓库的连续 commit 只重新解析变化的 blob')
+    parser.add_argument('--negative_ratio', type=float, default=None,
+                        help='getfunc 每个修改函数只保留这么多个未修改函数（target=0），在写出前蓄水池抽样')
+    parser.add_argument('--sample_scope', choices=['commit', 'repo'], default='commit',
+                        help='--negative_ratio 的名额按 commit 计算，或在同一仓库的 commit 之间累计')
+    parser.add_argument('--sample_seed', type=int, default=0, help='负样本抽样的随机种子')
+    parser.add_argument('--stream_diffs', action='store_true',
+                        help='每个仓库只启动一个 git diff-tree --stdin 进程，按 commit 流式读取 diff')
+    parser.add_argument('--bundle', type=str, default=None,
+                        help='从 snapshot_bundle.py 导出的快照包读取 diff、blob、分支和元数据，不需要仓库和 git')
+    parser.add_argument('--shard', type=shard.parse_shard, default=None,
+                        help='i/N：只处理按仓库哈希划分的第 i 个分片（从 0 开始），输出写到各自的分片文件')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    stages = resolve_stages(args.stages, args.with_deps)
+    print(f"Running stages: {' -> '.join(stages)}")
+    if args.bundle and ('testcase' in stages or args.unmodified_files):
+        raise SystemExit('--bundle 只包含修改的文件：testcase 阶段和 --unmodified_files 需要本地仓库')
+    if args.shard is not None:
+        for name in ('db', 'csv_output', 'func_output'):
+            setattr(args, name, shard.shard_path(getattr(args, name), *args.shard))
+    csv_output = os.path.abspath(args.csv_output)
+    ctx = PipelineContext(args)
+    work_items = load_work_items(os.path.abspath(args.input), ctx.base_path)
+    if args.shard is not None:
+        shard_index, shard_count = args.shard
+        work_items = [w for w in work_items if shard.shard_of(w.repository_name, shard_count) == shard_index]
+        print(f"Shard {shard_index}/{shard_count}: {len(work_items)} commits")
+    for work in work_items:
+        ctx.commit_meta.expect(work.repo_path, [work.commit_hash])
+        ctx.repo_commits.setdefault(work.repo_path, []).append(work.commit_hash)
+        if ctx.repo_cache is not None:
+            ctx.repo_cache.expect(os.path.basename(work.repo_path))  # 还有待处理 commit 的仓库不会被淘汰
+    run(stages, work_items, ctx, args.workers)
+
+    if 'diff_stats' in stages or 'testcase' in stages:
+        store = ResultsStore(ctx.db)
+        store.export_csv(csv_output)
+        store.close()
+        print(f"Data has been written to {csv_output}")
+    if 'getfunc' in stages:
+        with open(ctx.func_output, 'w', encoding='utf-8') as output_file:
+            for function_info in iter_function_infos(work_items, with_row=args.shard is not None):
+                output_file.write(json.dumps(function_info) + '\n')
+        print(f"结果已写入文件{ctx.func_output}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+本地仓库缓存管理：磁盘预算、LRU 淘汰、git 维护和 fork 之间共享对象。
+
+../repo 下的克隆只增不减，也没有 commit-graph，`git branch --contains`、`git log`、`cat-file` 都比较慢。
+RepoCache 在 base_path/.repo_cache.json 中记录每个仓库的完整名称、最近使用时间、占用大小、引用关系：
+- ensure()：仓库不存在时克隆；如果是 fork 且上游（parent）已在缓存中，用 `--reference` 共享上游的对象；
+  已存在的仓库每次运行 fetch 一次
+- 克隆或 fetch 之后写入 commit-graph（含 changed-paths）和 multi-pack-index
+- 总大小超过预算时按最近使用时间淘汰仓库；正在使用或还有待处理 commit（expect() 登记）的仓库不淘汰；
+  被其他仓库作为 alternates 引用的仓库，先对引用方执行 `git repack -a -d` 并删除 alternates 文件，再删除
+用法：
+    python repo_cache.py status --base_path ../repo
+    python repo_cache.py maintain --base_path ../repo      # 为已有仓库补写 commit-graph / multi-pack-index
+    python repo_cache.py evict --base_path ../repo --budget_gb 200
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+
+from git_util import git, script_path
+
+STATE_FILE = '.repo_cache.json'
+
+
+def dir_size(path):
+    """目录占用的字节数（不跟随符号链接）"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def maintain(repo_path, repack=False):
+    """
+    写入 commit-graph 和 multi-pack-index，加速 --contains / log 和对象查找。
+
+    :param repack: 为 True 时先把松散对象和多个 pack 合并为一个（耗时较长）
+    """
+    if repack:
+        git(repo_path, 'repack', '-a', '-d', '--write-bitmap-index')
+    git(repo_path, 'commit-graph', 'write', '--reachable', '--changed-paths')
+    git(repo_path, 'multi-pack-index', 'write')
+
+
+class RepoCache():
+    """
+    :param base_path: 存放所有仓库的目录
+    :param budget_bytes: 缓存总大小上限（字节），None 表示不限
+    """
+
+    def __init__(self, base_path, budget_bytes=None):
+        self.base_path = os.path.abspath(base_path)
+        self.budget_bytes = budget_bytes
+        self.state_path = os.path.join(self.base_path, STATE_FILE)
+        self.lock = threading.RLock()
+        self.in_use = set()
+        self.pending = {}  # 仓库 -> 还未处理完的 commit 数
+        self.fetched = set()  # 本次运行中已 fetch 过的仓库
+        self.entries = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def path(self, repo):
+        return os.path.join(self.base_path, repo)
+
+    def _save(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def _entry(self, repo):
+        if repo not in self.entries:
+            self.entries[repo] = {'repository_name': None, 'last_used': 0, 'size': None, 'reference': None}
+        return self.entries[repo]
+
+    def touch(self, repo):
+        """记录一次使用"""
+        with self.lock:
+            self._entry(repo)['last_used'] = time.time()
+            self._save()
+
+    def scan(self):
+        """登记 base_path 下已有但未记录的仓库，并补全大小"""
+        with self.lock:
+            for name in sorted(os.listdir(self.base_path)):
+                path = self.path(name)
+                if os.path.isdir(os.path.join(path, '.git')):
+                    entry = self._entry(name)
+                    if entry['size'] is None:
+                        entry['size'] = dir_size(path)
+                        entry['last_used'] = entry['last_used'] or os.path.getmtime(path)
+            for name in [name for name in self.entries if not os.path.exists(self.path(name))]:
+                del self.entries[name]
+            self._save()
+
+    def total_size(self):
+        return sum(entry['size'] or 0 for entry in self.entries.values())
+
+    def ensure(self, repository_name, clone_url, parent=None):
+        """
+        保证仓库在缓存中，返回本地路径；克隆失败时返回 None。
+
+        :param repository_name: user/repo
+        :param clone_url: 克隆地址
+        :param parent: fork 的上游 user/repo（来自 GitHub API 的 parent.full_name），上游已缓存时共享其对象
+        """
+        repo = repository_name.split('/')[-1]
+        path = self.path(repo)
+        with self.lock:
+            self.in_use.add(repo)
+            exists = os.path.exists(path)
+            stale = exists and repo not in self.fetched
+            self.fetched.add(repo)
+        if exists:
+            if stale:
+                self.fetch(repo)  # 已有的克隆可能缺少新的 commit，也可能还没有 commit-graph
+            else:
+                self.touch(repo)
+            return path
+        reference = self._reference_for(parent, repo)
+        args = ['clone']
+        if reference is not None:
+            args += ['--reference-if-able', self.path(reference)]
+        result = git(self.base_path, *args, clone_url, repo, name='git clone', repo_name=repository_name)
+        if result.returncode != 0 or not os.path.exists(path):
+            print(f"Error cloning {repository_name}: {result.stderr.strip()}")
+            with self.lock:
+                self.in_use.discard(repo)
+            return None
+        maintain(path)
+        with self.lock:
+            entry = self._entry(repo)
+            entry.update(repository_name=repository_name, reference=reference, size=dir_size(path), last_used=time.time())
+            self._save()
+        self.evict()
+        return path
+
+    def _reference_for(self, parent, repo):
+        if not parent:
+            return None
+        reference = parent.split('/')[-1]
+        if reference == repo or not os.path.exists(self.path(reference)):
+            return None
+        return reference
+
+    def fetch(self, repo):
+        """更新仓库并重新写入 commit-graph / multi-pack-index"""
+        path = self.path(repo)
+        git(path, 'fetch', '--all', '--tags', '--prune')
+        maintain(path)
+        with self.lock:
+            entry = self._entry(repo)
+            entry.update(size=dir_size(path), last_used=time.time())
+            self._save()
+
+    def release(self, repo):
+        """仓库不再被当前运行使用，之后可以被淘汰"""
+        with self.lock:
+            self.in_use.discard(repo)
+
+    def expect(self, repo, count=1):
+        """登记仓库还有 count 个待处理的 commit，处理完之前不淘汰"""
+        with self.lock:
+            self.pending[repo] = self.pending.get(repo, 0) + count
+
+    def done(self, repo):
+        """一个登记过的 commit 处理完成"""
+        with self.lock:
+            if self.pending.get(repo, 0) > 1:
+                self.pending[repo] -= 1
+            else:
+                self.pending.pop(repo, None)
+
+    def dependents(self, repo):
+        return [name for name, entry in self.entries.items() if entry.get('reference') == repo]
+
+    def _dissociate(self, repo):
+        """把 alternates 中借用的对象复制到本仓库，之后删除 alternates"""
+        path = self.path(repo)
+        git(path, 'repack', '-a', '-d')
+        alternates = os.path.join(path, '.git', 'objects', 'info', 'alternates')
+        if os.path.exists(alternates):
+            os.remove(alternates)
+        maintain(path)
+        entry = self._entry(repo)
+        entry.update(reference=None, size=dir_size(path))
+
+    def evict(self, budget_bytes=None):
+        """
+        总大小超过预算时按最近使用时间从旧到新删除仓库，正在使用或还有待处理 commit 的仓库不删除。
+
+        :return: 被删除的仓库名列表
+        """
+        budget_bytes = self.budget_bytes if budget_bytes is None else budget_bytes
+        if budget_bytes is None:
+            return []
+        evicted = []
+        with self.lock:
+            candidates = sorted(self.entries, key=lambda name: self.entries[name]['last_used'])
+            for repo in candidates:
+                if self.total_size() <= budget_bytes:
+                    break
+                if repo in self.in_use or self.pending.get(repo):
+                    continue
+                for dependent in self.dependents(repo):
+                    self._dissociate(dependent)
+                print(f"Evicting {repo} ({(self.entries[repo]['size'] or 0) / 2 ** 20:.0f} MB)")
+                shutil.rmtree(self.path(repo), ignore_errors=True)
+                del self.entries[repo]
+                evicted.append(repo)
+            self._save()
+        return evicted
+
+    def report(self):
+        lines = [f"{'repo':<32}{'size(MB)':>10}{'last used':>22}  reference"]
+        for repo, entry in sorted(self.entries.items(), key=lambda kv: kv[1]['last_used'], reverse=True):
+            last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_used']))
+            lines.append(f"{repo:<32}{(entry['size'] or 0) / 2 ** 20:>10.1f}{last_used:>22}  {entry.get('reference') or ''}")
+        budget = f"{self.budget_bytes / 2 ** 30:.1f} GB" if self.budget_bytes else 'unlimited'
+        lines.append(f"total: {self.total_size() / 2 ** 30:.2f} GB / {budget}")
+        return '\n'.join(lines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='本地仓库缓存管理')
+    parser.add_argument('command', choices=['status', 'maintain', 'evict'])
+    parser.add_argument('--base_path', type=str, default=script_path('..', 'repo'), help='存放所有仓库的地方')
+    parser.add_argument('--budget_gb', type=float, default=None, help='缓存总大小上限（GB）')
+    parser.add_argument('--repack', action='store_true', help='maintain 时先执行 git repack -a -d')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    budget_bytes = int(args.budget_gb * 2 ** 30) if args.budget_gb else None
+    cache = RepoCache(args.base_path, budget_bytes)
+    cache.scan()
+    if args.command == 'maintain':
+        for repo in sorted(cache.entries):
+            print(f"Maintaining {repo}")
+            maintain(cache.path(repo), repack=args.repack)
+            cache.entries[repo]['size'] = dir_size(cache.path(repo))
+        cache._save()
+    elif args.command == 'evict':
+        cache.evict()
+    print(cache.report())
+
+
+if __name__ == '__main__':
+    main()
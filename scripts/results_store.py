@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import csv
+import argparse
+
+# output.csv 的表头，导出时按此顺序写列；subject 之后为 commit 元数据列（commit_meta.py）
+HEADER = ['index', 'cwe key word', 'matched key word', 'file', 'func', 'hunk', 'function_name', 'note', 'repo', 'branch', 'url', 'testcase',
+          'subject', 'author', 'author_date', 'commit_date', 'parents', 'files_changed']
+
+# 主键之外的列，各阶段只更新属于自己的列
+VALUE_COLUMNS = [c for c in HEADER if c not in ('index', 'repo')]
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset')
+DEFAULT_DB = os.path.join(DATASET_DIR, 'results.db')
+
+
+def _quote(column):
+    """列名里有空格（如 'cwe key word'），统一加双引号"""
+    return '"' + column.replace('"', '""') + '"'
+
+
+class ResultsStore():
+    """
+    以 (index, repo, commit) 为主键的结果库，替代每次重写整个 output.csv。
+
+    - data_processing 写 file/func/hunk 等统计列
+    - data_processing_testcase 只写 testcase 列
+    各阶段按行 upsert 自己的列，互不覆盖；使用 WAL 模式，多个进程可以同时写。
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, timeout=30):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_table()
+
+    def _create_table(self):
+        columns = ', '.join(f'{_quote(c)} TEXT' for c in VALUE_COLUMNS)
+        self.conn.execute(
+            f'CREATE TABLE IF NOT EXISTS results ('
+            f'"index" INTEGER NOT NULL, repo TEXT NOT NULL, "commit" TEXT NOT NULL, {columns}, '
+            f'PRIMARY KEY ("index", repo, "commit"))'
+        )
+        # 旧版本创建的结果库缺少后来加入的列
+        existing = {row[1] for row in self.conn.execute('PRAGMA table_info(results)')}
+        for c in VALUE_COLUMNS:
+            if c not in existing:
+                self.conn.execute(f'ALTER TABLE results ADD COLUMN {_quote(c)} TEXT')
+        self.conn.commit()
+
+    def upsert(self, index, repo, commit_hash, **columns):
+        """
+        插入或更新一行，只写入传入的列。
+
+        :param index: 行号（与输入 csv 的行号一致）
+        :param repo: 仓库名，如 tomcat
+        :param commit_hash: 提交哈希值
+        :param columns: 要写入的列，键为 HEADER 中的列名；列名中的空格用下划线代替（如 cwe_key_word）
+        """
+        values = {}
+        for key, value in columns.items():
+            column = key if key in VALUE_COLUMNS else key.replace('_', ' ')
+            if column not in VALUE_COLUMNS:
+                raise KeyError(f'unknown column: {key}')
+            values[column] = None if value is None else str(value)
+
+        names = ['"index"', 'repo', '"commit"'] + [_quote(c) for c in values]
+        placeholders = ', '.join('?' for _ in names)
+        if values:
+            updates = ', '.join(f'{_quote(c)}=excluded.{_quote(c)}' for c in values)
+            conflict = f'DO UPDATE SET {updates}'
+        else:
+            conflict = 'DO NOTHING'
+        sql = (f'INSERT INTO results ({", ".join(names)}) VALUES ({placeholders}) '
+               f'ON CONFLICT("index", repo, "commit") {conflict}')
+        with self.conn:
+            self.conn.execute(sql, [index, repo or '', commit_hash or ''] + list(values.values()))
+
+    def iter_rows(self, columns=None):
+        """按 index 顺序遍历所有行，每行返回一个 dict（额外带有 commit 列）"""
+        columns = columns or HEADER
+        names = ', '.join(_quote(c) for c in ['commit'] + [c for c in columns if c != 'commit'])
+        cursor = self.conn.execute(f'SELECT {names} FROM results ORDER BY "index"')
+        keys = [d[0] for d in cursor.description]
+        for row in cursor:
+            yield dict(zip(keys, row))
+
+    def export_csv(self, output_file):
+        """从结果库重新生成 output.csv"""
+        count = 0
+        with open(output_file, mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=HEADER, extrasaction='ignore')
+            writer.writeheader()
+            for row in self.iter_rows():
+                writer.writerow({k: ('' if v is None else v) for k, v in row.items()})
+                count += 1
+        return count
+
+    def import_csv(self, input_file):
+        """把已有的 output.csv 导入结果库（commit 从 url 中解析）"""
+        count = 0
+        with open(input_file, mode='r', newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                url = row.get('url', '')
+                commit_hash = url.rstrip('/').split('/commit/')[-1] if '/commit/' in url else ''
+                columns = {c: row[c] for c in VALUE_COLUMNS if row.get(c) not in (None, '')}
+                self.upsert(int(row['index']), row.get('repo', ''), commit_hash, **columns)
+                count += 1
+        return count
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='结果库（sqlite）与 output.csv 的导入导出')
+    parser.add_argument('command', choices=['export', 'import'], help='export: 生成 csv；import: 导入已有 csv')
+    parser.add_argument('--db', type=str, default=DEFAULT_DB, help='结果库路径')
+    parser.add_argument('--csv', type=str, default=os.path.join(DATASET_DIR, 'output.csv'), help='csv 文件路径')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    store = ResultsStore(args.db)
+    if args.command == 'export':
+        count = store.export_csv(args.csv)
+        print(f"{count} rows have been written to {args.csv}")
+    else:
+        count = store.import_csv(args.csv)
+        print(f"{count} rows have been imported into {args.db}")
+    store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+多机分片运行与确定性合并。
+
+按仓库名的哈希把 veracode_fliter.csv 的行划分到 N 个分片（同一仓库总在同一分片），
+每个分片独立运行 pipeline.py 并写出自己的结果库和 jsonl：
+    python pipeline.py --shard 0/4 ...
+    python pipeline.py --shard 1/4 ...
+全部完成后合并，得到与单机运行完全相同的 output.csv 和 jsonl（包括 idx 编号）：
+    python shard.py merge --shards 4
+本机测试可用 local 子命令并行启动 N 个进程后自动合并：
+    python shard.py local --shards 4 -- --stages diff_stats getfunc
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import subprocess
+
+from results_store import ResultsStore
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_shard(value):
+    """'i/N' -> (i, N)，i 从 0 开始"""
+    try:
+        index, count = (int(v) for v in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must look like i/N, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index out of range: {value!r}")
+    return index, count
+
+
+def shard_of(repository_name, count):
+    """仓库所属的分片；使用 sha1 而不是 hash()，保证不同机器、不同进程结果一致"""
+    digest = hashlib.sha1(repository_name.lower().encode('utf-8')).hexdigest()
+    return int(digest, 16) % count
+
+
+def shard_path(path, index, count):
+    """dataset/results.db -> dataset/results.shard-0-of-4.db"""
+    root, ext = os.path.splitext(path)
+    return f'{root}.shard-{index}-of-{count}{ext}'
+
+
+def merge_results(db_path, csv_output, count):
+    """合并各分片的结果库并导出 csv（按 index 排序，与单机一致）"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    store = ResultsStore(db_path)
+    for index in range(count):
+        part = shard_path(db_path, index, count)
+        if not os.path.exists(part):
+            print(f"Missing shard {part}")
+            continue
+        store.conn.execute('ATTACH DATABASE ? AS part', (part,))
+        with store.conn:
+            store.conn.execute('INSERT OR REPLACE INTO results SELECT * FROM part.results')
+        store.conn.execute('DETACH DATABASE part')
+    rows = store.export_csv(csv_output)
+    store.close()
+    return rows
+
+
+def merge_functions(func_output, count):
+    """
+    合并各分片的 jsonl：按输入行号（row）和分片内顺序排序后重新连续编号 idx，并去掉 row 字段。
+    各分片输出中同一行号的记录已按单机顺序排列，排序是稳定的。
+    """
+    records = []
+    for index in range(count):
+        part = shard_path(func_output, index, count)
+        if not os.path.exists(part):
+            print(f"Missing shard {part}")
+            continue
+        with open(part, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    function_info = json.loads(line)
+                    records.append((function_info['row'], function_info['idx'], function_info))
+    records.sort(key=lambda r: (r[0], r[1]))
+    with open(func_output, 'w', encoding='utf-8') as f:
+        for idx, (_, _, function_info) in enumerate(records, start=1):
+            function_info.pop('row')
+            function_info['idx'] = idx
+            f.write(json.dumps(function_info) + '\n')
+    return len(records)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='分片运行与合并')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('merge', 'local'):
+        p = sub.add_parser(name)
+        p.add_argument('--shards', type=int, required=True, help='分片数 N')
+        p.add_argument('--db', type=str, default=os.path.join(SCRIPT_DIR, 'dataset', 'results.db'), help='合并后的结果库')
+        p.add_argument('--csv_output', type=str, default=os.path.join(SCRIPT_DIR, 'dataset', 'output.csv'), help='合并后的 csv')
+        p.add_argument('--func_output', type=str, default=os.path.join(SCRIPT_DIR, 'dataset', 'output_getfunc_test.jsonl'), help='合并后的 jsonl')
+        if name == 'local':
+            p.add_argument('pipeline_args', nargs=argparse.REMAINDER, help='传给 pipeline.py 的其他参数（放在 -- 之后）')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'local':
+        extra = [a for a in args.pipeline_args if a != '--']
+        processes = []
+        for index in range(args.shards):
+            command = [sys.executable, os.path.join(SCRIPT_DIR, 'pipeline.py'), '--shard', f'{index}/{args.shards}',
+                       '--db', args.db, '--csv_output', args.csv_output, '--func_output', args.func_output] + extra
+            processes.append(subprocess.Popen(command))
+        failed = [p.args for p in processes if p.wait() != 0]
+        if failed:
+            print(f"{len(failed)} shard(s) failed, not merging")
+            sys.exit(1)
+
+    if os.path.exists(shard_path(args.db, 0, args.shards)):
+        rows = merge_results(args.db, args.csv_output, args.shards)
+        print(f"{rows} rows have been written to {args.csv_output}")
+    if os.path.exists(shard_path(args.func_output, 0, args.shards)):
+        records = merge_functions(args.func_output, args.shards)
+        print(f"{records} records have been written to {args.func_output}")
+
+
+if __name__ == '__main__':
+    main()
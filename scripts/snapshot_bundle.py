@@ -0,0 +1,358 @@
+"""
+commit 快照包：把流水线处理输入 csv 所需的 diff 和 blob 打包成一个文件，worker 不需要克隆仓库和 git。
+
+    python snapshot_bundle.py export --input dataset/veracode_fliter.csv --base_path ../repo --output dataset/snapshot.vdsb
+    python snapshot_bundle.py stats dataset/snapshot.vdsb
+    python pipeline.py --bundle dataset/snapshot.vdsb --stages diff_stats getfunc
+
+文件结构：
+    MAGIC                     8 字节
+    数据区                    blob 内容（按 git 对象 id 去重）和每个 commit 的 diff 文本，首尾相接
+    blob 索引                 定长行 (对象 id, 偏移, 长度)，按对象 id 升序，二分查找
+    清单                      JSON(utf-8)：每个仓库每个 commit 的 diff 位置、修改的 .java 文件在
+                              commit^ 和 commit 两侧的对象 id、所在分支和 commit 元数据
+    FOOTER                    blob 索引和清单的位置，结尾再写一次 MAGIC
+
+读取时 mmap 整个文件，只解码清单；blob 和 diff 按偏移切片。
+包中的内容与 pipeline 的 diff_stats、getfunc 阶段从 git 读取的相同（diff 与 --stream_diffs 一致）；
+testcase 阶段和 --unmodified_files 需要整个工作区或整棵树，不能使用快照包。
+"""
+
+import os
+import json
+import mmap
+import struct
+import bisect
+import argparse
+import subprocess
+
+import extract as ex
+from git_util import git, git_popen, script_path
+from commit_meta import existing_commits, lookup
+from diff_stream import DiffTreeStream
+
+BUNDLE_MAGIC = b'VDSB0001'
+# 对象 id（sha1 / sha256 的二进制，补齐到 32 字节）, offset, length
+BLOB_ROW = struct.Struct('<32sQQ')
+# blob 索引偏移, blob 数, 清单偏移, 清单长度, MAGIC
+FOOTER = struct.Struct('<QQQQ8s')
+
+
+def _oid_key(oid):
+    return bytes.fromhex(oid).ljust(32, b'\0')
+
+
+class SnapshotBundleWriter():
+    """
+    按顺序写入 blob 和 diff，close() 时写入 blob 索引、清单和 FOOTER。
+    先写到 path + '.tmp'，完成后再替换，读取端不会看到写了一半的文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(BUNDLE_MAGIC)
+        self.offset = len(BUNDLE_MAGIC)
+        self.blobs = {}  # 对象 id -> (偏移, 长度)
+        self.repos = {}  # 小写的 user/repo -> {'commits': {...}, 'aliases': {...}}
+        self.stats = {'commits': 0, 'blob_refs': 0, 'blob_bytes': 0, 'diff_bytes': 0}
+
+    def _append(self, data):
+        position = (self.offset, len(data))
+        self.file.write(data)
+        self.offset += len(data)
+        return position
+
+    def has_blob(self, oid):
+        return oid in self.blobs
+
+    def add_blob(self, oid, data):
+        if oid not in self.blobs:
+            self.blobs[oid] = self._append(data)
+            self.stats['blob_bytes'] += len(data)
+
+    def add_commit(self, repository_name, commit_hash, full_hash, diff_output, files, branches=None, meta=None):
+        """
+        :param repository_name: user/repo
+        :param commit_hash: 输入中的 commit 哈希（可以是缩写）
+        :param full_hash: 完整的 commit 哈希
+        :param files: {文件路径: [commit^ 侧的对象 id, commit 侧的对象 id]}，不存在的一侧为 None
+        """
+        repo = self.repos.setdefault(repository_name.lower(), {'commits': {}, 'aliases': {}})
+        repo['aliases'][commit_hash.lower()] = full_hash
+        if full_hash in repo['commits']:
+            return
+        data = diff_output.encode('utf-8')
+        repo['commits'][full_hash] = {
+            'diff': list(self._append(data)),
+            'files': files,
+            'branches': branches or [],
+            'meta': meta,
+        }
+        self.stats['commits'] += 1
+        self.stats['diff_bytes'] += len(data)
+        self.stats['blob_refs'] += sum(1 for sides in files.values() for oid in sides if oid)
+
+    def close(self):
+        index_offset = self.offset
+        for oid in sorted(self.blobs, key=_oid_key):
+            offset, length = self.blobs[oid]
+            self.file.write(BLOB_ROW.pack(_oid_key(oid), offset, length))
+        manifest_offset = index_offset + len(self.blobs) * BLOB_ROW.size
+        manifest = json.dumps({'repos': self.repos, 'stats': dict(self.stats, blobs=len(self.blobs))}).encode('utf-8')
+        self.file.write(manifest)
+        self.file.write(FOOTER.pack(index_offset, len(self.blobs), manifest_offset, len(manifest), BUNDLE_MAGIC))
+        self.file.close()
+        os.replace(self.path + '.tmp', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SnapshotBundle():
+    """
+    以 mmap 方式读取快照包。repo(user/repo) 返回该仓库的只读视图（BundleRepo），
+    可以代替 extract.CatFileBatch 作为 pipeline.CommitWork 的 blob_reader。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < len(BUNDLE_MAGIC) + FOOTER.size or self._data[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f'{path} is not a snapshot bundle')
+        index_offset, self.blob_count, manifest_offset, manifest_length, magic = \
+            FOOTER.unpack_from(self._data, len(self._data) - FOOTER.size)
+        if magic != BUNDLE_MAGIC:
+            raise ValueError(f'{path} is truncated')
+        self._index_offset = index_offset
+        manifest = json.loads(self._data[manifest_offset:manifest_offset + manifest_length])
+        self.repos = manifest['repos']
+        self.stats = manifest['stats']
+        self._oid_keys = _OidColumn(self)
+
+    def blob(self, oid):
+        """按对象 id 读取 blob 的原始字节，不存在返回 None"""
+        key = _oid_key(oid)
+        pos = bisect.bisect_left(self._oid_keys, key)
+        if pos == self.blob_count or self._oid_keys[pos] != key:
+            return None
+        _, offset, length = BLOB_ROW.unpack_from(self._data, self._index_offset + pos * BLOB_ROW.size)
+        return self._data[offset:offset + length]
+
+    def slice(self, position):
+        offset, length = position
+        return self._data[offset:offset + length]
+
+    def repo(self, repository_name):
+        return BundleRepo(self, repository_name)
+
+    def report(self):
+        stats = self.stats
+        return (f"snapshot bundle {self.path}: {len(self.repos)} repos, {stats['commits']} commits, "
+                f"{stats['blobs']} blobs ({stats['blob_refs']} references, {stats['blob_bytes']} bytes), "
+                f"{stats['diff_bytes']} diff bytes")
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BundleRepo():
+    """
+    快照包中一个仓库的视图，接口与 pipeline 从 git 读取时一致：
+    - diff(commit)：commit^..commit 的 diff 文本
+    - read(rev, file_path)：同 extract.CatFileBatch.read，rev 为 commit 或 commit^
+    - branches(commit) / columns(commit)：同 get_branches_containing_commit 和 CommitMetadata.columns
+    包中没有的 commit 或文件返回空值，与 git 中不存在时相同。
+    """
+
+    def __init__(self, bundle, repository_name):
+        self.bundle = bundle
+        self.repository_name = repository_name
+        self.entry = bundle.repos.get(repository_name.lower(), {'commits': {}, 'aliases': {}})
+
+    def commit(self, commit_hash):
+        """清单中的 commit 条目，不存在返回 None"""
+        full = self.entry['aliases'].get(commit_hash.lower(), commit_hash.lower())
+        return self.entry['commits'].get(full)
+
+    def diff(self, commit_hash):
+        commit = self.commit(commit_hash)
+        if commit is None:
+            return ''
+        return self.bundle.slice(commit['diff']).decode('utf-8', errors='ignore')
+
+    def read(self, rev, file_path):
+        parent = rev.endswith('^')
+        commit = self.commit(rev[:-1] if parent else rev)
+        if commit is None or file_path not in commit['files']:
+            return ""
+        oid = commit['files'][file_path][0 if parent else 1]
+        data = self.bundle.blob(oid) if oid else None
+        return data.decode('utf-8', errors='ignore') if data is not None else ""
+
+    def branches(self, commit_hash):
+        commit = self.commit(commit_hash)
+        return list(commit['branches']) if commit is not None else []
+
+    def columns(self, commit_hash):
+        commit = self.commit(commit_hash)
+        if commit is None or commit['meta'] is None:
+            return {}
+        return dict(commit['meta'], note=commit['meta']['subject'])
+
+    def close(self):
+        pass  # mmap 由 SnapshotBundle 持有
+
+
+class _OidColumn():
+    """把 blob 索引的对象 id 列包装成只读序列，供 bisect 使用"""
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+
+    def __len__(self):
+        return self.bundle.blob_count
+
+    def __getitem__(self, pos):
+        return BLOB_ROW.unpack_from(self.bundle._data, self.bundle._index_offset + pos * BLOB_ROW.size)[0]
+
+
+def resolve_objects(repo_path, specs):
+    """
+    一次 `git cat-file --batch-check` 把 <rev>:<path> 解析为 blob 的对象 id。
+
+    :return: {spec: 对象 id}，不存在或不是 blob 的 spec 不包含在内
+    """
+    specs = list(dict.fromkeys(specs))
+    if not specs:
+        return {}
+    result = git(repo_path, 'cat-file', '--batch-check=%(objectname) %(objecttype)', input='\n'.join(specs) + '\n',
+                 name='git cat-file --batch-check', blobs=len(specs))
+    resolved = {}
+    for spec, line in zip(specs, result.stdout.splitlines()):
+        fields = line.split()
+        if len(fields) == 2 and fields[1] == 'blob':
+            resolved[spec] = fields[0]
+    return resolved
+
+
+def read_objects(repo_path, oids):
+    """用一个 `git cat-file --batch` 进程依次读取对象，生成 (对象 id, 原始字节)"""
+    process = git_popen(repo_path, 'cat-file', '--batch',
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        for oid in oids:
+            process.stdin.write(f'{oid}\n'.encode('ascii'))
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+            if len(header) != 3:
+                continue
+            data = process.stdout.read(int(header[2]))
+            process.stdout.read(1)  # 结尾的换行
+            yield oid, data
+    finally:
+        process.stdin.close()
+        process.wait()
+
+
+def export_repo(writer, repo_path, work_items, http=None):
+    """
+    把一个仓库的工作项写入快照包：diff 用一个 diff-tree 进程流式读取，
+    修改的 .java 文件两侧的 blob 一次解析对象 id，只读取包中还没有的对象。
+
+    :return: 写入的 commit 数
+    """
+    import data_processing as dp
+
+    commits = [work.commit_hash for work in work_items]
+    resolved = existing_commits(repo_path, [c.lower() for c in commits])
+    metas = lookup(repo_path, commits)
+    stream = DiffTreeStream(repo_path, commits)
+    pending = []
+    try:
+        for work in work_items:
+            full = resolved.get(work.commit_hash.lower())
+            if full is None:
+                # 与 pipeline 相同：本地没有该 commit 时 diff 为空（或来自 url.diff），仍然写入结果
+                print(f"the repo {work.repo} local is bad: {work.commit_hash}")
+                full = work.commit_hash.lower()
+            diff_output = stream.diff(work.commit_hash)
+            if not diff_output and http is not None:
+                diff_output = http.get(work.url + '.diff').text or ''
+            paths = [p for p in ex.split_diff_by_file(diff_output) if p.endswith('java')]
+            pending.append((work, full, diff_output, paths))
+    finally:
+        stream.close()
+
+    found = set(resolved.values())
+    specs = [f'{full}{side}:{path}' for _, full, _, paths in pending if full in found
+             for path in paths for side in ('^', '')]
+    oids = resolve_objects(repo_path, specs)
+    missing = [oid for oid in dict.fromkeys(oids.values()) if not writer.has_blob(oid)]
+    for oid, data in read_objects(repo_path, missing):
+        writer.add_blob(oid, data)
+    for work, full, diff_output, paths in pending:
+        files = {path: [oids.get(f'{full}^:{path}'), oids.get(f'{full}:{path}')] for path in paths}
+        writer.add_commit(work.repository_name, work.commit_hash, full, diff_output, files,
+                          branches=dp.get_branches_containing_commit(repo_path, work.commit_hash),
+                          meta=metas.get(work.commit_hash.lower()))
+    return len(pending)
+
+
+def export(input_csv, base_path, output, http=None):
+    """按 pipeline.load_work_items 的工作项导出快照包，同一仓库的 commit 一起处理"""
+    from pipeline import load_work_items
+
+    work_items = load_work_items(input_csv, os.path.abspath(base_path))
+    by_repo = {}
+    for work in work_items:
+        by_repo.setdefault(work.repo_path, []).append(work)
+    with SnapshotBundleWriter(output) as writer:
+        for repo_path, items in by_repo.items():
+            if not os.path.exists(repo_path):
+                print(f"Skipping {repo_path}: repo missing ({len(items)} commits)")
+                continue
+            export_repo(writer, repo_path, items, http)
+    with SnapshotBundle(output) as bundle:
+        print(bundle.report())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='commit 快照包')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='从本地仓库导出输入 csv 所需的 diff 和 blob')
+    export_parser.add_argument('--input', type=str, default=script_path('dataset', 'veracode_fliter.csv'), help='输入 csv')
+    export_parser.add_argument('--base_path', type=str, default=script_path('..', 'repo'), help='存放所有仓库的地方')
+    export_parser.add_argument('--output', type=str, default=script_path('dataset', 'snapshot.vdsb'), help='快照包路径')
+    export_parser.add_argument('--http_cache', type=str, default=script_path('dataset', 'http_cache'),
+                               help='本地 diff 为空时从该缓存获取 url.diff')
+    export_parser.add_argument('--offline', action='store_true', help='只使用 HTTP 缓存，不请求 GitHub')
+    stats_parser = subparsers.add_parser('stats', help='查看快照包的内容统计')
+    stats_parser.add_argument('bundle', type=str)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == 'export':
+        from http_cache import HttpCache
+        http = HttpCache(os.path.abspath(args.http_cache), offline=args.offline)
+        export(os.path.abspath(args.input), args.base_path, os.path.abspath(args.output), http)
+        return
+    with SnapshotBundle(args.bundle) as bundle:
+        print(bundle.report())
+
+
+if __name__ == '__main__':
+    main()
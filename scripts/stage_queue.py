@@ -0,0 +1,264 @@
+"""
+进程内的分阶段流水线：各阶段之间用有界队列连接，每个阶段有自己的线程。
+
+main_process 对每个文件依次读取 blob、计算 diff、解析、输出记录，git 运行时 CPU 空闲，解析时 git 空闲。
+这里把这几步拆成阶段并行执行：
+    io（git 读取 blob / diff） -> parse（tree-sitter 解析，解析期间释放 GIL） -> 调用方线程（生成记录）
+    -> write（WriterThread，序列化并写出）
+- 队列有界，下游跟不上时上游阻塞（背压），同时在途的条目数不超过 max_inflight，内存有上限
+- 调用方按输入顺序拿到结果，输出的 idx 编号与顺序执行完全一致
+- 某个条目的阶段函数抛出异常时，调用方在该条目的位置收到同样的异常，其余线程随即停止
+- 每个阶段记录处理条数、忙碌时间、因背压阻塞的时间以及输入队列深度（最大值 / 平均值）
+
+用法：
+    metrics = PipelineMetrics()
+    pipeline = StagedPipeline([('io', fetch, 2), ('parse', parse, 1)], queue_size=8, metrics=metrics)
+    with WriterThread(write_records, queue_size=8, metrics=metrics) as writer:
+        for item, result in pipeline.run(file_paths):
+            writer.put(make_records(item, result))
+    print(metrics.report())
+"""
+
+import time
+import queue
+import threading
+from collections import OrderedDict
+
+_DONE = object()
+
+
+class _Failed():
+    """阶段函数抛出的异常，沿流水线传到调用方后重新抛出"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class StageMetrics():
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.blocked = 0.0   # 向下游队列 put 时因背压阻塞的时间
+        self.max_depth = 0
+        self.depth_total = 0
+        self.samples = 0
+        self.lock = threading.Lock()
+
+    def sample(self, depth):
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+            self.depth_total += depth
+            self.samples += 1
+
+    def add(self, busy=0.0, blocked=0.0, items=0):
+        with self.lock:
+            self.busy += busy
+            self.blocked += blocked
+            self.items += items
+
+    def mean_depth(self):
+        return self.depth_total / self.samples if self.samples else 0.0
+
+    def to_dict(self):
+        return {'items': self.items, 'busy': round(self.busy, 3), 'blocked': round(self.blocked, 3),
+                'max_depth': self.max_depth, 'mean_depth': round(self.mean_depth(), 2)}
+
+
+class PipelineMetrics():
+    """按阶段名汇总的指标，可在多次 run（多个 commit）之间累计"""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.runs = 0
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def to_dict(self):
+        return {name: s.to_dict() for name, s in self.stages.items()}
+
+    def report(self):
+        lines = [f"{'stage':<10}{'items':>8}{'busy(s)':>10}{'blocked(s)':>12}{'max_q':>7}{'mean_q':>8}"]
+        for s in self.stages.values():
+            lines.append(f"{s.name:<10}{s.items:>8}{s.busy:>10.2f}{s.blocked:>12.2f}{s.max_depth:>7}{s.mean_depth():>8.2f}")
+        lines.append(f"runs: {self.runs}")
+        return '\n'.join(lines)
+
+
+class StagedPipeline():
+    """
+    :param stages: [(阶段名, 函数, 线程数)]；函数接收上一阶段的结果（第一阶段接收输入条目），返回交给下一阶段的结果
+    :param queue_size: 每个阶段输入队列的容量
+    :param max_inflight: 同时在途（已进入流水线但尚未交给调用方）的条目上限，默认 queue_size * (阶段数 + 1)
+    :param metrics: PipelineMetrics，不传则新建；最后一个队列（调用方读取的队列）记在 'output' 下
+    """
+
+    def __init__(self, stages, queue_size=8, max_inflight=None, metrics=None):
+        self.stages = [(name, fn, max(1, workers)) for name, fn, workers in stages]
+        self.queue_size = max(1, queue_size)
+        self.max_inflight = max_inflight or self.queue_size * (len(self.stages) + 1)
+        self.metrics = metrics if metrics is not None else PipelineMetrics()
+
+    @staticmethod
+    def _put(q, value, producer, consumer):
+        """放入下游队列：阻塞时间记到生产方，队列深度记到消费方"""
+        start = time.perf_counter()
+        q.put(value)
+        if producer is not None:
+            producer.add(blocked=time.perf_counter() - start)
+        consumer.sample(q.qsize())
+
+    def run(self, items):
+        """
+        生成器：按输入顺序产出 (条目, 最后一个阶段的结果)。
+        提前关闭生成器或抛出异常时，等待所有线程退出后再返回。
+        """
+        self.metrics.runs += 1
+        queues = [queue.Queue(self.queue_size) for _ in self.stages] + [queue.Queue(self.queue_size)]
+        stage_metrics = [self.metrics.stage(name) for name, _, _ in self.stages]
+        output_metrics = self.metrics.stage('output')
+        inflight = threading.Semaphore(self.max_inflight)
+        stop = threading.Event()
+        items = list(items)
+
+        def feed():
+            for seq, item in enumerate(items):
+                inflight.acquire()
+                if stop.is_set():
+                    break
+                self._put(queues[0], (seq, item), None, stage_metrics[0])
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_DONE)
+
+        def work(stage_index, fn, remaining):
+            in_q, out_q = queues[stage_index], queues[stage_index + 1]
+            out_metrics = stage_metrics[stage_index + 1] if stage_index + 1 < len(self.stages) else output_metrics
+            metrics = stage_metrics[stage_index]
+            while True:
+                task = in_q.get()
+                if task is _DONE:
+                    break
+                seq, value = task
+                if not isinstance(value, _Failed) and not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        value = fn(value)
+                    except Exception as e:
+                        value = _Failed(e)
+                    metrics.add(busy=time.perf_counter() - start, items=1)
+                self._put(out_q, (seq, value), metrics, out_metrics)
+            # 本阶段最后一个退出的线程通知下一阶段
+            with remaining['lock']:
+                remaining['count'] -= 1
+                last = remaining['count'] == 0
+            if last:
+                next_workers = self.stages[stage_index + 1][2] if stage_index + 1 < len(self.stages) else 1
+                for _ in range(next_workers):
+                    out_q.put(_DONE)
+
+        threads = [threading.Thread(target=feed, name='stage-feed', daemon=True)]
+        for stage_index, (name, fn, workers) in enumerate(self.stages):
+            remaining = {'count': workers, 'lock': threading.Lock()}
+            threads += [threading.Thread(target=work, args=(stage_index, fn, remaining), name=f'stage-{name}-{i}', daemon=True)
+                        for i in range(workers)]
+        for t in threads:
+            t.start()
+
+        pending = {}
+        next_seq = 0
+        finished = False
+        try:
+            while not finished:
+                task = queues[-1].get()
+                if task is _DONE:
+                    finished = True
+                    break
+                seq, value = task
+                pending[seq] = value
+                while next_seq in pending:
+                    value = pending.pop(next_seq)
+                    if isinstance(value, _Failed):
+                        raise value.error
+                    yield items[next_seq], value
+                    output_metrics.add(items=1)
+                    next_seq += 1
+                    inflight.release()
+        finally:
+            if not finished:
+                # 提前结束：停止各阶段，排空队列让线程退出
+                stop.set()
+                for _ in range(len(items)):
+                    inflight.release()
+                while queues[-1].get() is not _DONE:
+                    pass
+            for t in threads:
+                t.join()
+
+
+class WriterThread():
+    """
+    写出阶段：调用方 put() 的条目经有界队列交给一个后台线程，按 put 的顺序调用 write 写出。
+    队列满时 put() 阻塞（背压），所以调用方积压的待写条目不超过 queue_size；
+    write 抛出的异常在下一次 put() 或 close() 时在调用方重新抛出，之后的条目不再写出。
+    指标记在 metrics 的 name 阶段下（写出条数、忙碌时间、队列深度），
+    调用方因背压阻塞的时间记在 producer 阶段下（默认 'output'，即 StagedPipeline 的调用方）。
+
+    :param write: 写出一个条目的函数
+    :param queue_size: 队列容量
+    :param metrics: PipelineMetrics，不传则新建
+    """
+
+    def __init__(self, write, queue_size=8, metrics=None, name='write', producer='output'):
+        metrics = metrics if metrics is not None else PipelineMetrics()
+        self.write = write
+        self.queue = queue.Queue(max(1, queue_size))
+        self.metrics = metrics.stage(name)
+        self.producer = metrics.stage(producer)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=f'stage-{name}', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                break
+            if self.error is not None:
+                continue  # 出错后只排空队列，让调用方不会阻塞
+            start = time.perf_counter()
+            try:
+                self.write(item)
+            except Exception as e:
+                self.error = e
+            self.metrics.add(busy=time.perf_counter() - start, items=1)
+
+    def put(self, item):
+        if self.error is not None:
+            raise self.error
+        StagedPipeline._put(self.queue, item, self.producer, self.metrics)
+
+    def close(self):
+        """写完队列中的全部条目后返回"""
+        if self.thread.is_alive():
+            self.queue.put(_DONE)
+            self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 调用方出错：已提交的条目照常写完，写出阶段自己的异常不覆盖调用方的异常
+            try:
+                self.close()
+            except Exception:
+                pass
+        return False
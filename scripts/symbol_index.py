@@ -0,0 +1,295 @@
+"""
+仓库级的 Java 符号索引，用于跨文件的 测试用例 -> 焦点方法 映射。
+
+find_map_test_cases 只在按文件名匹配到的那一个焦点类中查找焦点方法，每个测试用例都要线性扫描方法列表，
+调用其他类中方法的测试永远映射不上。SymbolIndex 对仓库中所有 .java 文件做一次并行解析
+（TestParser.parse_file 的方法头部分，外加 package / import），建立：
+- 类 -> 方法：classes[全限定类名]
+- 方法名 -> 声明它的类：declarations[小写方法名]
+- 调用名 -> 调用它的方法：invokers[小写方法名]，用于回答 "修改的方法被谁调用 / 调用了谁"
+- 每个文件的 import 解析：visible_classes(文件) 为该文件能直接引用的非测试类（本文件、同包、单类 import、通配符 import）
+测试用例的名称和调用名与焦点方法的匹配都变成字典查找。
+
+用法：
+    python symbol_index.py --repo_path ../repo/some-repo                       # 统计
+    python symbol_index.py --repo_path ../repo/some-repo --callers parseHeader
+    python symbol_index.py --repo_path ../repo/some-repo --callees com.example.Foo.parseHeader
+"""
+
+import os
+import re
+import glob
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from java_grammar import DEFAULT_GRAMMAR
+
+# 顶层类型声明及其类体节点
+TYPE_DECLARATIONS = ('class_declaration', 'interface_declaration', 'enum_declaration')
+METHOD_DECLARATIONS = ('method_declaration', 'constructor_declaration')
+
+
+def is_test_file(rel_path):
+    return 'src/test' in rel_path
+
+
+def parse_file_symbols(test_parser, path):
+    """
+    解析一个 Java 文件的包名、import 和顶层类型中的方法头（所有方法都带调用名）。
+
+    :param test_parser: TestParser 对象
+    :return: {'package': 包名, 'imports': [import 的名称，如 a.b.C、a.b.*], 'classes': [{'identifier', 'methods'}]}；
+             文件无法读取时返回 None
+    """
+    from TestParser import TestParser
+
+    content = TestParser.read_source(path)  # 与 parse_file 一样把 \r\n 统一为 \n
+    if content is None:
+        return None
+    tree = test_parser.parser.parse(content)
+
+    symbols = {'package': '', 'imports': [], 'classes': []}
+    for node in tree.root_node.children:
+        if node.type == 'package_declaration':
+            symbols['package'] = re.sub(r'^package\s+|[\s;]', '', TestParser.text_of(node, content))
+        elif node.type == 'import_declaration':
+            symbols['imports'].append(re.sub(r'^import\s+(static\s+)?|[\s;]', '', TestParser.text_of(node, content)))
+        elif node.type in TYPE_DECLARATIONS:
+            identifiers = [child for child in node.children if child.type == 'identifier']
+            if not identifiers:
+                continue
+            class_identifier = TestParser.text_of(identifiers[0], content).strip()
+            methods = []
+            body = node.child_by_field_name('body')
+            members = list(body.children) if body is not None else []
+            # enum 的方法在 enum_body_declarations 中
+            for member in [m for m in members if m.type == 'enum_body_declarations']:
+                members.extend(member.children)
+            for member in members:
+                if member.type in METHOD_DECLARATIONS:
+                    methods.append(TestParser.get_function_header(class_identifier, member, content, invocations=True))
+            symbols['classes'].append({'identifier': class_identifier, 'methods': methods})
+    return symbols
+
+
+class SymbolIndex():
+    """
+    :param root: 仓库根目录
+    :param files: {相对路径: parse_file_symbols 的结果}
+    """
+
+    def __init__(self, root, files):
+        self.root = root
+        self.files = files
+        self.classes = {}  # 全限定类名 -> {'identifier', 'file', 'package', 'methods'}
+        self.file_classes = defaultdict(dict)  # 相对路径 -> {类名: 全限定类名}
+        self.packages = defaultdict(list)  # 包名 -> [全限定类名]（仅非测试文件）
+        self.declarations = defaultdict(list)  # 小写方法名 -> [(全限定类名, 方法)]
+        self.invokers = defaultdict(list)  # 小写调用名 -> [(全限定类名, 方法)]
+        self._visible = {}
+        for rel_path, symbols in files.items():
+            for parsed_class in symbols['classes']:
+                fqcn = f"{symbols['package']}.{parsed_class['identifier']}" if symbols['package'] else parsed_class['identifier']
+                self.classes[fqcn] = dict(parsed_class, file=rel_path, package=symbols['package'])
+                self.file_classes[rel_path][parsed_class['identifier']] = fqcn
+                if not is_test_file(rel_path):
+                    self.packages[symbols['package']].append(fqcn)
+                for method in parsed_class['methods']:
+                    self.declarations[method['identifier'].lower()].append((fqcn, method))
+                    for name in set(method['invocations']):
+                        self.invokers[name.lower()].append((fqcn, method))
+
+    @classmethod
+    def build(cls, root, java_files, grammar_file, language='java', workers=4):
+        """
+        并行解析 java_files（相对于 root 的路径）建立索引；每个线程一个 TestParser（Parser 不能跨线程共享）。
+        """
+        from TestParser import TestParser
+
+        local = threading.local()
+
+        def parse(rel_path):
+            if getattr(local, 'parser', None) is None:
+                local.parser = TestParser(grammar_file, language)
+            return rel_path, parse_file_symbols(local.parser, os.path.join(root, rel_path))
+
+        with tracing.span('build symbol index', 'parse', repo=root, files=len(java_files)):
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                files = {rel_path: symbols for rel_path, symbols in executor.map(parse, java_files) if symbols is not None}
+        return cls(root, files)
+
+    def visible_classes(self, rel_path):
+        """文件中可以直接引用的非测试类（全限定名集合）：本文件、同包、单类 import 和通配符 import 的类"""
+        if rel_path in self._visible:
+            return self._visible[rel_path]
+        symbols = self.files.get(rel_path, {'package': '', 'imports': [], 'classes': []})
+        visible = set(self.packages.get(symbols['package'], []))
+        for name in symbols['imports']:
+            if name.endswith('.*'):
+                package = name[:-2]
+                visible.update(self.packages.get(package, []))
+                # import a.b.Outer.* 或 import static a.b.C.*
+                if package in self.classes:
+                    visible.add(package)
+            elif name in self.classes:
+                visible.add(name)
+            elif name.rsplit('.', 1)[0] in self.classes:
+                visible.add(name.rsplit('.', 1)[0])  # import static a.b.C.method
+        visible = {fqcn for fqcn in visible if not is_test_file(self.classes[fqcn]['file'])}
+        self._visible[rel_path] = visible
+        return visible
+
+    def resolve(self, rel_path, method_name):
+        """在文件可见的类中查找名为 method_name（不区分大小写）的方法，返回 [(全限定类名, 方法)]"""
+        visible = self.visible_classes(rel_path)
+        return [(fqcn, method) for fqcn, method in self.declarations.get(method_name.lower(), []) if fqcn in visible]
+
+    def test_cases(self, rel_path):
+        """文件中带 @Test 的方法"""
+        symbols = self.files.get(rel_path)
+        if symbols is None:
+            return []
+        return [method for parsed_class in symbols['classes'] for method in parsed_class['methods'] if method['testcase']]
+
+    def focal_methods(self, rel_path):
+        """文件中的非测试方法（find_map_test_cases 的潜在焦点方法）"""
+        symbols = self.files.get(rel_path)
+        if symbols is None:
+            return []
+        return [method for parsed_class in symbols['classes'] for method in parsed_class['methods'] if not method['testcase']]
+
+    def match_test_case(self, test_file, test_case, focal_file=None):
+        """
+        为一个测试用例查找焦点方法，依次尝试：
+        1. 按文件名匹配到的焦点类（focal_file）中的同名方法 / 唯一被调用的方法（与 match_test_cases 相同）
+        2. 测试文件可见的所有类中的同名方法，只有一个类声明时才算匹配
+        3. 测试文件可见的所有类中唯一被调用的方法
+
+        :return: (焦点类的全限定名, 焦点方法, 匹配方式) 或 None
+        """
+        name = test_case['identifier'].lower().replace("test", "")
+        invoked = {invocation.lower() for invocation in test_case['invocations']}
+
+        if focal_file is not None:
+            focal_methods = {}
+            for method in self.focal_methods(focal_file):
+                focal_methods.setdefault(method['identifier'].lower(), method)
+            if name in focal_methods:
+                focal = focal_methods[name]
+                return self.file_classes[focal_file].get(focal['class']), focal, 'name'
+            overlap = invoked.intersection(focal_methods)
+            if len(overlap) == 1:
+                focal = focal_methods[overlap.pop()]
+                return self.file_classes[focal_file].get(focal['class']), focal, 'single-invocation'
+
+        candidates = self.resolve(test_file, name)
+        if len({fqcn for fqcn, _ in candidates}) == 1:
+            return candidates[0][0], candidates[0][1], 'index-name'
+
+        matches = {}
+        for invocation in invoked:
+            for fqcn, method in self.resolve(test_file, invocation):
+                matches.setdefault((fqcn, invocation), method)
+        if len(matches) == 1:
+            (fqcn, _), method = matches.popitem()
+            return fqcn, method, 'index-single-invocation'
+        return None
+
+    def match_test_cases(self, test_file, focal_file, test_cases, log):
+        """
+        与 find_map_test_cases.match_test_cases 的输出格式相同：[{'test_class', 'test_case', 'focal_class', 'focal_method'}]，
+        focal_class 为焦点方法所在的文件（可能不是 focal_file）。
+        """
+        mapped_test_cases = list()
+        for test_case in test_cases:
+            log.write("Test-Case: " + test_case['identifier'] + '\n')
+            match = self.match_test_case(test_file, test_case, focal_file)
+            if match is None:
+                continue
+            fqcn, focal, strategy = match
+            mapped_test_cases.append({
+                'test_class': test_file,
+                'test_case': test_case,
+                'focal_class': self.classes[fqcn]['file'] if fqcn else focal_file,
+                'focal_method': focal,
+            })
+            log.write(f"> [{strategy}] Found Focal-Method:" + focal['identifier'] + '\n')
+        log.write("+++++++++" + '\n')
+        log.write("Test-Cases: " + str(len(test_cases)) + '\n')
+        log.write("Mapped Test Cases: " + str(len(mapped_test_cases)) + '\n')
+        return mapped_test_cases
+
+    def callers(self, method_name, fqcn=None):
+        """
+        调用名为 method_name 的方法的所有方法，返回 [(全限定类名, 方法)]。
+        给出 fqcn 时只保留能看到该类的调用方（同一个类，或所在文件可以引用该类）。
+        """
+        callers = self.invokers.get(method_name.lower(), [])
+        if fqcn is None:
+            return list(callers)
+        return [(caller, method) for caller, method in callers
+                if caller == fqcn or fqcn in self.visible_classes(self.classes[caller]['file'])]
+
+    def callees(self, fqcn, method_name):
+        """
+        类 fqcn 中名为 method_name 的方法调用的方法：优先解析到同一个类，其次是所在文件可见的类。
+
+        :return: [(全限定类名, 方法)]
+        """
+        declared = self.classes.get(fqcn)
+        if declared is None:
+            return []
+        own = {}
+        for method in declared['methods']:
+            own.setdefault(method['identifier'].lower(), method)
+        callees = []
+        for method in declared['methods']:
+            if method['identifier'] != method_name:
+                continue
+            for invocation in dict.fromkeys(method['invocations']):
+                if invocation.lower() in own:
+                    callees.append((fqcn, own[invocation.lower()]))
+                else:
+                    callees.extend(self.resolve(declared['file'], invocation))
+        return callees
+
+    def report(self):
+        methods = sum(len(c['methods']) for c in self.classes.values())
+        return f"{len(self.files)} files, {len(self.classes)} classes, {methods} methods, {len(self.declarations)} method names"
+
+
+def java_files(root):
+    """root 下所有 .java 文件的相对路径（与 find_map_test_cases 相同）"""
+    files = glob.glob(os.path.join(root, '**', '*.java'), recursive=True)
+    return [os.path.relpath(f, root).replace('\\', '/') for f in files]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='仓库级 Java 符号索引')
+    parser.add_argument('--repo_path', type=str, required=True, help='仓库路径')
+    parser.add_argument('--grammar', type=str, default=DEFAULT_GRAMMAR, help='tree-sitter Java 语法文件')
+    parser.add_argument('--workers', type=int, default=4, help='并行解析的线程数')
+    parser.add_argument('--callers', type=str, default=None, help='列出调用该方法名的方法')
+    parser.add_argument('--callees', type=str, default=None, help='全限定类名.方法名：列出该方法调用的方法')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    root = os.path.abspath(args.repo_path)
+    index = SymbolIndex.build(root, java_files(root), os.path.abspath(args.grammar), workers=args.workers)
+    print(index.report())
+    if args.callers:
+        for fqcn, method in index.callers(args.callers):
+            print(f"{fqcn}: {method['signature']}")
+    if args.callees:
+        fqcn, method_name = args.callees.rsplit('.', 1)
+        for callee, method in index.callees(fqcn, method_name):
+            print(f"{callee}: {method['signature']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+离线生成合成的 Java 仓库及提交历史，供 benchmark.py 使用。
+
+生成的仓库结构与 maven 项目一致：
+    src/main/java/com/example/pkgK/ClassN.java       焦点类
+    src/test/java/com/example/pkgK/ClassNTest.java   测试类（按 test_ratio 生成）
+每个提交随机选取若干文件，修改其中部分方法的主体。
+"""
+
+import os
+import random
+import argparse
+
+from git_util import git as run_git
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'bench',
+    'GIT_AUTHOR_EMAIL': 'bench@example.com',
+    'GIT_COMMITTER_NAME': 'bench',
+    'GIT_COMMITTER_EMAIL': 'bench@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+
+def git(repo_path, *args):
+    return run_git(repo_path, *args, env=GIT_ENV, check=True).stdout
+
+
+def method_source(rng, name, body_lines, version=0):
+    """生成一个方法的源码；version 不同时方法主体不同"""
+    lines = [
+        '    /**',
+        f'     * {name} 的说明',
+        '     */',
+        f'    public int {name}(int value, String label) {{',
+        f'        int total = value + {version};',
+    ]
+    for i in range(body_lines):
+        kind = rng.randint(0, 3)
+        if kind == 0:
+            lines.append(f'        total += label.length() * {i};  // 累加')
+        elif kind == 1:
+            lines.append(f'        if (total > {rng.randint(10, 1000)}) {{ total -= {i}; }}')
+        elif kind == 2:
+            lines.append(f'        String s{i} = "{{literal}} " + total;')
+        else:
+            lines.append(f'        total = helper{i % 3}(total);')
+    lines.append('        return total;')
+    lines.append('    }')
+    return lines
+
+
+def class_source(rng, package, class_name, method_count, body_lines, versions):
+    lines = [f'package {package};', '', 'import java.util.List;', '', f'public class {class_name} {{', '']
+    lines.append('    private static final String[] NAMES = {')
+    lines.extend(f'        "name{i}",' for i in range(body_lines))
+    lines.append('    };')
+    lines.append('')
+    for i in range(3):
+        lines.append(f'    private int helper{i}(int v) {{ return v + {i}; }}')
+        lines.append('')
+    for m in range(method_count):
+        lines.extend(method_source(rng, f'method{m}', body_lines, versions.get(m, 0)))
+        lines.append('')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def test_source(package, class_name, method_count):
+    lines = [f'package {package};', '', 'import org.junit.Test;', '', f'public class {class_name}Test {{', '']
+    for m in range(method_count):
+        lines.extend([
+            '    @Test',
+            f'    public void testMethod{m}() {{',
+            f'        {class_name} target = new {class_name}();',
+            f'        target.method{m}(1, "x");',
+            '    }',
+            '',
+        ])
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_repo(repo_path, file_count=20, method_count=10, body_lines=8, test_ratio=0.5,
+                  commit_count=10, files_per_commit=3, methods_per_commit=2, packages=4, seed=0):
+    """
+    生成合成仓库并返回修改提交的哈希列表（按提交顺序）。
+
+    :param repo_path: 仓库目录（不存在时创建）
+    :param file_count: 焦点类文件数
+    :param method_count: 每个类的方法数
+    :param body_lines: 每个方法主体的行数，决定文件大小
+    :param test_ratio: 有对应测试类的焦点类比例
+    :param commit_count: 初始提交之后的修改提交数
+    :param files_per_commit: 每个提交修改的文件数
+    :param methods_per_commit: 每个被修改文件中修改的方法数
+    :param seed: 随机种子，相同参数生成相同仓库
+    """
+    rng = random.Random(seed)
+    repo_path = os.path.abspath(repo_path)
+    os.makedirs(repo_path, exist_ok=True)
+    git(repo_path, 'init', '-q')
+
+    classes = []
+    versions = {}
+    for n in range(file_count):
+        package = f'com.example.pkg{n % packages}'
+        class_name = f'Class{n}'
+        rel_dir = os.path.join('src', 'main', 'java', *package.split('.'))
+        classes.append((package, class_name, os.path.join(rel_dir, class_name + '.java')))
+        versions[n] = {}
+
+    def write_class(n):
+        package, class_name, rel_path = classes[n]
+        full_path = os.path.join(repo_path, rel_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write(class_source(random.Random(seed * 1000 + n), package, class_name, method_count, body_lines, versions[n]))
+
+    for n, (package, class_name, _) in enumerate(classes):
+        write_class(n)
+        if rng.random() < test_ratio:
+            test_dir = os.path.join(repo_path, 'src', 'test', 'java', *package.split('.'))
+            os.makedirs(test_dir, exist_ok=True)
+            with open(os.path.join(test_dir, class_name + 'Test.java'), 'w', encoding='utf-8') as f:
+                f.write(test_source(package, class_name, method_count))
+    git(repo_path, 'add', '-A')
+    git(repo_path, 'commit', '-q', '-m', 'initial import')
+
+    commits = []
+    for c in range(commit_count):
+        for n in rng.sample(range(file_count), min(files_per_commit, file_count)):
+            for m in rng.sample(range(method_count), min(methods_per_commit, method_count)):
+                versions[n][m] = versions[n].get(m, 0) + 1
+            write_class(n)
+        git(repo_path, 'add', '-A')
+        git(repo_path, 'commit', '-q', '-m', f'fix issue {c}')
+        commits.append(git(repo_path, 'rev-parse', 'HEAD').strip())
+    return commits
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='生成合成 Java 仓库')
+    parser.add_argument('repo_path', type=str, help='输出仓库目录')
+    parser.add_argument('--files', type=int, default=20, help='焦点类文件数')
+    parser.add_argument('--methods', type=int, default=10, help='每个类的方法数')
+    parser.add_argument('--body_lines', type=int, default=8, help='每个方法主体的行数')
+    parser.add_argument('--test_ratio', type=float, default=0.5, help='有测试类的焦点类比例')
+    parser.add_argument('--commits', type=int, default=10, help='修改提交数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    commits = generate_repo(args.repo_path, file_count=args.files, method_count=args.methods,
+                            body_lines=args.body_lines, test_ratio=args.test_ratio,
+                            commit_count=args.commits, seed=args.seed)
+    print(f"Generated {len(commits)} commits in {args.repo_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+func_dataset 的读写测试：python -m pytest test_func_dataset.py
+"""
+
+import os
+import tempfile
+import unittest
+
+from func_dataset import FuncDataset, FuncDatasetWriter
+
+
+class FuncDatasetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'dataset.shards')
+        with FuncDatasetWriter(self.path, shard_bytes=256) as writer:
+            for idx in range(1, 21):
+                writer.write({'idx': idx, 'func': f'void f{idx}() {{}}', 'target': idx % 2, 'flaw_line_index': []},
+                             'repo', 'abc', f'F{idx}.java')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_positions_filter_by_target(self):
+        with FuncDataset(self.path) as dataset:
+            positives = list(dataset.positions(target=1))
+            self.assertEqual([dataset.meta(pos)['idx'] for pos in positives], list(range(1, 21, 2)))
+            self.assertEqual(len(list(dataset.positions())), 20)
+
+    def test_close_after_breaking_out_of_positions(self):
+        dataset = FuncDataset(self.path)
+        taken = []
+        for pos in dataset.positions(target=1):
+            taken.append(dataset.record(pos)['idx'])
+            if len(taken) == 3:
+                break
+        dataset.close()  # 未遍历完的 positions 不能阻止关闭 mmap
+        self.assertEqual(taken, [1, 3, 5])
+
+    def test_leave_with_block_during_positions(self):
+        # 退出 with 时 close()，此时 positions 生成器还没有结束
+        with FuncDataset(self.path) as dataset:
+            positions = dataset.positions()
+            self.assertEqual(next(positions), 0)
+        positions.close()
+
+    def test_get_by_idx(self):
+        with FuncDataset(self.path) as dataset:
+            self.assertEqual(dataset.get(7)['func'], 'void f7() {}')
+            self.assertIsNone(dataset.find(99))
+
+
+if __name__ == '__main__':
+    unittest.main()
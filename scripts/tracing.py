@@ -0,0 +1,165 @@
+"""
+轻量的分阶段追踪。
+
+在 git 子进程、blob 读取、解析、方法映射、写输出等位置包一层 span：
+    with tracing.span('git diff', 'git', repo=repo, commit=commit_hash) as sp:
+        ...
+        sp['bytes'] = len(output)
+未启用时 span() 直接返回一个空操作对象，几乎没有开销。
+
+启用方式：设置环境变量 VDETECT_TRACE=trace.json（进程退出时导出 Chrome trace 并打印阶段汇总），
+或在代码中调用 tracing.enable()，之后用 export_chrome() / summary() 导出。
+Chrome trace 文件可在 chrome://tracing 或 https://ui.perfetto.dev 中打开。
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from collections import defaultdict
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+_origin = time.perf_counter()
+
+
+class _NoopSpan():
+    """未启用追踪时使用的空 span"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span():
+
+    __slots__ = ('name', 'stage', 'args', 'start')
+
+    def __init__(self, name, stage, args):
+        self.name = name
+        self.stage = stage
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        event = {
+            'name': self.name,
+            'cat': self.stage,
+            'ph': 'X',
+            'ts': (self.start - _origin) * 1e6,
+            'dur': (end - self.start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.args,
+        }
+        with _lock:
+            _events.append(event)
+        return False
+
+    def __setitem__(self, key, value):
+        self.args[key] = value
+
+    def update(self, *args, **kwargs):
+        self.args.update(*args, **kwargs)
+
+
+def span(name, stage, **attrs):
+    """
+    创建一个 span。
+
+    :param name: span 名称，如 'git show'
+    :param stage: 所属阶段，用于汇总，如 'git'/'blob'/'parse'/'map'/'write'/'scan'
+    :param attrs: 附加属性，如 repo/commit/file/bytes
+    """
+    if not _enabled:
+        return _NOOP
+    return _Span(name, stage, attrs)
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _events.clear()
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def export_chrome(path):
+    """导出 Chrome trace JSON"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events(), 'displayTimeUnit': 'ms'}, f, default=str)
+    return path
+
+
+def summary():
+    """
+    按阶段汇总：次数、总耗时、最大耗时、字节数。
+
+    :return: 列表，每项为 dict，按总耗时降序
+    """
+    stats = defaultdict(lambda: {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'bytes': 0})
+    for event in events():
+        s = stats[(event['cat'], event['name'])]
+        dur = event['dur'] / 1000
+        s['count'] += 1
+        s['total_ms'] += dur
+        s['max_ms'] = max(s['max_ms'], dur)
+        s['bytes'] += event['args'].get('bytes', 0) or 0
+    rows = [dict(stage=stage, name=name, **s) for (stage, name), s in stats.items()]
+    return sorted(rows, key=lambda r: r['total_ms'], reverse=True)
+
+
+def format_summary(rows=None):
+    rows = summary() if rows is None else rows
+    lines = [f"{'stage':<10}{'span':<32}{'count':>8}{'total(ms)':>12}{'max(ms)':>10}{'bytes':>14}"]
+    for r in rows:
+        lines.append(f"{r['stage']:<10}{r['name']:<32}{r['count']:>8}{r['total_ms']:>12.2f}{r['max_ms']:>10.2f}{r['bytes']:>14}")
+    return '\n'.join(lines)
+
+
+def _export_at_exit(path):
+    if not _events:
+        return
+    export_chrome(path)
+    print(format_summary())
+    print(f"Trace has been written to {path}")
+
+
+if os.environ.get('VDETECT_TRACE'):
+    enable()
+    atexit.register(_export_at_exit, os.environ['VDETECT_TRACE'])
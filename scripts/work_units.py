@@ -0,0 +1,51 @@
+"""
+把输入 csv 的行合并为唯一的 (仓库, commit) 工作单元。
+
+veracode_fliter.csv 中同一个修复 commit 经常出现在多个 CVE 或版本范围的行里。
+各脚本按工作单元只计算一次 diff、分支、testcase 和函数提取，再把结果写回该单元的每一行。
+"""
+
+import re
+from collections import OrderedDict
+
+COMMIT_URL = re.compile(r'/([^/]+/[^/]+)/commit/([0-9a-fA-F]+)')
+
+
+def parse_commit_url(url):
+    """
+    :return: (user/repo, repo, commit_hash)；url 不是 commit 链接时返回 None
+    """
+    match = COMMIT_URL.search(url or '')
+    if not match:
+        return None
+    repository_name = match.group(1)
+    return repository_name, repository_name.split('/')[-1], match.group(2)
+
+
+def unit_key(url):
+    """工作单元的键：(小写的 user/repo, 小写的 commit_hash)；url 不是 commit 链接时返回 None"""
+    parsed = parse_commit_url(url)
+    if parsed is None:
+        return None
+    return parsed[0].lower(), parsed[2].lower()
+
+
+def group_rows(urls, start=1):
+    """
+    按工作单元分组，保持首次出现的顺序。
+
+    :param urls: 每行的 url
+    :param start: 第一行的行号
+    :return: OrderedDict {键: [(行号, url), ...]}；不是 commit 链接的行各自成组，键为 None 与行号
+    """
+    units = OrderedDict()
+    for index, url in enumerate(urls, start=start):
+        key = unit_key(url) or (None, index)
+        units.setdefault(key, []).append((index, url))
+    return units
+
+
+def report(units):
+    rows = sum(len(rows) for rows in units.values())
+    duplicated = sum(1 for rows in units.values() if len(rows) > 1)
+    return f"{rows} rows -> {len(units)} unique commits ({duplicated} shared by several rows)"